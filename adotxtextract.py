@@ -1,80 +1,152 @@
 import sys
 import os
 import logging
+import argparse
+from concurrent.futures import as_completed
 import cv2
 import speech_recognition as sr
-import pandas as pd
 from moviepy.editor import VideoFileClip
 
+from transcribe import (RecognitionExecutor, RetryQueue, default_backend, first_alternative,
+                        log_recognizer_metrics, max_single_request_seconds, transcribe_chunked,
+                        transcribe_whole, wav_duration)
+from transcription_cache import log_cache_stats
+from dataset_manifest import get_manifest
+from file_state import FileStateIndex, report_plan, watch
+from profiling import report, stage
+
 # Set up logging
 logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
 
 # Function to extract audio from video and get video duration
 def extract_audio_from_video(video_path, audio_path):
-    try:
-        video = VideoFileClip(video_path)
-        video_duration = video.duration  # Get video duration
-        audio = video.audio
-        audio.write_audiofile(audio_path)
-        audio_duration = audio.duration  # Get audio duration
-        video.close()
-        logging.info(f"Extracted audio from {video_path} to {audio_path}")
-        return video_duration, audio_duration
-    except Exception as e:
-        logging.error(f"Error extracting audio from {video_path}: {e}")
-        return None, None
+    with stage('extract_audio', items=1, video=video_path) as record:
+        try:
+            video = VideoFileClip(video_path)
+            video_duration = video.duration  # Get video duration
+            audio = video.audio
+            audio.write_audiofile(audio_path)
+            audio_duration = audio.duration  # Get audio duration
+            video.close()
+            logging.info(f"Extracted audio from {video_path} to {audio_path}")
+            return video_duration, audio_duration
+        except Exception as e:
+            logging.error(f"Error extracting audio from {video_path}: {e}")
+            record.ok = False
+            return None, None
 
-# Function to extract text from audio and only take the first recognized alternative
-def extract_text_from_audio(audio_path):
-    recognizer = sr.Recognizer()
-    try:
-        with sr.AudioFile(audio_path) as source:
-            audio_data = recognizer.record(source)
+# Function to extract text from audio and only take the first recognized alternative.
+# Long recordings are recognized in overlapping chunks and stitched together.
+# Returns None when recognition still failed after retries.
+def extract_text_from_audio(audio_path, backend=None):
+    with stage('recognize', items=1, audio=audio_path) as record:
+        try:
+            if wav_duration(audio_path) > max_single_request_seconds:
+                segments = transcribe_chunked(audio_path, backend)
+                text = ' '.join(segment['text'] for segment in segments if segment['text'])
+                record.items = len(segments)
+            else:
+                # Extracting text using Google speech recognition for Tamil language
+                transcript = transcribe_whole(audio_path, backend)
+                # Take only the first alternative
+                text = first_alternative(transcript)
 
-        # Extracting text using Google speech recognition for Tamil language
-        transcript = recognizer.recognize_google(audio_data, language='ta-IN', show_all=True)
+            logging.info(f"Extracted text from {audio_path}")
+            return text
+        except sr.UnknownValueError:
+            logging.warning(f"Could not understand audio in {audio_path}")
+            return ""
+        except sr.RequestError as e:
+            logging.error(f"Error with the speech recognition request for {audio_path}: {e}")
+            record.ok = False
+            return None
 
-        # Check if 'alternative' is in the transcript and take only the first alternative
-        if 'alternative' in transcript and len(transcript['alternative']) > 0:
-            text = transcript['alternative'][0].get('transcript', '').strip()  # Get the first alternative
-        else:
-            text = ""
-
-        logging.info(f"Extracted text from {audio_path}")
-        return text
-    except sr.UnknownValueError:
-        logging.warning(f"Could not understand audio in {audio_path}")
-        return ""
-    except sr.RequestError as e:
-        logging.error(f"Error with the speech recognition request for {audio_path}: {e}")
-        return ""
-
-# Process video and save results in CSV
-def process_video(video_path, audio_path, text_folder, csv_path):
-    video_duration, audio_duration = extract_audio_from_video(video_path, audio_path)
-    text = extract_text_from_audio(audio_path)
-    
+# Save the extracted text and its dataset row for one video
+def save_results(video_path, audio_path, text_folder, csv_path, text, video_duration, audio_duration):
     # Save extracted text in a file inside text_extracted folder
     text_file = os.path.join(text_folder, f"{os.path.splitext(os.path.basename(video_path))[0]}.txt")
     with open(text_file, "w", encoding="utf-8") as f:
         f.write(text)
     logging.info(f"Text saved to {text_file}")
     
-    # Store data in a CSV file, including the extracted text, video, and audio durations
-    data = {
-        "video_path": [video_path],
-        "audio_path": [audio_path],
-        "text_path": [text_file],
-        "extracted_text": [text],
-        "video_duration": [video_duration],
-        "audio_duration": [audio_duration]
-    }
-    
-    df = pd.DataFrame(data)
-    if os.path.exists(csv_path):
-        df.to_csv(csv_path, mode='a', header=False, index=False)
-    else:
-        df.to_csv(csv_path, index=False)
+    # Store data in the dataset, including the extracted text, video, and audio durations
+    get_manifest(csv_path).add({
+        "clip_id": os.path.splitext(os.path.basename(video_path))[0],
+        "video_path": video_path,
+        "audio_path": audio_path,
+        "text_path": text_file,
+        "extracted_text": text,
+        "video_duration": video_duration,
+        "audio_duration": audio_duration
+    })
+
+# Process video and save results in CSV. Videos whose recognition failed go
+# to the retry queue instead of getting an empty transcript.
+def process_video(video_path, audio_path, text_folder, csv_path, retry_queue=None):
+    retry_queue = retry_queue or RetryQueue()
+    video_duration, audio_duration = extract_audio_from_video(video_path, audio_path)
+    text = extract_text_from_audio(audio_path)
+    if text is None:
+        retry_queue.add(audio_path, "recognition request failed")
+        return
+    save_results(video_path, audio_path, text_folder, csv_path, text, video_duration, audio_duration)
+    retry_queue.discard(audio_path)
+
+# Stage name and parameters recorded in the file-state index; a change in
+# recognizer settings makes every video due again
+STAGE = 'adotxtextract'
+
+def stage_params():
+    return {"recognizer": default_backend().settings(), "max_single_request_seconds": max_single_request_seconds}
+
+# Process the videos in the folder that are new or changed since they were
+# last processed. Audio is extracted here while earlier clips are being
+# recognized by the executor's worker threads. With dry_run, only report
+# what would be processed.
+def run(video_folder, audio_folder, text_folder, csv_path, state=None, dry_run=False, settle_seconds=None):
+    state = state or FileStateIndex()
+    params = stage_params()
+    video_files = sorted(f for f in os.listdir(video_folder) if f.endswith('.mp4'))
+    items = [(f, [os.path.join(video_folder, f)]) for f in video_files]
+    pending = state.plan(STAGE, items, params, settle_seconds)
+    if dry_run:
+        report_plan(STAGE, pending, len(items))
+        return 0
+    if not pending:
+        return 0
+
+    retry_queue = RetryQueue()
+    futures = {}
+    with RecognitionExecutor() as executor:
+        for video_file, reason in pending:
+            logging.info(f"Processing {video_file} ({reason})")
+            video_path = os.path.join(video_folder, video_file)
+            audio_path = os.path.join(audio_folder, f"{os.path.splitext(video_file)[0]}.wav")
+            video_duration, audio_duration = extract_audio_from_video(video_path, audio_path)
+            if video_duration is None:
+                continue
+            future = executor.submit(extract_text_from_audio, audio_path)
+            futures[future] = (video_file, video_path, audio_path, video_duration, audio_duration)
+
+        for future in as_completed(futures):
+            video_file, video_path, audio_path, video_duration, audio_duration = futures[future]
+            try:
+                text = future.result()
+            except Exception as e:
+                # One broken clip must not keep the others from being saved
+                logging.error(f"Error recognizing {audio_path}: {e}")
+                text = None
+            if text is None:
+                retry_queue.add(audio_path, "recognition request failed")
+                continue
+            save_results(video_path, audio_path, text_folder, csv_path, text, video_duration, audio_duration)
+            text_file = os.path.join(text_folder, f"{os.path.splitext(video_file)[0]}.txt")
+            state.record(STAGE, video_file, [video_path], params, [audio_path, text_file])
+            retry_queue.discard(audio_path)
+
+    get_manifest(csv_path).close()
+    state.save()
+    return len(futures)
 
 # Main function to process all videos in the folder
 def main():
@@ -83,19 +155,29 @@ def main():
     text_folder = '/media/dhivyadharshini/DATA/project/text_extracted'
     csv_path = '/media/dhivyadharshini/DATA/project/dataset.csv'
 
+    parser = argparse.ArgumentParser(description="Extract audio and transcripts from new or changed clips")
+    parser.add_argument("--dry-run", action="store_true", help="only report which clips would be processed")
+    parser.add_argument("--watch", action="store_true", help="keep running and pick up newly added clips")
+    parser.add_argument("--interval", type=float, default=10.0, help="seconds between scans in --watch mode")
+    args = parser.parse_args()
+
     # Ensure the output folders exist
     os.makedirs(audio_folder, exist_ok=True)
     os.makedirs(text_folder, exist_ok=True)
 
+    state = FileStateIndex()
     try:
-        for video_file in os.listdir(video_folder):
-            if video_file.endswith('.mp4'):
-                video_path = os.path.join(video_folder, video_file)
-                audio_path = os.path.join(audio_folder, f"{os.path.splitext(video_file)[0]}.wav")
-                process_video(video_path, audio_path, text_folder, csv_path)
-
-        logging.info(f"Data successfully processed and saved to {csv_path}")
-        
+        if args.watch:
+            watch(lambda: run(video_folder, audio_folder, text_folder, csv_path, state, args.dry_run,
+                              settle_seconds=args.interval), args.interval)
+        else:
+            run(video_folder, audio_folder, text_folder, csv_path, state, args.dry_run)
+        if not args.dry_run:
+            logging.info(f"Data successfully processed and saved to {csv_path}")
+            log_cache_stats(default_backend().cache)
+            log_recognizer_metrics()
+            report()
+
     except Exception as e:
         logging.error(f"An error occurred: {e}")
 
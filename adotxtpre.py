@@ -1,47 +1,144 @@
 import os
 import logging
-import pandas as pd
+import argparse
+import threading
 import re
+from concurrent.futures import ProcessPoolExecutor
 from indicnlp.tokenize import indic_tokenize
 from pydub import AudioSegment
 from pydub.silence import split_on_silence
-from Levenshtein import distance
-import pdfplumber
-import json
+from lexicon_index import LexiconIndex, load_or_build_index
+from audio_preprocess import preprocess_wav
+from dataset_manifest import get_manifest
+from file_state import FileStateIndex, report_plan, watch
+from profiling import report, stage, tally
 
 logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
 
 pdf_file = "/home/dhivyadharshini/Downloads/nn/Lexicon_text.pdf"
-tamil_lexicon = {}
-with pdfplumber.open(pdf_file) as pdf:
-    for page in pdf.pages:
-        text = page.extract_text()
-        lines = text.split('\n')
-        for line in lines:
-            if ":" in line:
-                word, meaning = line.split(":", 1)
-                tamil_lexicon[word.strip()] = meaning.strip()
-
 json_file = "lexicon.json"
 
+# Maximum edit distance for spelling suggestions; None keeps the nearest word
+# whatever its distance, as the original full scan did
+max_edit_distance = None
+
+# Batches with at least this many distinct misspelled tokens are corrected
+# over a process pool when workers are requested; smaller ones are not worth
+# starting the pool for
+parallel_min_tokens = 2000
+
+# Everything except Tamil characters and whitespace
+non_tamil_pattern = re.compile(r'[^ஂ-௺\s]')
+
+# Both are filled on first use by get_lexicon_index()
+tamil_lexicon = None
+lexicon_index = None
+_lexicon_lock = threading.Lock()
+
+# Function to parse the lexicon PDF into an ordered word -> meaning mapping
+def parse_lexicon_pdf(path):
+    import pdfplumber  # only needed when the compiled cache is stale
+
+    lexicon = {}
+    with pdfplumber.open(path) as pdf:
+        for page in pdf.pages:
+            text = page.extract_text()
+            lines = text.split('\n')
+            for line in lines:
+                if ":" in line:
+                    word, meaning = line.split(":", 1)
+                    lexicon[word.strip()] = meaning.strip()
+    return lexicon
+
+# Function to load the lexicon index lazily from the compiled cache in
+# json_file, re-parsing the PDF only when it has changed
+def get_lexicon_index():
+    global tamil_lexicon, lexicon_index
+    if lexicon_index is None:
+        with _lexicon_lock:
+            if lexicon_index is None:
+                with stage('load_lexicon'):
+                    index = load_or_build_index(pdf_file, json_file, parse_lexicon_pdf, max_edit_distance)
+                tamil_lexicon = index.lexicon
+                lexicon_index = index
+    return lexicon_index
+
 def correct_spelling(word):
-    suggestions = [(w, distance(word, w)) for w in tamil_lexicon]
-    suggestions = sorted(suggestions, key=lambda x: x[1])
-    return suggestions[0][0] if suggestions else word
+    return get_lexicon_index().correct(word)
 
-def preprocess_tamil_text(text):
+# Function to log how often the spelling memo answered a misspelled word
+def log_lexicon_stats():
+    if lexicon_index is None:
+        return
+    total = lexicon_index.hits + lexicon_index.misses
+    rate = lexicon_index.hits / total if total else 0.0
+    logging.info(f"Spelling memo: {lexicon_index.hits} hits, {lexicon_index.misses} misses ({rate:.0%} hit rate), "
+                 f"{len(lexicon_index.cache)} entries")
+
+# Pool initializer: install the parent's lexicon, so workers never load it
+# themselves, whatever the start method
+def _init_spelling_worker(lexicon, max_distance, source_sha256):
+    global tamil_lexicon, lexicon_index
+    lexicon_index = LexiconIndex(lexicon, max_distance, source_sha256=source_sha256)
+    tamil_lexicon = lexicon
+
+# Function to start a process pool for spelling correction, whose workers
+# use this process's lexicon
+def spelling_pool(workers):
+    index = get_lexicon_index()
+    return ProcessPoolExecutor(max_workers=workers, initializer=_init_spelling_worker,
+                               initargs=(index.lexicon, index.max_distance, index.source_sha256))
+
+def tokenize_tamil_text(text):
     text = text.lower()
-    text = re.sub(r'[^ஂ-௺\s]', '', text)
-    tokens = indic_tokenize.trivial_tokenize(text, 'ta')    
-    corrected_tokens = [correct_spelling(token) for token in tokens]
-    preprocessed_text = ' '.join(corrected_tokens)
-    return preprocessed_text
+    text = non_tamil_pattern.sub('', text)
+    return indic_tokenize.trivial_tokenize(text, 'ta')
+
+def preprocess_tamil_text(text):
+    return preprocess_tamil_texts([text])[0]
+
+# Function to normalize many transcripts at once. Tokens are deduplicated
+# across the batch, so each distinct token is looked up only once; words in
+# the lexicon are kept as they are and the rest go through the index's memo.
+# A large batch of misspellings that are not in the memo is corrected over
+# pool (from spelling_pool), or over a pool started for this call with
+# workers > 1, and the answers are added to this process's memo.
+def preprocess_tamil_texts(texts, workers=None, pool=None):
+    token_lists = [tokenize_tamil_text(text) for text in texts]
+    unique_tokens = list(dict.fromkeys(token for tokens in token_lists for token in tokens))
+    index = get_lexicon_index()
+    total = sum(len(tokens) for tokens in token_lists)
+    with tally('correct_spelling', items=total, texts=len(texts), unique_tokens=len(unique_tokens)):
+        corrections = {token: token for token in unique_tokens if token in index.lexicon}
+        misspelled = [token for token in unique_tokens if token not in corrections]
+        parallel = pool is not None or (workers and workers > 1)
+        if parallel and len(misspelled) >= parallel_min_tokens:
+            for token in misspelled:
+                cached = index.recall(token)
+                if cached is not None:
+                    corrections[token] = cached
+            unknown = [token for token in misspelled if token not in corrections]
+            chunksize = max(len(unknown) // ((workers or os.cpu_count()) * 4), 1)
+            if pool is None:
+                with spelling_pool(workers) as own_pool:
+                    corrected = list(own_pool.map(correct_spelling, unknown, chunksize=chunksize))
+            else:
+                corrected = list(pool.map(correct_spelling, unknown, chunksize=chunksize))
+            for token, correction in zip(unknown, corrected):
+                index.remember(token, correction)
+            corrections.update(zip(unknown, corrected))
+        else:
+            corrections.update((token, index.correct(token)) for token in misspelled)
+    return [' '.join(corrections[token] for token in tokens) for tokens in token_lists]
 
 def sanitize_filename(filename):
     sanitized_filename = re.sub(r'[^\x00-\x7F]', '_', filename)
     return sanitized_filename
 
-def preprocess_audio(audio_path, preprocessed_audio_path):
+# Function to normalize and trim silence with pydub; kept for formats the
+# NumPy path does not read and as the reference for benchmarks. Returns
+# whether the output was written.
+def preprocess_audio_pydub(audio_path, preprocessed_audio_path):
     try:
         audio = AudioSegment.from_file(audio_path)
         normalized_audio = audio.normalize()
@@ -49,56 +146,114 @@ def preprocess_audio(audio_path, preprocessed_audio_path):
         trimmed_audio = sum(segments) if segments else normalized_audio
         trimmed_audio.export(preprocessed_audio_path, format="wav")
         logging.info(f"Preprocessed audio saved to {preprocessed_audio_path}")
+        return True
     except Exception as e:
         logging.error(f"Error preprocessing audio {audio_path}: {e}")
+        return False
+
+# Function to normalize and trim silence from a WAV file. 16/32-bit PCM is
+# processed with NumPy over a memory map and gives the same output as pydub.
+# Returns whether the output was written.
+def preprocess_audio(audio_path, preprocessed_audio_path):
+    with stage('preprocess_audio', items=1, audio=audio_path) as record:
+        try:
+            if not preprocess_wav(audio_path, preprocessed_audio_path):
+                record.ok = preprocess_audio_pydub(audio_path, preprocessed_audio_path)
+                return record.ok
+            logging.info(f"Preprocessed audio saved to {preprocessed_audio_path}")
+            return True
+        except Exception as e:
+            logging.error(f"Error preprocessing audio {audio_path}: {e}")
+            record.ok = False
+            return False
 
 def preprocess_text(text, preprocessed_text_path):
-    preprocessed_text = preprocess_tamil_text(text)
-    if preprocessed_text:  
+    save_preprocessed_text(text, preprocess_tamil_text(text), preprocessed_text_path)
+
+def save_preprocessed_text(text, preprocessed_text, preprocessed_text_path):
+    if preprocessed_text:
         with open(preprocessed_text_path, "w", encoding="utf-8") as f:
             f.write(preprocessed_text)
         logging.info(f"Preprocessed text saved to {preprocessed_text_path}")
     else:
         logging.warning(f"Preprocessed text is empty for input text: {text}")
 
-def process_files(audio_folder, text_folder, output_audio_folder, output_text_folder, csv_path):
+# Stage name and parameters recorded in the file-state index; a change to the
+# lexicon file makes every transcript due for normalization again
+STAGE = 'adotxtpre'
+
+# Number of transcripts normalized together by process_files
+text_batch_size = 500
+
+def stage_params():
+    return {"silence_thresh": -40, "max_edit_distance": max_edit_distance,
+            "lexicon_sha256": get_lexicon_index().source_sha256}
+
+# Function to preprocess the audio/text pairs that are new or changed since
+# they were last processed. With dry_run, only report what would be processed.
+def process_files(audio_folder, text_folder, output_audio_folder, output_text_folder, csv_path, state=None,
+                  dry_run=False, settle_seconds=None, workers=None):
     os.makedirs(output_audio_folder, exist_ok=True)
     os.makedirs(output_text_folder, exist_ok=True)
 
+    state = state or FileStateIndex()
+    params = stage_params()
+    dataset = get_manifest(csv_path)
     try:
-        audio_files = [f for f in os.listdir(audio_folder) if f.endswith('.wav')]
-        text_files = [f for f in os.listdir(text_folder) if f.endswith('.txt')]
+        audio_files = sorted(f for f in os.listdir(audio_folder) if f.endswith('.wav'))
 
+        items = []
         for audio_file in audio_files:
             base_name = os.path.splitext(audio_file)[0]
-            audio_path = os.path.join(audio_folder, audio_file)
             text_path = os.path.join(text_folder, f"{base_name}.txt")
-
             if not os.path.exists(text_path):
                 logging.warning(f"Text file for audio {audio_file} does not exist.")
                 continue
+            items.append((base_name, [os.path.join(audio_folder, audio_file), text_path]))
 
-            preprocessed_audio_path = os.path.join(output_audio_folder, f"p_{base_name}.wav")
-            preprocessed_text_path = os.path.join(output_text_folder, f"p_{base_name}.txt")
-            preprocess_audio(audio_path, preprocessed_audio_path)
-            
-            with open(text_path, "r", encoding="utf-8") as f:
-                text = f.read()
-
-            preprocess_text(text, preprocessed_text_path)
-
-            data = {
-                "audio_path": [preprocessed_audio_path],
-                "text_path": [preprocessed_text_path],
-                "preprocessed_text": [text]
-            }
-            
-            df = pd.DataFrame(data)
-            if os.path.exists(csv_path):
-                df.to_csv(csv_path, mode='a', header=False, index=False)
-            else:
-                df.to_csv(csv_path, index=False)
+        pending = state.plan(STAGE, items, params, settle_seconds)
+        if dry_run:
+            report_plan(STAGE, pending, len(items))
+            return
+
+        inputs = dict(items)
+        # One spelling pool serves every batch of the run
+        pool = spelling_pool(workers) if workers and workers > 1 and pending else None
+        try:
+            for batch_start in range(0, len(pending), text_batch_size):
+                batch = pending[batch_start:batch_start + text_batch_size]
+                texts = []
+                for base_name, _ in batch:
+                    with open(inputs[base_name][1], "r", encoding="utf-8") as f:
+                        texts.append(f.read())
+                preprocessed_texts = preprocess_tamil_texts(texts, workers, pool)
+
+                for (base_name, reason), text, preprocessed_text in zip(batch, texts, preprocessed_texts):
+                    logging.info(f"Processing {base_name} ({reason})")
+                    audio_path, text_path = inputs[base_name]
+
+                    preprocessed_audio_path = os.path.join(output_audio_folder, f"p_{base_name}.wav")
+                    preprocessed_text_path = os.path.join(output_text_folder, f"p_{base_name}.txt")
+                    if not preprocess_audio(audio_path, preprocessed_audio_path):
+                        # Not recorded as done, so the next run tries it again
+                        continue
+                    save_preprocessed_text(text, preprocessed_text, preprocessed_text_path)
 
+                    dataset.add({
+                        "clip_id": base_name,
+                        "audio_path": preprocessed_audio_path,
+                        "text_path": preprocessed_text_path,
+                        "preprocessed_text": text
+                    })
+                    state.record(STAGE, base_name, [audio_path, text_path], params,
+                                 [preprocessed_audio_path, preprocessed_text_path])
+        finally:
+            if pool is not None:
+                pool.shutdown()
+
+        dataset.close()
+        state.save()
+        log_lexicon_stats()
         logging.info(f"Data successfully processed and saved to {csv_path}")
         
     except Exception as e:
@@ -111,7 +266,22 @@ def main():
     output_text_folder = '/media/dhivyadharshini/DATA/project/prevideo'
     csv_path = '/media/dhivyadharshini/DATA/project/datset.csv'
 
-    process_files(audio_folder, text_folder, output_audio_folder, output_text_folder, csv_path)
+    parser = argparse.ArgumentParser(description="Preprocess new or changed audio and transcripts")
+    parser.add_argument("--dry-run", action="store_true", help="only report which files would be processed")
+    parser.add_argument("--watch", action="store_true", help="keep running and pick up newly added files")
+    parser.add_argument("--interval", type=float, default=10.0, help="seconds between scans in --watch mode")
+    parser.add_argument("--workers", type=int, help="processes for spelling correction of large batches")
+    args = parser.parse_args()
+
+    state = FileStateIndex()
+    if args.watch:
+        watch(lambda: process_files(audio_folder, text_folder, output_audio_folder, output_text_folder, csv_path,
+                                    state, args.dry_run, settle_seconds=args.interval, workers=args.workers),
+              args.interval)
+    else:
+        process_files(audio_folder, text_folder, output_audio_folder, output_text_folder, csv_path, state,
+                      args.dry_run, workers=args.workers)
+    report()
 
 if __name__ == "__main__":
     main()
@@ -0,0 +1,189 @@
+import numpy as np
+
+# Emotions offered by the annotation form, in the order used for tie-breaks
+EMOTIONS = ['Anger', 'Disgust', 'Fear', 'Happiness', 'Sadness', 'Surprise']
+
+
+# Function to read an emotion_rating, or None if it is missing, unreadable
+# or not positive. As a vote weight, such votes count 1, like a plain vote.
+def parse_rating(value):
+    try:
+        rating = float(value)
+    except (TypeError, ValueError):
+        return None
+    return rating if rating > 0 else None
+
+
+# Per-clip label counts kept as a clips x emotions count matrix (and matching
+# matrices of summed vote weights, and of the sum and number of real
+# ratings), updated in place as votes arrive. Each vote also
+# updates running totals over the clips with at least two votes, so the
+# agreement coefficients are read off in O(emotions) without rescanning the
+# matrix. Emotions not in EMOTIONS get a new column the first time they are seen.
+class AgreementStats:
+    def __init__(self, categories=EMOTIONS, capacity=1024):
+        self.categories = list(categories)
+        self.category_index = {category: i for i, category in enumerate(self.categories)}
+        self.clips = []
+        self.clip_index = {}
+        self.counts = np.zeros((capacity, len(self.categories)), dtype=np.int64)
+        self.rating_sums = np.zeros((capacity, len(self.categories)), dtype=np.float64)
+        # Only votes that carried a rating, for the mean rating
+        self.rated_sums = np.zeros((capacity, len(self.categories)), dtype=np.float64)
+        self.rated_counts = np.zeros((capacity, len(self.categories)), dtype=np.int64)
+        self.label_totals = np.zeros(len(self.categories), dtype=np.int64)
+        # Running totals over pairable clips (two or more votes)
+        self.pairable = 0
+        self.pairable_totals = np.zeros(len(self.categories), dtype=np.int64)
+        self.agreement_sum = 0.0
+        self.coincidence_sum = 0.0
+
+    def _row(self, media_name):
+        row = self.clip_index.get(media_name)
+        if row is None:
+            row = len(self.clips)
+            if row == len(self.counts):
+                # Double the capacity so growing to N clips copies O(N) rows in total
+                self.counts = np.vstack([self.counts, np.zeros_like(self.counts)])
+                self.rating_sums = np.vstack([self.rating_sums, np.zeros_like(self.rating_sums)])
+                self.rated_sums = np.vstack([self.rated_sums, np.zeros_like(self.rated_sums)])
+                self.rated_counts = np.vstack([self.rated_counts, np.zeros_like(self.rated_counts)])
+            self.clips.append(media_name)
+            self.clip_index[media_name] = row
+        return row
+
+    def _column(self, emotion):
+        column = self.category_index.get(emotion)
+        if column is None:
+            column = len(self.categories)
+            self.categories.append(emotion)
+            self.category_index[emotion] = column
+            self.counts = np.hstack([self.counts, np.zeros((len(self.counts), 1), dtype=np.int64)])
+            self.rating_sums = np.hstack([self.rating_sums, np.zeros((len(self.rating_sums), 1))])
+            self.rated_sums = np.hstack([self.rated_sums, np.zeros((len(self.rated_sums), 1))])
+            self.rated_counts = np.hstack([self.rated_counts, np.zeros((len(self.rated_counts), 1), dtype=np.int64)])
+            self.label_totals = np.append(self.label_totals, 0)
+            self.pairable_totals = np.append(self.pairable_totals, 0)
+        return column
+
+    # Function to add (sign=1) or remove (sign=-1) the given clips' share of
+    # the running totals
+    def _update_totals(self, rows, sign):
+        counts = self.counts[rows]
+        votes = counts.sum(axis=1)
+        counts, votes = counts[votes >= 2], votes[votes >= 2]
+        if not len(counts):
+            return
+        matches = (counts * (counts - 1)).sum(axis=1)
+        self.pairable += sign * len(counts)
+        self.pairable_totals += sign * counts.sum(axis=0)
+        self.agreement_sum += sign * float((matches / (votes * (votes - 1))).sum())
+        self.coincidence_sum += sign * float((matches / (votes - 1)).sum())
+
+    # Function to count one vote
+    def add(self, media_name, selected_emotion, emotion_rating=None):
+        self.add_many([(media_name, selected_emotion, emotion_rating)])
+
+    # Function to count a batch of (media_name, selected_emotion,
+    # emotion_rating) votes with one vectorized update
+    def add_many(self, votes):
+        rows = np.array([self._row(media_name) for media_name, _, _ in votes], dtype=np.int64)
+        columns = np.array([self._column(emotion) for _, emotion, _ in votes], dtype=np.int64)
+        ratings = [parse_rating(rating) for _, _, rating in votes]
+        weights = np.array([1.0 if rating is None else rating for rating in ratings], dtype=np.float64)
+        rated = np.array([rating is not None for rating in ratings], dtype=bool)
+        touched = np.unique(rows)
+        self._update_totals(touched, -1)
+        np.add.at(self.counts, (rows, columns), 1)
+        np.add.at(self.rating_sums, (rows, columns), weights)
+        np.add.at(self.rated_sums, (rows[rated], columns[rated]), weights[rated])
+        np.add.at(self.rated_counts, (rows[rated], columns[rated]), 1)
+        np.add.at(self.label_totals, columns, 1)
+        self._update_totals(touched, 1)
+
+    # Function to describe one clip as a JSON-ready dict, or None if it has
+    # no votes
+    def clip(self, media_name):
+        row = self.clip_index.get(media_name)
+        if row is None:
+            return None
+        counts = self.counts[row]
+        weights = self.rating_sums[row]
+        rated_sums = self.rated_sums[row]
+        rated_counts = self.rated_counts[row]
+        votes = int(counts.sum())
+        # Consensus: highest summed rating; ties go to the emotion with more
+        # votes, then to the one listed first in EMOTIONS
+        consensus = int(np.where(weights == weights.max(), counts, -1).argmax())
+        agreement = None
+        if votes >= 2:
+            agreement = float((counts * (counts - 1)).sum() / (votes * (votes - 1)))
+        return {
+            "media": media_name,
+            "votes": votes,
+            "distribution": dict(zip(self.categories, counts.tolist())),
+            "proportions": dict(zip(self.categories, (counts / votes).tolist())),
+            # Votes without a rating are left out; None when an emotion has no
+            # rated votes
+            "mean_rating": {category: (total / count if count else None)
+                            for category, count, total in zip(self.categories, rated_counts.tolist(),
+                                                              rated_sums.tolist())},
+            "consensus": self.categories[consensus],
+            "consensus_share": float(weights[consensus] / weights.sum()),
+            "pair_agreement": agreement,
+        }
+
+    # Function to describe a slice of clips in first-vote order
+    def clips_page(self, start=0, stop=None):
+        return [self.clip(media_name) for media_name in self.clips[start:stop]]
+
+    # Function to report corpus-wide agreement
+    def agreement(self):
+        return {
+            "clips": len(self.clips),
+            "clips_with_multiple_votes": self.pairable,
+            "votes": int(self.label_totals.sum()),
+            "label_totals": dict(zip(self.categories, self.label_totals.tolist())),
+            "fleiss_kappa": _fleiss_from_totals(self.agreement_sum, self.pairable, self.pairable_totals),
+            "krippendorff_alpha": _alpha_from_totals(self.coincidence_sum, self.pairable_totals),
+        }
+
+
+# Function to finish Fleiss' kappa from the summed per-item agreement, the
+# number of items and the per-category vote totals. Returns None when undefined.
+def _fleiss_from_totals(agreement_sum, items, category_totals):
+    if not items:
+        return None
+    p_categories = category_totals / category_totals.sum()
+    p_expected = float((p_categories ** 2).sum())
+    if p_expected == 1.0:
+        return None
+    return float((agreement_sum / items - p_expected) / (1 - p_expected))
+
+# Function to finish nominal Krippendorff's alpha from the coincidence matrix
+# diagonal sum and the per-category value totals. Returns None when undefined.
+def _alpha_from_totals(coincidence_sum, category_totals):
+    n = int(category_totals.sum())
+    expected = n * n - int((category_totals ** 2).sum())
+    if expected == 0:
+        return None
+    return float(1 - (n - 1) * (n - coincidence_sum) / expected)
+
+# Function to compute Fleiss' kappa from an items x categories count matrix.
+# Items may have different numbers of votes: each item's agreement is
+# normalized by its own number of rater pairs. Items with fewer than two
+# votes are ignored.
+def fleiss_kappa(counts):
+    votes = counts.sum(axis=1)
+    counts, votes = counts[votes >= 2], votes[votes >= 2]
+    agreement_sum = ((counts * (counts - 1)).sum(axis=1) / (votes * (votes - 1))).sum()
+    return _fleiss_from_totals(agreement_sum, len(counts), counts.sum(axis=0))
+
+# Function to compute Krippendorff's alpha for nominal labels from an
+# items x categories count matrix. Items with fewer than two votes are not
+# pairable and are ignored.
+def krippendorff_alpha_nominal(counts):
+    votes = counts.sum(axis=1)
+    counts, votes = counts[votes >= 2], votes[votes >= 2]
+    coincidence_sum = ((counts * (counts - 1)).sum(axis=1) / (votes - 1)).sum()
+    return _alpha_from_totals(coincidence_sum, counts.sum(axis=0))
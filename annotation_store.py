@@ -0,0 +1,244 @@
+import atexit
+import csv
+import logging
+import os
+import sqlite3
+import threading
+
+from annotation_stats import AgreementStats
+
+# Column order of annotations.csv rows
+FIELDS = ['media_name', 'selected_emotion', 'annotator_name', 'emotion_rating', 'comments']
+
+
+# Append-only CSV backend, the original annotations.csv format
+class CSVAnnotationBackend:
+    def __init__(self, path='annotations.csv'):
+        self.path = path
+
+    # Function to append a batch of rows in one write
+    def append(self, rows):
+        with open(self.path, 'a', newline='', encoding='utf-8') as file:
+            csv.writer(file).writerows(rows)
+
+    # Function to read every stored row in insertion order. Rows without the
+    # expected five columns are reported and passed through as they are, so
+    # one bad line no longer breaks aggregation.
+    def iter_rows(self):
+        if not os.path.exists(self.path):
+            return
+        with open(self.path, 'r', encoding='utf-8') as file:
+            for line_number, row in enumerate(csv.reader(file), 1):
+                if not row:
+                    continue
+                if len(row) != len(FIELDS):
+                    logging.warning(f"Malformed annotation row {line_number} in {self.path}: {row}")
+                yield row
+
+    def export_csv(self, path):
+        with open(path, 'w', newline='', encoding='utf-8') as file:
+            csv.writer(file).writerows(self.iter_rows())
+
+
+# Embedded SQLite backend in WAL mode, so concurrent writers are serialized
+# by the database and readers never see a half-written row
+class SQLiteAnnotationBackend:
+    def __init__(self, path='annotations.db'):
+        self.path = path
+        # One connection shared by all request threads, guarded by a lock
+        self.conn = sqlite3.connect(path, timeout=30, check_same_thread=False)
+        self.conn.execute('PRAGMA synchronous=NORMAL')
+        self.lock = threading.Lock()
+        with self.lock, self.conn as conn:
+            conn.execute('PRAGMA journal_mode=WAL')
+            conn.execute("""
+                CREATE TABLE IF NOT EXISTS annotations (
+                    id INTEGER PRIMARY KEY AUTOINCREMENT,
+                    media_name TEXT NOT NULL,
+                    selected_emotion TEXT NOT NULL,
+                    annotator_name TEXT,
+                    emotion_rating TEXT,
+                    comments TEXT
+                )""")
+            conn.execute('CREATE INDEX IF NOT EXISTS idx_annotations_media ON annotations (media_name)')
+            conn.execute('CREATE INDEX IF NOT EXISTS idx_annotations_annotator ON annotations (annotator_name)')
+
+    # Function to insert a batch of rows in a single transaction
+    def append(self, rows):
+        rows = [(list(row) + [''] * len(FIELDS))[:len(FIELDS)] for row in rows]
+        with self.lock, self.conn as conn:
+            conn.executemany(
+                'INSERT INTO annotations (media_name, selected_emotion, annotator_name, emotion_rating, comments) '
+                'VALUES (?, ?, ?, ?, ?)', rows)
+
+    def iter_rows(self):
+        with self.lock:
+            rows = self.conn.execute(
+                'SELECT media_name, selected_emotion, annotator_name, emotion_rating, comments '
+                'FROM annotations ORDER BY id').fetchall()
+        for row in rows:
+            yield ['' if value is None else value for value in row]
+
+    def is_empty(self):
+        with self.lock:
+            return self.conn.execute('SELECT 1 FROM annotations LIMIT 1').fetchone() is None
+
+    # Function to import an existing annotations.csv in batches
+    def import_csv(self, path, batch_size=1000):
+        batch = []
+        imported = 0
+        for row in CSVAnnotationBackend(path).iter_rows():
+            if len(row) < 2:
+                continue
+            batch.append(row)
+            if len(batch) >= batch_size:
+                self.append(batch)
+                imported += len(batch)
+                batch = []
+        if batch:
+            self.append(batch)
+            imported += len(batch)
+        logging.info(f"Imported {imported} annotations from {path} into {self.path}")
+
+    def export_csv(self, path):
+        with open(path, 'w', newline='', encoding='utf-8') as file:
+            csv.writer(file).writerows(self.iter_rows())
+
+
+# Function to create the annotation backend named by kind ('csv' or 'sqlite').
+# A new SQLite database is seeded from the existing CSV on first use.
+def make_backend(kind='csv', csv_path='annotations.csv', db_path='annotations.db'):
+    if kind == 'csv':
+        return CSVAnnotationBackend(csv_path)
+    if kind == 'sqlite':
+        backend = SQLiteAnnotationBackend(db_path)
+        if backend.is_empty() and os.path.exists(csv_path):
+            backend.import_csv(csv_path)
+        return backend
+    raise ValueError(f"Unknown annotation backend: {kind}")
+
+
+# In-process store for annotations. Each vote is written to the backend and
+# counted in memory, so the majority file no longer has to be rebuilt
+# by re-reading every vote ever cast. The majority file is written on a
+# debounced timer and once more at exit, but only by a process that added
+# votes, so scripts that merely import the app never overwrite it.
+class AnnotationStore:
+    def __init__(self, backend, majority_path='majority_emotions.csv', flush_delay=2.0):
+        self.backend = backend
+        self.majority_path = majority_path
+        self.flush_delay = flush_delay
+        # video -> {emotion: count}, both in first-seen order so that the
+        # majority choice matches max() over the old per-video dict
+        self.counts = {}
+        # video -> number of rows / annotator names, as shown on the index page
+        self.annotation_counts = {}
+        self.annotators = {}
+        # Count matrices behind the analytics API
+        self.stats = AgreementStats()
+        self.lock = threading.Lock()
+        self._timer = None
+        self._dirty = False
+        atexit.register(self.flush)
+
+    # Function to (re)build the counters from the backend. The lock is held
+    # across the rescan and the swap, so a vote added meanwhile is neither
+    # lost nor counted twice.
+    def load(self):
+        with self.lock:
+            counts = {}
+            annotation_counts = {}
+            annotators = {}
+            votes = []
+            for row in self.backend.iter_rows():
+                annotation_counts[row[0]] = annotation_counts.get(row[0], 0) + 1
+                if len(row) > 3:
+                    annotators.setdefault(row[0], []).append(row[2])
+                if len(row) < 2:
+                    continue
+                video_counts = counts.setdefault(row[0], {})
+                video_counts[row[1]] = video_counts.get(row[1], 0) + 1
+                votes.append((row[0], row[1], row[3] if len(row) > 3 else None))
+            stats = AgreementStats()
+            if votes:
+                stats.add_many(votes)
+            self.counts = counts
+            self.annotation_counts = annotation_counts
+            self.annotators = annotators
+            self.stats = stats
+        logging.info(f"Loaded annotation counts for {len(counts)} videos")
+
+    # Function to record one vote: store it and update the counters
+    def add(self, media_name, selected_emotion, annotator_name, emotion_rating, comments):
+        self.add_many([[media_name, selected_emotion, annotator_name, emotion_rating, comments]])
+
+    # Function to record a batch of votes with one backend write
+    def add_many(self, rows):
+        with self.lock:
+            self.backend.append(rows)
+            for media_name, selected_emotion, annotator_name, _, _ in rows:
+                video_counts = self.counts.setdefault(media_name, {})
+                video_counts[selected_emotion] = video_counts.get(selected_emotion, 0) + 1
+                self.annotation_counts[media_name] = self.annotation_counts.get(media_name, 0) + 1
+                self.annotators.setdefault(media_name, []).append(annotator_name)
+            self.stats.add_many([(row[0], row[1], row[3]) for row in rows])
+            self._dirty = True
+            self._schedule_flush()
+
+    # Function to get (annotation count, annotator names) for one video
+    def summary(self, media_name):
+        with self.lock:
+            return self.annotation_counts.get(media_name, 0), list(self.annotators.get(media_name, []))
+
+    # Function to get the analytics for one video (None if it has no votes)
+    def clip_stats(self, media_name):
+        with self.lock:
+            return self.stats.clip(media_name)
+
+    # Function to get (analytics for a slice of videos, total number of videos)
+    def clips_stats(self, start=0, stop=None):
+        with self.lock:
+            return self.stats.clips_page(start, stop), len(self.stats.clips)
+
+    def agreement(self):
+        with self.lock:
+            return self.stats.agreement()
+
+    def majority_emotions(self):
+        with self.lock:
+            return self._majority_rows()
+
+    def _majority_rows(self):
+        return [[video, max(emotion_count, key=emotion_count.get)]
+                for video, emotion_count in self.counts.items()]
+
+    def _schedule_flush(self):
+        # Called with the lock held; one pending timer covers a burst of votes
+        if self._timer is None:
+            self._timer = threading.Timer(self.flush_delay, self.flush)
+            self._timer.daemon = True
+            self._timer.start()
+
+    # Function to write the majority file if votes were added since the last
+    # flush, or always with force. The file is replaced atomically so readers
+    # never see it half written.
+    def flush(self, force=False):
+        with self.lock:
+            if self._timer is not None:
+                self._timer.cancel()
+                self._timer = None
+            if not (self._dirty or force):
+                return
+            tmp_path = f"{self.majority_path}.{os.getpid()}.tmp"
+            with open(tmp_path, 'w', newline='', encoding='utf-8') as file:
+                writer = csv.writer(file)
+                writer.writerow(['Video', 'Majority Emotion'])
+                writer.writerows(self._majority_rows())
+            os.replace(tmp_path, self.majority_path)
+            self._dirty = False
+
+    # Function to rebuild the counters from the backend and rewrite the
+    # majority file from them
+    def rewrite_majority(self):
+        self.load()
+        self.flush(force=True)
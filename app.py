@@ -1,6 +1,8 @@
-from flask import Flask, render_template, request, redirect, url_for
+from flask import Flask, abort, jsonify, render_template, request, redirect, send_from_directory, url_for
+import math
 import os
-import csv
+
+from annotation_store import AnnotationStore, make_backend
 
 app = Flask(__name__)
 
@@ -8,54 +10,129 @@ app = Flask(__name__)
 VIDEO_FOLDER = 'static/preprocessvideo'
 AUDIO_FOLDER = 'static/preprocessaudio'
 TEXT_FOLDER = 'static/preprocesstext'
+# Pregenerated by media_previews.py
+POSTER_FOLDER = 'static/posters'
+PREVIEW_FOLDER = 'static/previews'
+
+# Folders served by the media route, by the kind named in its URL
+MEDIA_FOLDERS = {
+    'video': VIDEO_FOLDER,
+    'audio': AUDIO_FOLDER,
+    'poster': POSTER_FOLDER,
+    'preview': PREVIEW_FOLDER,
+}
+
+# Media URLs carry the file's mtime (?v=...), so a changed file gets a new
+# URL and versioned responses can be cached for a year without revalidation
+MEDIA_MAX_AGE = 365 * 24 * 3600
+
+# Where votes are stored: 'csv' (annotations.csv) or 'sqlite' (annotations.db)
+ANNOTATION_BACKEND = os.environ.get('ANNOTATION_BACKEND', 'csv')
+
+# Per-video emotion counters, loaded once and updated on every vote
+annotation_store = AnnotationStore(make_backend(ANNOTATION_BACKEND, 'annotations.csv', 'annotations.db'),
+                                   'majority_emotions.csv')
+annotation_store.load()
+
+# Number of media items shown per index page
+PER_PAGE = 20
+
+# (folder, suffix) -> (folder mtime, sorted file names)
+_listing_cache = {}
+# text file path -> (file mtime, contents)
+_transcript_cache = {}
+
+# Function to list files in a folder, re-reading it only when the folder changes
+def list_folder(folder, suffix):
+    mtime = os.stat(folder).st_mtime_ns
+    cached = _listing_cache.get((folder, suffix))
+    if cached is None or cached[0] != mtime:
+        cached = (mtime, sorted(f for f in os.listdir(folder) if f.endswith(suffix)))
+        _listing_cache[(folder, suffix)] = cached
+    return cached[1]
+
+# Function to read a transcript, served from memory until the file changes
+def read_transcript(text_file_path):
+    try:
+        mtime = os.stat(text_file_path).st_mtime_ns
+    except OSError:
+        return None
+    cached = _transcript_cache.get(text_file_path)
+    if cached is None or cached[0] != mtime:
+        with open(text_file_path, 'r', encoding='utf-8') as f:
+            cached = (mtime, f.read())
+        _transcript_cache[text_file_path] = cached
+    return cached[1]
 
-# Load media file metadata
-def get_media_files():
-    videos = [f for f in os.listdir(VIDEO_FOLDER) if f.endswith('.mp4')]
-    audio_files = [f.replace('.mp4', '.wav') for f in videos]
-    text_files = [f for f in os.listdir(TEXT_FOLDER) if f.endswith('.txt')]
-    
-    text_file_mapping = {f.replace('.txt', '.mp4'): f for f in text_files}
-    
+# Function to build a versioned URL for a media file, or None if it does not
+# exist (such as a poster that has not been generated yet)
+def media_url(kind, filename):
+    try:
+        mtime = os.stat(os.path.join(MEDIA_FOLDERS[kind], filename)).st_mtime_ns
+    except OSError:
+        return None
+    return url_for('media', kind=kind, filename=filename, v=mtime)
+
+# Load media file metadata for one page of videos; returns the page and the
+# total number of videos
+def get_media_files(page=1, per_page=PER_PAGE):
+    videos = list_folder(VIDEO_FOLDER, '.mp4')
+    text_files = set(list_folder(TEXT_FOLDER, '.txt'))
+
+    start = (page - 1) * per_page
     media_files = []
-    for video in videos:
+    for video in videos[start:start + per_page]:
         audio = video.replace('.mp4', '.wav')
-        text = text_file_mapping.get(video, None)
-        text_file_path = os.path.join(TEXT_FOLDER, text) if text else None
-        
-        if text_file_path and os.path.exists(text_file_path):
-            with open(text_file_path, 'r', encoding='utf-8') as f:
-                text_content = f.read()
-        else:
+        text = video.replace('.mp4', '.txt')
+        poster = video.replace('.mp4', '.jpg')
+        text_content = read_transcript(os.path.join(TEXT_FOLDER, text)) if text in text_files else None
+        if text_content is None:
             text_content = "Text not available for this media."
-        
-        annotation_count = 0
-        annotators = []
-        
-        # Check if this video has annotations already
-        if os.path.exists('annotations.csv'):
-            with open('annotations.csv', 'r') as file:
-                reader = csv.reader(file)
-                for row in reader:
-                    if row[0] == video.split('.')[0]:
-                        annotation_count += 1
-                        if len(row) > 3:
-                            annotators.append(row[2])
-        
+
+        annotation_count, annotators = annotation_store.summary(video.split('.')[0])
+
         media_files.append({
             'video': video,
             'audio': audio,
+            'video_url': media_url('video', video) or url_for('media', kind='video', filename=video),
+            'audio_url': media_url('audio', audio) or url_for('media', kind='audio', filename=audio),
+            'poster_url': media_url('poster', poster),
+            'preview_url': media_url('preview', video),
             'text_content': text_content,
             'annotation_count': annotation_count,
             'annotators': annotators
         })
-    
-    return media_files
+
+    return media_files, len(videos)
 
 @app.route('/')
 def index():
-    media_files = get_media_files()
-    return render_template('index.html', media_files=media_files)
+    page = max(request.args.get('page', 1, type=int), 1)
+    per_page = min(max(request.args.get('per_page', PER_PAGE, type=int), 1), 200)
+    media_files, total = get_media_files(page, per_page)
+    pages = max(math.ceil(total / per_page), 1)
+    return render_template('index.html', media_files=media_files, page=page, pages=pages, per_page=per_page)
+
+# Serve clips, audio, posters and previews with byte-range support (so
+# players can seek without downloading the whole file) and ETag /
+# Last-Modified validation. Versioned URLs are marked immutable; unversioned
+# ones must be revalidated on every use.
+@app.route('/media/<kind>/<path:filename>')
+def media(kind, filename):
+    folder = MEDIA_FOLDERS.get(kind)
+    if folder is None:
+        abort(404)
+    versioned = bool(request.args.get('v'))
+    # max_age also sets Expires, so it must match Cache-Control
+    response = send_from_directory(os.path.abspath(folder), filename, conditional=True,
+                                   max_age=MEDIA_MAX_AGE if versioned else 0)
+    if versioned:
+        response.cache_control.public = True
+        response.cache_control.immutable = True
+        response.cache_control.no_cache = None
+    else:
+        response.cache_control.no_cache = True
+    return response
 
 @app.route('/submit', methods=['POST'])
 def submit():
@@ -64,50 +141,41 @@ def submit():
     selected_emotion = request.form.get('selected_emotion')
     emotion_rating = request.form.get('emotion_rating')
     comments = request.form.get('comments', '')
+    page = request.form.get('page', 1, type=int)
+    per_page = request.form.get('per_page', PER_PAGE, type=int)
 
     if not selected_emotion or not emotion_rating:
-        return redirect(url_for('index'))
+        return redirect(url_for('index', page=page, per_page=per_page))
+
+    # Save the rating to CSV and count it; the majority file is flushed shortly after
+    annotation_store.add(media_name, selected_emotion, annotator_name, emotion_rating, comments)
+
+    return redirect(url_for('index', page=page, per_page=per_page))
+
+# Analytics API: per-clip label distributions, rating-weighted consensus and
+# agreement, served from the counts kept up to date by annotation_store
+@app.route('/api/clips')
+def api_clips():
+    page = max(request.args.get('page', 1, type=int), 1)
+    per_page = min(max(request.args.get('per_page', 100, type=int), 1), 1000)
+    start = (page - 1) * per_page
+    clips, total = annotation_store.clips_stats(start, start + per_page)
+    return jsonify({'clips': clips, 'page': page, 'per_page': per_page, 'total': total})
 
-    # Save the rating to CSV
-    with open('annotations.csv', 'a', newline='', encoding='utf-8') as file:
-        writer = csv.writer(file)
-        writer.writerow([media_name, selected_emotion, annotator_name, emotion_rating, comments])
-    
-    # Update majority emotion CSV
-    update_majority_emotion_csv()
+@app.route('/api/clips/<media_name>')
+def api_clip(media_name):
+    clip = annotation_store.clip_stats(media_name)
+    if clip is None:
+        return jsonify({'error': f"No annotations for {media_name}"}), 404
+    return jsonify(clip)
 
-    return redirect(url_for('index'))
+@app.route('/api/agreement')
+def api_agreement():
+    return jsonify(annotation_store.agreement())
 
+# Rebuild the majority emotion CSV from scratch by rescanning the stored votes
 def update_majority_emotion_csv():
-    annotations = {}
-    majority_file = 'majority_emotions.csv'
-
-    # Read existing annotations
-    if os.path.exists('annotations.csv'):
-        with open('annotations.csv', 'r', encoding='utf-8') as file:
-            reader = csv.reader(file)
-            for row in reader:
-                video, emotion, _, _, _ = row
-                if video not in annotations:
-                    annotations[video] = []
-                annotations[video].append(emotion)
-    
-    # Calculate majority emotion for each video
-    majority_emotions = []
-    for video, emotions in annotations.items():
-        emotion_count = {}
-        for emotion in emotions:
-            if emotion not in emotion_count:
-                emotion_count[emotion] = 0
-            emotion_count[emotion] += 1
-        majority_emotion = max(emotion_count, key=emotion_count.get)
-        majority_emotions.append([video, majority_emotion])
-    
-    # Write the majority emotions to a new CSV file
-    with open(majority_file, 'w', newline='', encoding='utf-8') as file:
-        writer = csv.writer(file)
-        writer.writerow(['Video', 'Majority Emotion'])
-        writer.writerows(majority_emotions)
+    annotation_store.rewrite_majority()
 
 if __name__ == '__main__':
     app.run(debug=True)
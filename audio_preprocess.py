@@ -0,0 +1,213 @@
+import math
+import struct
+import wave
+
+import numpy as np
+
+# Sample widths handled here; others fall back to pydub in adotxtpre
+SAMPLE_DTYPES = {2: np.int16, 4: np.int32}
+
+# Frames processed per block, which bounds memory for long files
+BLOCK_FRAMES = 1 << 20
+
+
+# Function to open a PCM WAV file as a read-only memory map of shape
+# (frames, channels). Returns (samples, frame_rate, sample_width), or None if
+# the format is not a plain PCM layout this module handles.
+def read_wav(path):
+    with open(path, 'rb') as f:
+        riff, _, wave_id = struct.unpack('<4sI4s', f.read(12))
+        if riff != b'RIFF' or wave_id != b'WAVE':
+            return None
+        fmt = None
+        while True:
+            header = f.read(8)
+            if len(header) < 8:
+                return None
+            chunk_id, chunk_size = struct.unpack('<4sI', header)
+            if chunk_id == b'fmt ':
+                fmt = struct.unpack('<HHIIHH', f.read(16))
+                f.seek(chunk_size - 16 + (chunk_size & 1), 1)
+            elif chunk_id == b'data':
+                offset = f.tell()
+                break
+            else:
+                f.seek(chunk_size + (chunk_size & 1), 1)
+    if fmt is None:
+        return None
+    format_tag, channels, frame_rate, _, _, bits = fmt
+    sample_width = bits // 8
+    if format_tag not in (1, 0xFFFE) or sample_width not in SAMPLE_DTYPES:
+        return None
+    frames = chunk_size // (channels * sample_width)
+    if frames == 0:
+        return np.zeros((0, channels), dtype=SAMPLE_DTYPES[sample_width]), frame_rate, sample_width
+    samples = np.memmap(path, dtype=np.dtype(SAMPLE_DTYPES[sample_width]).newbyteorder('<'), mode='r',
+                        offset=offset, shape=(frames, channels))
+    return samples, frame_rate, sample_width
+
+def _max_possible_amplitude(sample_width):
+    return float(2 ** (sample_width * 8)) / 2
+
+# Function to compute the gain factor of pydub's normalize(headroom), using
+# the same float operations; None when the audio is silent
+def normalize_factor(samples, sample_width, headroom=0.1):
+    peak = 0
+    for start in range(0, len(samples), BLOCK_FRAMES):
+        block = samples[start:start + BLOCK_FRAMES]
+        if block.size:
+            peak = max(peak, int(block.max()), -int(block.min()))
+    if peak == 0:
+        return None
+    target_peak = _max_possible_amplitude(sample_width) * 10 ** (float(-headroom) / 20)
+    needed_boost = 20 * math.log(float(target_peak / peak), 10)
+    return 10 ** (float(needed_boost) / 20)
+
+# Function to apply a gain factor like audioop.mul: scale, clip, then floor
+def apply_gain(block, factor, sample_width):
+    if factor is None:
+        return np.asarray(block)
+    limit = int(_max_possible_amplitude(sample_width))
+    scaled = np.floor(np.clip(block * factor, -limit, limit - 1))
+    return scaled.astype(SAMPLE_DTYPES[sample_width])
+
+# Convert milliseconds to a frame index the way pydub slices audio
+def _ms_to_frames(ms, frame_rate):
+    return (np.asarray(ms, dtype=np.float64) * (frame_rate / 1000.0)).astype(np.int64)
+
+# Function to compute, for every millisecond boundary k, the sum of squared
+# (gain-adjusted) samples before pydub's frame position of k ms. Works block
+# by block, so memory stays proportional to the length in milliseconds.
+def _cumulative_energy(samples, frame_rate, sample_width, factor, seg_len):
+    bounds = _ms_to_frames(np.arange(seg_len + 1), frame_rate)
+    total_frames = len(samples)
+    energy_dtype = np.int64 if sample_width == 2 else np.float64
+    per_ms = np.zeros(seg_len, dtype=energy_dtype)
+    ms = 0
+    while ms < seg_len:
+        ms_end = min(ms + max(BLOCK_FRAMES * 1000 // frame_rate, 1), seg_len)
+        lo, hi = bounds[ms], min(bounds[ms_end], total_frames)
+        if hi > lo:
+            # Squares of 32-bit samples overflow int64 once summed; use floats
+            # there and exact integers for 16-bit
+            block = apply_gain(samples[lo:hi], factor, sample_width)
+            block = block.astype(energy_dtype)
+            energy = (block * block).sum(axis=1)
+            starts = np.clip(bounds[ms:ms_end], lo, hi) - lo
+            nonempty = starts < hi - lo
+            sums = np.zeros(ms_end - ms, dtype=energy_dtype)
+            sums[nonempty] = np.add.reduceat(energy, starts[nonempty])
+            # reduceat gives one-element sums for empty ranges; zero them
+            sums[:-1][starts[1:] == starts[:-1]] = 0
+            per_ms[ms:ms_end] = sums
+        ms = ms_end
+    cumulative = np.zeros(seg_len + 1, dtype=energy_dtype)
+    np.cumsum(per_ms, out=cumulative[1:])
+    return cumulative, bounds
+
+# Function to find silent ranges [start_ms, end_ms], matching
+# pydub.silence.detect_silence with a vectorized sliding-window RMS
+def detect_silence(samples, frame_rate, sample_width, factor, min_silence_len=1000, silence_thresh=-16,
+                   seek_step=1):
+    channels = samples.shape[1] if samples.ndim > 1 else 1
+    seg_len = round(1000 * (len(samples) / frame_rate))
+    if seg_len < min_silence_len:
+        return []
+    thresh = 10 ** (float(silence_thresh) / 20) * _max_possible_amplitude(sample_width)
+
+    cumulative, bounds = _cumulative_energy(samples, frame_rate, sample_width, factor, seg_len)
+    last_slice_start = seg_len - min_silence_len
+    starts = np.arange(0, last_slice_start + 1, seek_step)
+    if last_slice_start % seek_step:
+        starts = np.append(starts, last_slice_start)
+    ends = starts + min_silence_len
+    counts = (bounds[ends] - bounds[starts]) * channels
+    sums = cumulative[ends] - cumulative[starts]
+    with np.errstate(invalid='ignore', divide='ignore'):
+        rms = np.where(counts > 0, np.floor(np.sqrt(sums / np.maximum(counts, 1))), 0)
+    silence_starts = starts[rms <= thresh]
+    if not len(silence_starts):
+        return []
+
+    # Same merge rule as pydub: a new range starts only after a jump that is
+    # neither one seek step nor overlapping the previous silent window
+    gaps = np.diff(silence_starts)
+    breaks = np.nonzero((gaps != seek_step) & (gaps > min_silence_len))[0]
+    range_starts = np.concatenate(([silence_starts[0]], silence_starts[breaks + 1]))
+    range_ends = np.concatenate((silence_starts[breaks], [silence_starts[-1]])) + min_silence_len
+    return [[int(s), int(e)] for s, e in zip(range_starts, range_ends)]
+
+# Function to find the audio ranges pydub.silence.split_on_silence would
+# keep, as [start_ms, end_ms] pairs clipped to the audio
+def split_ranges(samples, frame_rate, sample_width, factor, min_silence_len=1000, silence_thresh=-16,
+                 keep_silence=100, seek_step=1):
+    seg_len = round(1000 * (len(samples) / frame_rate))
+    silent_ranges = detect_silence(samples, frame_rate, sample_width, factor, min_silence_len,
+                                   silence_thresh, seek_step)
+    if not silent_ranges:
+        nonsilent = [[0, seg_len]]
+    elif silent_ranges[0][0] == 0 and silent_ranges[0][1] == seg_len:
+        nonsilent = []
+    else:
+        nonsilent = []
+        prev_end = 0
+        for start, end in silent_ranges:
+            nonsilent.append([prev_end, start])
+            prev_end = end
+        if end != seg_len:
+            nonsilent.append([prev_end, seg_len])
+        if nonsilent[0] == [0, 0]:
+            nonsilent.pop(0)
+
+    if isinstance(keep_silence, bool):
+        keep_silence = seg_len if keep_silence else 0
+    ranges = [[start - keep_silence, end + keep_silence] for start, end in nonsilent]
+    for current, following in zip(ranges, ranges[1:]):
+        if following[0] < current[1]:
+            current[1] = (current[1] + following[0]) // 2
+            following[0] = current[1]
+    return [[max(start, 0), min(end, seg_len)] for start, end in ranges]
+
+# Function to yield the normalized, silence-trimmed audio block by block.
+# Ranges ending past the last frame are padded with silence, as pydub does.
+def iter_preprocessed(samples, frame_rate, sample_width, silence_thresh=-40, headroom=0.1,
+                      min_silence_len=1000, keep_silence=100):
+    factor = normalize_factor(samples, sample_width, headroom)
+    ranges = split_ranges(samples, frame_rate, sample_width, factor, min_silence_len, silence_thresh, keep_silence)
+    seg_len = round(1000 * (len(samples) / frame_rate))
+    if not ranges:
+        ranges = [[0, seg_len]]
+    for start_ms, end_ms in ranges:
+        start, end = _ms_to_frames([start_ms, end_ms], frame_rate)
+        for lo in range(start, min(end, len(samples)), BLOCK_FRAMES):
+            yield apply_gain(samples[lo:min(lo + BLOCK_FRAMES, end)], factor, sample_width)
+        if end > len(samples):
+            channels = samples.shape[1] if samples.ndim > 1 else 1
+            yield np.zeros((end - max(start, len(samples)), channels), dtype=SAMPLE_DTYPES[sample_width])
+
+# Function to preprocess an in-memory sample array, returning a new array
+def preprocess_samples(samples, frame_rate, sample_width, silence_thresh=-40):
+    blocks = list(iter_preprocessed(samples, frame_rate, sample_width, silence_thresh))
+    if not blocks:
+        return np.zeros((0,) + samples.shape[1:], dtype=SAMPLE_DTYPES[sample_width])
+    return np.concatenate(blocks)
+
+# Function to write blocks of samples to a PCM WAV file
+def write_wav(path, blocks, frame_rate, sample_width, channels):
+    with wave.open(path, 'wb') as w:
+        w.setnchannels(channels)
+        w.setsampwidth(sample_width)
+        w.setframerate(frame_rate)
+        for block in blocks:
+            w.writeframes(np.ascontiguousarray(block, dtype=np.dtype(SAMPLE_DTYPES[sample_width]).newbyteorder('<')).tobytes())
+
+# Function to normalize and trim silence from a WAV file in a few streaming
+# passes over a memory map. Returns False if the file's format is not handled.
+def preprocess_wav(audio_path, preprocessed_audio_path, silence_thresh=-40):
+    wav = read_wav(audio_path)
+    if wav is None:
+        return False
+    samples, frame_rate, sample_width = wav
+    write_wav(preprocessed_audio_path, iter_preprocessed(samples, frame_rate, sample_width, silence_thresh),
+              frame_rate, sample_width, samples.shape[1])
+    return True
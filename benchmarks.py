@@ -0,0 +1,585 @@
+import argparse
+import csv
+import inspect
+import json
+import logging
+import os
+import platform
+import random
+import statistics
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+
+from annotation_store import AnnotationStore, CSVAnnotationBackend, SQLiteAnnotationBackend
+from dataset_manifest import get_manifest
+from lexicon_index import LexiconIndex, brute_force_correct
+import profiling
+from profiling import io_snapshot, stage
+
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+
+# Keep the stage records of benchmark runs out of the pipeline's metrics file
+profiling.metrics_path = os.environ.get('PROFILE_METRICS', '')
+
+TAMIL_LETTERS = [chr(c) for c in range(0x0B85, 0x0BBA) if chr(c).isalpha()]
+TAMIL_SIGNS = [chr(c) for c in range(0x0BBE, 0x0BCE)]
+
+# Function to build a random Tamil-looking word
+def synthetic_word(rng, min_len=3, max_len=8):
+    chars = []
+    for _ in range(rng.randint(min_len, max_len)):
+        chars.append(rng.choice(TAMIL_LETTERS))
+        if rng.random() < 0.4:
+            chars.append(rng.choice(TAMIL_SIGNS))
+    return ''.join(chars)
+
+# Function to build a synthetic lexicon of unique words
+def synthetic_lexicon(size, seed=0):
+    rng = random.Random(seed)
+    lexicon = {}
+    while len(lexicon) < size:
+        lexicon[synthetic_word(rng)] = "meaning"
+    return lexicon
+
+# Function to misspell a word with a few random edits
+def misspell(rng, word, edits=2):
+    chars = list(word)
+    for _ in range(edits):
+        op = rng.randrange(3)
+        pos = rng.randrange(len(chars) + (op == 1))
+        if op == 0 and chars:
+            chars[pos] = rng.choice(TAMIL_LETTERS)
+        elif op == 1:
+            chars.insert(pos, rng.choice(TAMIL_LETTERS))
+        elif len(chars) > 1:
+            del chars[pos]
+    return ''.join(chars)
+
+# Compare the indexed corrector against the brute-force lexicon scan, on
+# misspelled lexicon words and on far_queries random tokens that are far from
+# every lexicon word
+def benchmark_correct_spelling(lexicon_size=20000, queries=200, far_queries=50, seed=0):
+    rng = random.Random(seed)
+    lexicon = synthetic_lexicon(lexicon_size, seed)
+    words = list(lexicon)
+    tokens = [misspell(rng, rng.choice(words)) for _ in range(queries)]
+    tokens += [synthetic_word(rng, 10, 14) for _ in range(far_queries)]
+
+    start = time.perf_counter()
+    index = LexiconIndex(lexicon)
+    index.deletions
+    build_time = time.perf_counter() - start
+
+    start = time.perf_counter()
+    indexed = [index.correct(t) for t in tokens]
+    indexed_time = time.perf_counter() - start
+
+    start = time.perf_counter()
+    brute = [brute_force_correct(t, lexicon) for t in tokens]
+    brute_time = time.perf_counter() - start
+
+    mismatches = sum(1 for a, b in zip(indexed, brute) if a != b)
+    result = {
+        "lexicon_size": lexicon_size,
+        "queries": queries,
+        "far_queries": far_queries,
+        "index_build_s": build_time,
+        "indexed_s": indexed_time,
+        "brute_force_s": brute_time,
+        "speedup": brute_time / indexed_time if indexed_time else None,
+        "mismatches": mismatches,
+    }
+    logging.info(f"correct_spelling benchmark: {result}")
+    return result
+
+EMOTIONS = ['Anger', 'Disgust', 'Fear', 'Happiness', 'Sadness', 'Surprise']
+
+# Function to build random annotation rows
+def synthetic_votes(count, videos=500, seed=0):
+    rng = random.Random(seed)
+    return [[f"video{rng.randrange(videos)}", rng.choice(EMOTIONS), f"annotator{rng.randrange(20)}",
+             str(rng.randint(1, 5)), ""] for _ in range(count)]
+
+# Reference implementation of the original submit path: append the vote, then
+# re-read every vote and rewrite the majority file
+def legacy_submit(row, annotations_path, majority_path):
+    with open(annotations_path, 'a', newline='', encoding='utf-8') as file:
+        csv.writer(file).writerow(row)
+    annotations = {}
+    with open(annotations_path, 'r', encoding='utf-8') as file:
+        for video, emotion, _, _, _ in csv.reader(file):
+            annotations.setdefault(video, {})
+            annotations[video][emotion] = annotations[video].get(emotion, 0) + 1
+    with open(majority_path, 'w', newline='', encoding='utf-8') as file:
+        writer = csv.writer(file)
+        writer.writerow(['Video', 'Majority Emotion'])
+        writer.writerows([video, max(counts, key=counts.get)] for video, counts in annotations.items())
+
+# Function to run submit() from several threads at once and time it
+def _run_concurrent(submit, votes, threads):
+    chunks = [votes[i::threads] for i in range(threads)]
+    workers = [threading.Thread(target=lambda chunk=chunk: [submit(row) for row in chunk]) for chunk in chunks]
+    start = time.perf_counter()
+    for worker in workers:
+        worker.start()
+    for worker in workers:
+        worker.join()
+    return time.perf_counter() - start
+
+# Compare concurrent vote throughput of the original CSV path and the
+# CSV and SQLite annotation backends
+def benchmark_annotation_backends(votes=2000, threads=8, seed=0):
+    rows = synthetic_votes(votes, seed=seed)
+    result = {"votes": votes, "threads": threads}
+    with tempfile.TemporaryDirectory() as tmp:
+        annotations_path = os.path.join(tmp, 'legacy.csv')
+        majority_path = os.path.join(tmp, 'legacy_majority.csv')
+        lock = threading.Lock()
+
+        def submit_legacy(row):
+            # The original code had no lock; one is needed here to keep the
+            # rescan from reading a row that is still being written
+            with lock:
+                legacy_submit(row, annotations_path, majority_path)
+
+        elapsed = _run_concurrent(submit_legacy, rows, threads)
+        result["legacy_csv_votes_per_s"] = votes / elapsed
+
+        for name, backend in (("csv", CSVAnnotationBackend(os.path.join(tmp, 'annotations.csv'))),
+                              ("sqlite", SQLiteAnnotationBackend(os.path.join(tmp, 'annotations.db')))):
+            store = AnnotationStore(backend, os.path.join(tmp, f'{name}_majority.csv'))
+            elapsed = _run_concurrent(lambda row: store.add(*row), rows, threads)
+            store.flush()
+            result[f"{name}_votes_per_s"] = votes / elapsed
+    logging.info(f"annotation backend benchmark: {result}")
+    return result
+
+# Compare per-clip moviepy splitting plus a separate audio extraction against
+# the single-pass ffmpeg segmenter, on one source video
+def benchmark_split_video(video_path=None, duration=30):
+    if video_path is None:
+        logging.warning("split benchmark skipped: pass --video")
+        return None
+    # moviepy is only needed for this benchmark
+    import videoclip
+
+    result = {"video": video_path, "source_bytes": os.path.getsize(video_path)}
+    with tempfile.TemporaryDirectory() as tmp:
+        start = io_snapshot()
+        videoclip.extract_audio_from_video(video_path, os.path.join(tmp, 'legacy.wav'))
+        clips = videoclip.split_video_fixed_duration(video_path, duration, tmp, 'legacy', 1) - 1
+        end = io_snapshot()
+        result.update(per_clip_s=end[0] - start[0], per_clip_bytes_read=end[1] - start[1], per_clip_clips=clips)
+
+        for name, stream_copy in (("single_pass_copy", True), ("single_pass_reencode", False)):
+            start = io_snapshot()
+            clips = videoclip.segment_video_single_pass(video_path, duration, tmp, name, 1,
+                                                        os.path.join(tmp, f'{name}.wav'), stream_copy) - 1
+            end = io_snapshot()
+            result.update({f"{name}_s": end[0] - start[0], f"{name}_bytes_read": end[1] - start[1],
+                           f"{name}_clips": clips})
+    logging.info(f"split benchmark: {result}")
+    return result
+
+# Function to write a mono 16-bit WAV of tone-and-noise bursts separated by
+# near-silent gaps
+def synthetic_speech_wav(path, seconds, rate=16000, seed=0):
+    import numpy as np
+    import wave
+
+    rng = np.random.default_rng(seed)
+    parts = []
+    total = 0
+    while total < seconds * rate:
+        t = np.arange(int(rate * rng.uniform(0.5, 4))) / rate
+        burst = (rng.uniform(1000, 8000) * np.sin(2 * np.pi * rng.uniform(120, 400) * t)
+                 + rng.normal(0, rng.uniform(200, 2000), len(t)))
+        gap = rng.normal(0, 5, int(rate * rng.uniform(0.2, 2.5)))
+        parts += [burst, gap]
+        total += len(burst) + len(gap)
+    samples = np.clip(np.concatenate(parts)[:seconds * rate], -32768, 32767).astype(np.int16)
+    with wave.open(path, 'wb') as w:
+        w.setnchannels(1)
+        w.setsampwidth(2)
+        w.setframerate(rate)
+        w.writeframes(samples.tobytes())
+
+# Compare the pydub audio preprocessing against the NumPy path
+def benchmark_preprocess_audio(seconds=600, seed=0):
+    import adotxtpre
+
+    result = {"seconds": seconds}
+    with tempfile.TemporaryDirectory() as tmp:
+        source = os.path.join(tmp, 'source.wav')
+        synthetic_speech_wav(source, seconds, seed=seed)
+        outputs = {}
+        for name, preprocess in (("pydub", adotxtpre.preprocess_audio_pydub),
+                                 ("numpy", adotxtpre.preprocess_audio)):
+            outputs[name] = os.path.join(tmp, f'{name}.wav')
+            start = time.perf_counter()
+            preprocess(source, outputs[name])
+            result[f"{name}_s"] = time.perf_counter() - start
+        with open(outputs["pydub"], 'rb') as a, open(outputs["numpy"], 'rb') as b:
+            result["identical_output"] = a.read() == b.read()
+    result["speedup"] = result["pydub_s"] / result["numpy_s"] if result["numpy_s"] else None
+    logging.info(f"audio preprocessing benchmark: {result}")
+    return result
+
+# Function to read this process's byte counters from /proc (Linux only)
+def _proc_io():
+    with open('/proc/self/io', 'r') as f:
+        counters = dict(line.split(': ') for line in f.read().splitlines())
+    return int(counters['rchar']), int(counters['wchar'])
+
+# Compare the separate extract/transcribe/preprocess scripts against the
+# single per-clip pipeline on one clip, with a stub recognizer. Byte counts
+# are this process's reads and writes; ffmpeg subprocesses are not included.
+def benchmark_clip_pipeline(video_path=None):
+    if video_path is None:
+        logging.warning("pipeline benchmark skipped: pass --video")
+        return None
+    import adotxtextract
+    import adotxtpre
+    import clip_pipeline
+    from transcribe import StubRecognizerBackend
+
+    backend = StubRecognizerBackend('வணக்கம்')
+    result = {"video": video_path}
+    with tempfile.TemporaryDirectory() as tmp:
+        audio_path = os.path.join(tmp, 'legacy.wav')
+        start, (read0, written0) = time.perf_counter(), _proc_io()
+        durations = adotxtextract.extract_audio_from_video(video_path, audio_path)
+        text = adotxtextract.extract_text_from_audio(audio_path, backend)
+        adotxtextract.save_results(video_path, audio_path, tmp, os.path.join(tmp, 'legacy.csv'), text, *durations)
+        get_manifest(os.path.join(tmp, 'legacy.csv')).close()
+        adotxtpre.preprocess_audio(audio_path, os.path.join(tmp, 'p_legacy.wav'))
+        adotxtpre.preprocess_text(text, os.path.join(tmp, 'p_legacy.txt'))
+        read1, written1 = _proc_io()
+        result.update(separate_s=time.perf_counter() - start, separate_bytes_read=read1 - read0,
+                      separate_bytes_written=written1 - written0)
+
+        start = time.perf_counter()
+        row = clip_pipeline.process_clip(video_path, tmp, tmp, tmp, tmp, backend)
+        get_manifest(os.path.join(tmp, 'pipeline.csv')).add(row)
+        get_manifest(os.path.join(tmp, 'pipeline.csv')).close()
+        read2, written2 = _proc_io()
+        result.update(pipeline_s=time.perf_counter() - start, pipeline_bytes_read=read2 - read1,
+                      pipeline_bytes_written=written2 - written1)
+    logging.info(f"clip pipeline benchmark: {result}")
+    return result
+
+# Compare per-row pandas CSV appends against the batched dataset writer, and
+# time reading the result back
+def benchmark_dataset_writes(rows=5000, seed=0):
+    import pandas as pd
+    from dataset_manifest import DatasetManifest, read_dataset
+
+    rng = random.Random(seed)
+    records = [{"clip_id": f"video{i}", "audio_path": f"audio/video{i}.wav",
+                "extracted_text": ' '.join(synthetic_word(rng) for _ in range(20)),
+                "audio_duration": 30.0} for i in range(rows)]
+    result = {"rows": rows}
+    with tempfile.TemporaryDirectory() as tmp:
+        legacy_path = os.path.join(tmp, 'legacy.csv')
+        start = time.perf_counter()
+        for record in records:
+            df = pd.DataFrame({k: [v] for k, v in record.items()})
+            if os.path.exists(legacy_path):
+                df.to_csv(legacy_path, mode='a', header=False, index=False)
+            else:
+                df.to_csv(legacy_path, index=False)
+        result["per_row_csv_s"] = time.perf_counter() - start
+
+        for extension in ('csv', 'parquet'):
+            path = os.path.join(tmp, f'dataset.{extension}')
+            try:
+                start = time.perf_counter()
+                dataset = DatasetManifest(path)
+                dataset.add_many(records)
+                dataset.close()
+                result[f"manifest_{extension}_s"] = time.perf_counter() - start
+                start = time.perf_counter()
+                read_dataset(path, columns=["clip_id", "audio_path"])
+                result[f"read_{extension}_s"] = time.perf_counter() - start
+            except ImportError as e:
+                logging.warning(f"Skipping {extension}: {e}")
+    logging.info(f"dataset writer benchmark: {result}")
+    return result
+
+# Data sizes for the benchmark suite
+SUITE_SIZES = {
+    "small": {"video_seconds": 10, "audio_seconds": 60, "tokens": 500, "lexicon_size": 5000, "votes": 2000},
+    "medium": {"video_seconds": 30, "audio_seconds": 300, "tokens": 5000, "lexicon_size": 20000, "votes": 20000},
+    "large": {"video_seconds": 120, "audio_seconds": 1800, "tokens": 50000, "lexicon_size": 50000,
+              "votes": 200000},
+}
+
+# Function to write an MP4 of moving shapes with a tone-and-noise soundtrack
+def synthetic_video(path, seconds, size=(320, 240), fps=15, seed=0):
+    import cv2
+    import numpy as np
+    from moviepy.config import get_setting
+
+    rng = np.random.default_rng(seed)
+    width, height = size
+    silent_path = f"{path}.silent.mp4"
+    audio_path = f"{path}.wav"
+    writer = cv2.VideoWriter(silent_path, cv2.VideoWriter_fourcc(*'mp4v'), fps, size)
+    velocity = rng.uniform(-6, 6, size=(3, 2))
+    position = rng.uniform(0, 1, size=(3, 2)) * (width, height)
+    for _ in range(int(seconds * fps)):
+        frame = np.full((height, width, 3), 40, dtype=np.uint8)
+        position = (position + velocity) % (width, height)
+        x, y = position[0].astype(int)
+        cv2.circle(frame, (int(x), int(y)), 30, (0, 200, 255), -1)
+        x, y = position[1].astype(int)
+        cv2.rectangle(frame, (int(x), int(y)), (int(x) + 50, int(y) + 35), (255, 120, 0), -1)
+        x, y = position[2].astype(int)
+        cv2.ellipse(frame, (int(x), int(y)), (40, 55), 0, 0, 360, (180, 180, 220), -1)
+        writer.write(frame)
+    writer.release()
+    synthetic_speech_wav(audio_path, seconds, rate=44100, seed=seed)
+    subprocess.run([get_setting("FFMPEG_BINARY"), '-y', '-v', 'error', '-i', silent_path, '-i', audio_path,
+                    '-c:v', 'copy', '-c:a', 'aac', '-shortest', path], check=True, capture_output=True)
+    os.remove(silent_path)
+    os.remove(audio_path)
+
+# Function to build a transcript of lexicon words, some misspelled, with the
+# punctuation and Latin text recognizers produce mixed in
+def synthetic_transcript(rng, words, tokens):
+    out = []
+    for _ in range(tokens):
+        word = rng.choice(words)
+        roll = rng.random()
+        if roll < 0.3:
+            word = misspell(rng, word, edits=1)
+        elif roll < 0.35:
+            word += rng.choice(['.', ',', '?'])
+        elif roll < 0.4:
+            word = rng.choice(['OK', 'video', '2024'])
+        out.append(word)
+    return ' '.join(out)
+
+# Normalize synthetic transcripts one at a time and as one batch (and over a
+# process pool when workers is set), each with a cold memo, and report
+# tokens per second
+def benchmark_tamil_batch(transcripts=1000, tokens=200, lexicon_size=20000, misspellings=3000, workers=None,
+                          seed=0):
+    import adotxtpre
+
+    rng = random.Random(seed)
+    lexicon = synthetic_lexicon(lexicon_size, seed)
+    # Transcripts share a vocabulary, including the recognizer's usual
+    # misspellings, as real ones do
+    vocabulary = rng.sample(list(lexicon), min(2000, lexicon_size))
+    vocabulary += [misspell(rng, rng.choice(vocabulary), edits=1) for _ in range(misspellings)]
+    texts = [' '.join(rng.choice(vocabulary) for _ in range(tokens)) for _ in range(transcripts)]
+    deletions = LexiconIndex(lexicon).deletions
+    total = sum(len(adotxtpre.tokenize_tamil_text(text)) for text in texts)
+
+    def timed(run):
+        adotxtpre.lexicon_index = LexiconIndex(lexicon, deletions=deletions)
+        start = time.perf_counter()
+        output = run()
+        return output, time.perf_counter() - start
+
+    previous = adotxtpre.lexicon_index
+    try:
+        per_text, per_text_time = timed(lambda: [adotxtpre.preprocess_tamil_text(text) for text in texts])
+        batch, batch_time = timed(lambda: adotxtpre.preprocess_tamil_texts(texts))
+        result = {
+            "transcripts": transcripts,
+            "tokens": total,
+            "unique_tokens": len({t for text in texts for t in adotxtpre.tokenize_tamil_text(text)}),
+            "per_text_s": per_text_time,
+            "per_text_tokens_per_s": total / per_text_time,
+            "batch_s": batch_time,
+            "batch_tokens_per_s": total / batch_time,
+            "mismatches": sum(1 for a, b in zip(per_text, batch) if a != b),
+        }
+        if workers:
+            parallel, parallel_time = timed(lambda: adotxtpre.preprocess_tamil_texts(texts, workers))
+            result.update(workers=workers, parallel_s=parallel_time, parallel_tokens_per_s=total / parallel_time)
+            result["mismatches"] += sum(1 for a, b in zip(parallel, batch) if a != b)
+    finally:
+        adotxtpre.lexicon_index = previous
+    logging.info(f"Tamil text batch benchmark: {result}")
+    return result
+
+# Function to build the synthetic inputs for one data size in folder
+def build_fixtures(folder, size, seed=0):
+    rng = random.Random(seed)
+    params = SUITE_SIZES[size]
+    lexicon = synthetic_lexicon(params["lexicon_size"], seed)
+    fixtures = {
+        "video": os.path.join(folder, f"{size}.mp4"),
+        "audio": os.path.join(folder, f"{size}.wav"),
+        "annotations": os.path.join(folder, f"{size}_annotations.csv"),
+        "lexicon": lexicon,
+        # Built once here, so the timed stage measures correction alone
+        "deletions": LexiconIndex(lexicon).deletions,
+        "transcript": synthetic_transcript(rng, list(lexicon), params["tokens"]),
+    }
+    synthetic_video(fixtures["video"], params["video_seconds"], seed=seed)
+    synthetic_speech_wav(fixtures["audio"], params["audio_seconds"], seed=seed)
+    with open(fixtures["annotations"], 'w', newline='', encoding='utf-8') as file:
+        csv.writer(file).writerows(synthetic_votes(params["votes"], seed=seed))
+    return fixtures
+
+# Suite stages: each takes (fixtures, size params, scratch folder) and
+# returns the number of items it processed
+def _suite_split(fixtures, params, tmp):
+    import videoclip
+    return videoclip.split_video_fixed_duration(fixtures["video"], 10, tmp, 'clip', 1) - 1
+
+def _suite_preprocess_video(fixtures, params, tmp):
+    import vdopre
+    return vdopre.preprocess_video(fixtures["video"], os.path.join(tmp, 'preprocessed.mp4'),
+                                   keyframe_folder=os.path.join(tmp, 'keyframes'))
+
+def _suite_recognize(fixtures, params, tmp):
+    import adotxtextract
+    from transcribe import StubRecognizerBackend
+    adotxtextract.extract_text_from_audio(fixtures["audio"], StubRecognizerBackend('வணக்கம்'))
+    return params["audio_seconds"]
+
+def _suite_preprocess_audio(fixtures, params, tmp):
+    import adotxtpre
+    adotxtpre.preprocess_audio(fixtures["audio"], os.path.join(tmp, 'preprocessed.wav'))
+    return params["audio_seconds"]
+
+def _suite_preprocess_tamil_text(fixtures, params, tmp):
+    import adotxtpre
+    previous = adotxtpre.lexicon_index
+    adotxtpre.lexicon_index = LexiconIndex(fixtures["lexicon"], deletions=fixtures["deletions"])
+    try:
+        adotxtpre.preprocess_tamil_text(fixtures["transcript"])
+    finally:
+        adotxtpre.lexicon_index = previous
+    return params["tokens"]
+
+def _suite_update_majority(fixtures, params, tmp):
+    # A store of its own on the fixture; importing app would set one up on
+    # the working directory
+    store = AnnotationStore(CSVAnnotationBackend(fixtures["annotations"]), os.path.join(tmp, 'majority_emotions.csv'))
+    store.rewrite_majority()
+    return params["votes"]
+
+SUITE_STAGES = {
+    "split_video_fixed_duration": _suite_split,
+    "preprocess_video": _suite_preprocess_video,
+    "recognize_stub": _suite_recognize,
+    "preprocess_audio": _suite_preprocess_audio,
+    "preprocess_tamil_text": _suite_preprocess_tamil_text,
+    "update_majority_emotion_csv": _suite_update_majority,
+}
+
+def _git_commit():
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], capture_output=True, text=True,
+                              check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+# Run every suite stage at each data size on synthetic fixtures and save the
+# results as JSON in results_dir. Each stage runs repeat times; the median
+# wall time is reported alongside every run's full figures.
+def benchmark_suite(sizes=("small", "medium"), stages=None, repeat=3, results_dir='benchmark_results',
+                    label=None, seed=0):
+    stages = stages or list(SUITE_STAGES)
+    results = []
+    for size in sizes:
+        with tempfile.TemporaryDirectory() as tmp:
+            logging.info(f"Building {size} fixtures")
+            fixtures = build_fixtures(tmp, size, seed)
+            for name in stages:
+                runs = []
+                for attempt in range(repeat):
+                    scratch = os.path.join(tmp, f"{name}.{attempt}")
+                    os.makedirs(scratch)
+                    with stage(f"suite.{name}", size=size) as record:
+                        record.items = SUITE_STAGES[name](fixtures, SUITE_SIZES[size], scratch) or 0
+                    runs.append(record.metrics)
+                wall = statistics.median(run["wall_s"] for run in runs)
+                items = runs[0]["items"]
+                results.append({"stage": name, "size": size, "params": SUITE_SIZES[size], "wall_s": wall,
+                                "cpu_s": statistics.median(run["cpu_s"] for run in runs),
+                                "items": items, "items_per_s": items / wall if wall else None,
+                                "peak_rss_bytes": max(run["peak_rss_bytes"] for run in runs), "runs": runs})
+                logging.info(f"{name} [{size}]: {wall:.3f}s median of {repeat}, {items} items")
+
+    os.makedirs(results_dir, exist_ok=True)
+    created = time.strftime('%Y%m%dT%H%M%S')
+    path = os.path.join(results_dir, f"{created}{'-' + label if label else ''}.json")
+    with open(path, 'w', encoding='utf-8') as f:
+        json.dump({"created": created, "label": label, "commit": _git_commit(), "python": platform.python_version(),
+                   "platform": platform.platform(), "cpus": os.cpu_count(), "repeat": repeat,
+                   "results": results}, f, indent=2, ensure_ascii=False)
+    logging.info(f"Benchmark results saved to {path}")
+    return path
+
+# Compare two saved suite runs stage by stage. Returns the (stage, size)
+# pairs whose median wall time grew by more than threshold.
+def compare_results(base_path, new_path, threshold=0.10):
+    with open(base_path, 'r', encoding='utf-8') as f:
+        base = {(r["stage"], r["size"]): r for r in json.load(f)["results"]}
+    with open(new_path, 'r', encoding='utf-8') as f:
+        new = {(r["stage"], r["size"]): r for r in json.load(f)["results"]}
+    regressions = []
+    for key in sorted(base.keys() & new.keys()):
+        before, after = base[key]["wall_s"], new[key]["wall_s"]
+        change = (after - before) / before if before else 0.0
+        flag = ""
+        if change > threshold:
+            flag = "  REGRESSION"
+            regressions.append(key)
+        logging.info(f"{key[0]} [{key[1]}]: {before:.3f}s -> {after:.3f}s ({change:+.0%}){flag}")
+    for key in sorted(base.keys() ^ new.keys()):
+        logging.info(f"{key[0]} [{key[1]}]: only in {'base' if key in base else 'new'} run")
+    return regressions
+
+BENCHMARKS = {
+    "lexicon": benchmark_correct_spelling,
+    "annotations": benchmark_annotation_backends,
+    "split": benchmark_split_video,
+    "audio": benchmark_preprocess_audio,
+    "pipeline": benchmark_clip_pipeline,
+    "dataset": benchmark_dataset_writes,
+    "tamil": benchmark_tamil_batch,
+    "suite": benchmark_suite,
+}
+
+def main():
+    parser = argparse.ArgumentParser(description="Run performance benchmarks")
+    parser.add_argument("names", nargs="*",
+                        help=f"benchmarks to run, from {', '.join(BENCHMARKS)} (default: all but the suite)")
+    parser.add_argument("--video", dest="video_path", help="source video for the split and pipeline benchmarks")
+    parser.add_argument("--workers", type=int, help="worker processes for the tamil benchmark")
+    parser.add_argument("--sizes", nargs="+", choices=list(SUITE_SIZES), help="data sizes for the suite")
+    parser.add_argument("--stages", nargs="+", choices=list(SUITE_STAGES), help="stages for the suite")
+    parser.add_argument("--repeat", type=int, help="runs per suite stage")
+    parser.add_argument("--label", help="name added to the saved suite results")
+    parser.add_argument("--results-dir", help="folder for saved suite results")
+    parser.add_argument("--compare", nargs=2, metavar=("BASE", "NEW"),
+                        help="compare two saved suite results instead of running benchmarks")
+    parser.add_argument("--threshold", type=float, default=0.10,
+                        help="slowdown reported as a regression by --compare")
+    args = parser.parse_args()
+    unknown = [name for name in args.names if name not in BENCHMARKS]
+    if unknown:
+        parser.error(f"unknown benchmarks: {', '.join(unknown)}")
+    if args.compare:
+        regressions = compare_results(*args.compare, threshold=args.threshold)
+        sys.exit(1 if regressions else 0)
+    options = {k: v for k, v in vars(args).items()
+               if k not in ("names", "compare", "threshold") and v is not None}
+    for name in args.names or [name for name in BENCHMARKS if name != "suite"]:
+        benchmark = BENCHMARKS[name]
+        params = inspect.signature(benchmark).parameters
+        benchmark(**{k: v for k, v in options.items() if k in params})
+
+if __name__ == "__main__":
+    main()
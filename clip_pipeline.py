@@ -0,0 +1,155 @@
+import os
+import logging
+import argparse
+import subprocess
+from concurrent.futures import as_completed
+
+import numpy as np
+import speech_recognition as sr
+from moviepy.config import get_setting
+from moviepy.video.io.ffmpeg_reader import ffmpeg_parse_infos
+
+from adotxtpre import log_lexicon_stats, preprocess_tamil_text
+from audio_preprocess import iter_preprocessed, write_wav
+from transcribe import (RecognitionExecutor, RetryQueue, default_backend, log_recognizer_metrics, max_in_flight,
+                        transcribe_samples)
+from transcription_cache import log_cache_stats
+from dataset_manifest import get_manifest
+from profiling import report, stage
+
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+
+# Same format moviepy's write_audiofile produces, so transcripts and cache
+# keys match the WAV-based scripts
+audio_rate = 44100
+audio_channels = 2
+
+
+# Function to decode a video's audio track straight into memory as int16
+# samples of shape (frames, channels), without an intermediate file
+def decode_audio(video_path, rate=audio_rate, channels=audio_channels):
+    cmd = [get_setting("FFMPEG_BINARY"), '-v', 'error', '-i', video_path, '-vn',
+           '-f', 's16le', '-acodec', 'pcm_s16le', '-ar', str(rate), '-ac', str(channels), '-']
+    result = subprocess.run(cmd, check=True, capture_output=True)
+    samples = np.frombuffer(result.stdout, dtype='<i2')
+    return samples[:len(samples) // channels * channels].reshape(-1, channels)
+
+# Function to run one clip through the whole audio/text pipeline. The audio
+# is decoded once and the same buffer feeds the recognizer and the audio
+# preprocessor; every output file is written exactly once. Returns the
+# dataset row, or None if decoding or recognition failed.
+def process_clip(video_path, audio_folder, text_folder, preprocessed_audio_folder, preprocessed_text_folder,
+                 backend=None, keep_audio=True):
+    base_name = os.path.splitext(os.path.basename(video_path))[0]
+    with stage('decode_audio', items=1, video=video_path) as record:
+        try:
+            samples = decode_audio(video_path)
+            video_duration = ffmpeg_parse_infos(video_path)['duration']
+        except (OSError, subprocess.CalledProcessError, KeyError) as e:
+            logging.error(f"Error decoding audio from {video_path}: {e}")
+            record.ok = False
+            return None
+    audio_duration = len(samples) / audio_rate
+
+    with stage('recognize', video=video_path) as record:
+        try:
+            segments = transcribe_samples(samples, audio_rate, video_path, backend)
+        except sr.RequestError as e:
+            logging.error(f"Error with the speech recognition request for {video_path}: {e}")
+            record.ok = False
+            return None
+        record.items = len(segments)
+    text = ' '.join(segment['text'] for segment in segments if segment['text'])
+
+    audio_path = None
+    if keep_audio:
+        audio_path = os.path.join(audio_folder, f"{base_name}.wav")
+        write_wav(audio_path, [samples], audio_rate, 2, audio_channels)
+    text_path = os.path.join(text_folder, f"{base_name}.txt")
+    with open(text_path, "w", encoding="utf-8") as f:
+        f.write(text)
+
+    preprocessed_audio_path = os.path.join(preprocessed_audio_folder, f"p_{base_name}.wav")
+    with stage('preprocess_audio', items=1, video=video_path):
+        write_wav(preprocessed_audio_path, iter_preprocessed(samples, audio_rate, 2), audio_rate, 2, audio_channels)
+    preprocessed_text = preprocess_tamil_text(text)
+    preprocessed_text_path = os.path.join(preprocessed_text_folder, f"p_{base_name}.txt")
+    if preprocessed_text:
+        with open(preprocessed_text_path, "w", encoding="utf-8") as f:
+            f.write(preprocessed_text)
+    else:
+        logging.warning(f"Preprocessed text is empty for {video_path}")
+        preprocessed_text_path = None
+
+    logging.info(f"Processed {video_path}")
+    return {
+        "clip_id": base_name,
+        "video_path": video_path,
+        "audio_path": audio_path,
+        "text_path": text_path,
+        "extracted_text": text,
+        "video_duration": video_duration,
+        "audio_duration": audio_duration,
+        "preprocessed_audio_path": preprocessed_audio_path,
+        "preprocessed_text_path": preprocessed_text_path,
+        "preprocessed_text": preprocessed_text,
+    }
+
+# Function to run every clip in a folder through the pipeline, several clips
+# at a time. Clips that could not be recognized go to the retry queue.
+def run(video_folder, audio_folder, text_folder, preprocessed_audio_folder, preprocessed_text_folder, csv_path,
+        workers=None, backend=None, keep_audio=True, retry_queue=None):
+    for folder in (audio_folder, text_folder, preprocessed_audio_folder, preprocessed_text_folder):
+        os.makedirs(folder, exist_ok=True)
+    retry_queue = retry_queue or RetryQueue()
+    video_files = sorted(f for f in os.listdir(video_folder) if f.endswith('.mp4'))
+    dataset = get_manifest(csv_path)
+    processed = 0
+    with RecognitionExecutor(workers or max_in_flight) as executor:
+        futures = {}
+        for video_file in video_files:
+            video_path = os.path.join(video_folder, video_file)
+            futures[executor.submit(process_clip, video_path, audio_folder, text_folder, preprocessed_audio_folder,
+                                    preprocessed_text_folder, backend, keep_audio)] = video_path
+        for future in as_completed(futures):
+            try:
+                row = future.result()
+            except Exception as e:
+                # Record it as this clip's failure and carry on with the rest
+                logging.error(f"Error processing {futures[future]}: {e}")
+                row = None
+            if row is None:
+                retry_queue.add(futures[future], "decoding or recognition failed")
+                continue
+            dataset.add(row)
+            retry_queue.discard(futures[future])
+            processed += 1
+    dataset.close()
+    logging.info(f"Processed {processed} of {len(video_files)} clips into {csv_path}")
+    return processed
+
+def main():
+    parser = argparse.ArgumentParser(description="Extract, transcribe and preprocess the audio of every clip")
+    parser.add_argument("--input", default='/media/dhivyadharshini/DATA/project/output_videos',
+                        help="folder of clips")
+    parser.add_argument("--output", default='/media/dhivyadharshini/DATA/project',
+                        help="folder for the audio, text and dataset outputs")
+    parser.add_argument("--workers", type=int, help="number of clips processed at once")
+    parser.add_argument("--no-raw-audio", dest="keep_audio", action="store_false",
+                        help="only write the preprocessed audio")
+    args = parser.parse_args()
+
+    run(args.input,
+        os.path.join(args.output, 'audio'),
+        os.path.join(args.output, 'text_extracted'),
+        os.path.join(args.output, 'preprocessaudi'),
+        os.path.join(args.output, 'prevideo'),
+        os.path.join(args.output, 'dataset.csv'),
+        workers=args.workers, keep_audio=args.keep_audio)
+    log_cache_stats(default_backend().cache)
+    log_lexicon_stats()
+    log_recognizer_metrics()
+    report()
+
+if __name__ == "__main__":
+    main()
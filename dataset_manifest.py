@@ -0,0 +1,200 @@
+import atexit
+import fcntl
+import json
+import logging
+import os
+import threading
+
+import pandas as pd
+
+# Column every record is keyed on; writing a record with a key already in the
+# dataset updates that row instead of adding a duplicate
+KEY = 'clip_id'
+
+
+# Function to load pyarrow's Parquet module, only needed for .parquet datasets
+def _parquet():
+    try:
+        import pyarrow.parquet as pq
+    except ImportError:
+        raise ImportError("pyarrow is required for .parquet datasets; use a .csv path instead")
+    return pq
+
+# Function to read a dataset snapshot (.parquet or .csv) into a DataFrame,
+# optionally loading only some columns
+def _read_snapshot(path, columns=None):
+    if not os.path.exists(path):
+        return pd.DataFrame(columns=columns or [])
+    if path.endswith('.parquet'):
+        pq = _parquet()
+        if columns is not None:
+            names = pq.read_schema(path).names
+            columns = [column for column in columns if column in names]
+        return pq.read_table(path, columns=columns).to_pandas()
+    usecols = None if columns is None else lambda column: column in columns
+    return pd.read_csv(path, usecols=usecols, dtype={KEY: str}, keep_default_na=False)
+
+# Function to replace a snapshot atomically, so readers only ever see the old
+# or the new file
+def _write_snapshot(df, path):
+    tmp_path = f"{path}.{os.getpid()}.tmp"
+    if path.endswith('.parquet'):
+        df.to_parquet(tmp_path, index=False)
+    else:
+        df.to_csv(tmp_path, index=False)
+    os.replace(tmp_path, path)
+
+# Function to read the records in a write-ahead log. A torn last line from a
+# crashed writer is skipped.
+def _read_wal(wal_path):
+    if not os.path.exists(wal_path):
+        return []
+    records = []
+    with open(wal_path, 'r', encoding='utf-8') as f:
+        for line_number, line in enumerate(f, 1):
+            try:
+                records.append(json.loads(line))
+            except ValueError:
+                logging.warning(f"Skipping torn record at line {line_number} of {wal_path}")
+    return records
+
+# Function to get a record's key. Rows from files written before keys existed
+# get the key the stages would give them: the base name of video_path, or of
+# audio_path without the p_ prefix of preprocessed audio. Returns None if
+# neither path is there.
+def _record_key(record):
+    key = record.get(KEY)
+    if key is not None and key == key and key != '':
+        return key
+    for column, prefix in (('video_path', ''), ('audio_path', 'p_')):
+        path = record.get(column)
+        if isinstance(path, str) and path:
+            name = os.path.splitext(os.path.basename(path))[0]
+            if prefix and name.startswith(prefix):
+                name = name[len(prefix):]
+            return name
+    return None
+
+# Function to merge records by key in first-seen order; later records update
+# the fields of earlier ones. Rows without a key or a path to derive one from
+# are kept as they are.
+def _upsert(rows, records):
+    merged = {}
+    for index, record in enumerate(rows + records):
+        key = _record_key(record)
+        if key is None:
+            key = ('unkeyed', index)
+        else:
+            record = dict(record, **{KEY: key})
+        if key in merged:
+            merged[key].update(record)
+        else:
+            merged[key] = dict(record)
+    return list(merged.values())
+
+# Function to read a dataset with its pending write-ahead log applied. With
+# no pending log this is a plain (column-projected) snapshot read.
+def read_dataset(path, columns=None):
+    records = _read_wal(f"{path}.wal.jsonl")
+    if not records:
+        return _read_snapshot(path, columns)
+    if columns is not None:
+        # Also read the columns that keys of old rows are derived from
+        snapshot_columns = list(dict.fromkeys([KEY, 'video_path', 'audio_path'] + list(columns)))
+    else:
+        snapshot_columns = columns
+    rows = _read_snapshot(path, snapshot_columns).to_dict('records')
+    df = pd.DataFrame(_upsert(rows, records))
+    if columns is not None:
+        df = df.reindex(columns=list(columns))
+    return df
+
+
+# Dataset writer that buffers records and appends them to a JSON-lines
+# write-ahead log one batch at a time, then compacts the log into the
+# snapshot file (Parquet or CSV, by extension) on close. Several processes
+# may write the same dataset; a lock file serializes log appends and
+# compaction.
+class DatasetManifest:
+    def __init__(self, path, batch_size=100):
+        if path.endswith('.parquet'):
+            _parquet()
+        self.path = path
+        self.wal_path = f"{path}.wal.jsonl"
+        self.lock_path = f"{path}.lock"
+        self.batch_size = batch_size
+        self.buffer = []
+        self.lock = threading.Lock()
+        atexit.register(self.close)
+
+    def add(self, record):
+        self.add_many([record])
+
+    def add_many(self, records):
+        for record in records:
+            if not record.get(KEY):
+                raise ValueError(f"Dataset record has no {KEY}: {record}")
+        with self.lock:
+            self.buffer.extend(records)
+            full = len(self.buffer) >= self.batch_size
+        if full:
+            self.flush()
+
+    def _file_lock(self):
+        handle = open(self.lock_path, 'a')
+        fcntl.flock(handle, fcntl.LOCK_EX)
+        return handle
+
+    # Function to append the buffered records to the log in a single write
+    def flush(self):
+        with self.lock:
+            if not self.buffer:
+                return
+            data = ''.join(json.dumps(record, ensure_ascii=False, default=str) + '\n' for record in self.buffer)
+            data = data.encode('utf-8')
+            with self._file_lock():
+                fd = os.open(self.wal_path, os.O_RDWR | os.O_APPEND | os.O_CREAT, 0o644)
+                try:
+                    # Start on a fresh line if a crashed writer left a torn one
+                    size = os.fstat(fd).st_size
+                    if size and os.pread(fd, 1, size - 1) != b'\n':
+                        data = b'\n' + data
+                    while data:
+                        data = data[os.write(fd, data):]
+                    os.fsync(fd)
+                finally:
+                    os.close(fd)
+            self.buffer = []
+
+    # Function to fold the log into the snapshot and remove the log. Without
+    # pending records the snapshot is left alone.
+    def compact(self):
+        self.flush()
+        if not os.path.exists(self.wal_path) or not os.path.getsize(self.wal_path):
+            return
+        with self.lock, self._file_lock():
+            records = _read_wal(self.wal_path)
+            if not records:
+                if os.path.exists(self.wal_path):
+                    os.remove(self.wal_path)
+                return
+            rows = _read_snapshot(self.path).to_dict('records')
+            merged = _upsert(rows, records)
+            _write_snapshot(pd.DataFrame(merged), self.path)
+            os.remove(self.wal_path)
+        logging.info(f"Wrote {len(merged)} rows to {self.path}")
+
+    def close(self):
+        self.compact()
+
+
+_manifests = {}
+_manifests_lock = threading.Lock()
+
+# Function to get the shared writer for a dataset path, so every caller in a
+# process appends through the same buffer
+def get_manifest(path):
+    with _manifests_lock:
+        if path not in _manifests:
+            _manifests[path] = DatasetManifest(path)
+        return _manifests[path]
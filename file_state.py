@@ -0,0 +1,159 @@
+import atexit
+import fcntl
+import hashlib
+import json
+import logging
+import os
+import threading
+import time
+
+# Shared by every script unless FILE_STATE_INDEX points elsewhere
+state_path = os.environ.get('FILE_STATE_INDEX', 'file_state.json')
+
+STATE_VERSION = 1
+
+
+# Function to hash a file in chunks
+def file_sha256(path):
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for block in iter(lambda: f.read(1 << 20), b''):
+            digest.update(block)
+    return digest.hexdigest()
+
+def _stat_entry(path):
+    stat = os.stat(path)
+    return {"size": stat.st_size, "mtime_ns": stat.st_mtime_ns, "sha256": file_sha256(path)}
+
+# Function to tell whether a file is still being written: it counts as
+# settled once its mtime is at least min_age seconds old
+def is_settled(path, min_age=2.0):
+    try:
+        return time.time() - os.stat(path).st_mtime >= min_age
+    except FileNotFoundError:
+        return False
+
+
+# Index of the inputs each stage has processed, stored as JSON. For every
+# (stage, key) it records the size, mtime and hash of the inputs, the
+# parameters used and the outputs produced. A stage asks check() before
+# processing an item and calls record() afterwards. Inputs whose size and
+# mtime are unchanged are not re-hashed; if only the mtime changed, the hash
+# decides. Several scripts may share one index file: save() merges this
+# process's changes into what is on disk under a lock.
+class FileStateIndex:
+    def __init__(self, path=state_path, autosave_every=20):
+        self.path = path
+        self.autosave_every = autosave_every
+        self.lock = threading.Lock()
+        self.stages = self._load().get("stages", {})
+        self.changed = set()
+        atexit.register(self.save)
+
+    def _load(self):
+        try:
+            with open(self.path, 'r', encoding='utf-8') as f:
+                payload = json.load(f)
+        except (OSError, ValueError):
+            return {}
+        if payload.get("version") != STATE_VERSION:
+            return {}
+        return payload
+
+    # Function to return why an item needs processing, or None if its recorded
+    # inputs, parameters and outputs are all still current
+    def check(self, stage, key, inputs, params=None):
+        with self.lock:
+            entry = self.stages.get(stage, {}).get(key)
+        if entry is None:
+            return "new"
+        if entry["params"] != (params or {}):
+            return "parameters changed"
+        if sorted(entry["inputs"]) != sorted(inputs):
+            return "inputs changed"
+        for output in entry["outputs"]:
+            if not os.path.exists(output):
+                return f"output missing: {output}"
+        refreshed = False
+        for path in inputs:
+            recorded = entry["inputs"][path]
+            try:
+                stat = os.stat(path)
+            except FileNotFoundError:
+                return f"input missing: {path}"
+            if stat.st_size != recorded["size"]:
+                return f"modified: {path}"
+            if stat.st_mtime_ns != recorded["mtime_ns"]:
+                if file_sha256(path) != recorded["sha256"]:
+                    return f"modified: {path}"
+                recorded["mtime_ns"] = stat.st_mtime_ns
+                refreshed = True
+        if refreshed:
+            with self.lock:
+                self.changed.add((stage, key))
+        return None
+
+    # Function to record that key was processed from inputs with params. Only
+    # the outputs that exist are recorded, so an output a stage legitimately
+    # skipped (such as an empty transcript) does not force a rerun.
+    def record(self, stage, key, inputs, params=None, outputs=()):
+        entry = {
+            "inputs": {path: _stat_entry(path) for path in inputs},
+            "params": params or {},
+            "outputs": [path for path in outputs if os.path.exists(path)],
+            "recorded_at": time.time(),
+        }
+        with self.lock:
+            self.stages.setdefault(stage, {})[key] = entry
+            self.changed.add((stage, key))
+            due = len(self.changed) >= self.autosave_every
+        if due:
+            self.save()
+
+    # Function to list (key, reason) for every item that needs processing.
+    # items is a list of (key, inputs). With settle_seconds set, inputs still
+    # being written are left for a later pass.
+    def plan(self, stage, items, params=None, settle_seconds=None):
+        pending = []
+        for key, inputs in items:
+            if settle_seconds is not None and not all(is_settled(path, settle_seconds) for path in inputs):
+                continue
+            reason = self.check(stage, key, inputs, params)
+            if reason is not None:
+                pending.append((key, reason))
+        return pending
+
+    def save(self):
+        with self.lock:
+            if not self.changed:
+                return
+            with open(f"{self.path}.lock", 'a') as lock_file:
+                fcntl.flock(lock_file, fcntl.LOCK_EX)
+                stages = self._load().get("stages", {})
+                for stage, key in self.changed:
+                    stages.setdefault(stage, {})[key] = self.stages[stage][key]
+                tmp_path = f"{self.path}.{os.getpid()}.tmp"
+                with open(tmp_path, 'w', encoding='utf-8') as f:
+                    json.dump({"version": STATE_VERSION, "stages": stages}, f, ensure_ascii=False)
+                os.replace(tmp_path, self.path)
+            self.stages = stages
+            self.changed = set()
+
+
+# Function to report what a dry run would recompute, through logging or
+# another output function such as print
+def report_plan(stage, pending, total, log=logging.info):
+    log(f"{stage}: {len(pending)} of {total} items would be processed")
+    for key, reason in pending:
+        log(f"  {key}: {reason}")
+
+# Function to call run_once every interval seconds until interrupted, so
+# newly dropped files are picked up
+def watch(run_once, interval=10.0):
+    logging.info(f"Watching for new files every {interval:.0f}s; press Ctrl+C to stop")
+    try:
+        while True:
+            run_once()
+            time.sleep(interval)
+    except KeyboardInterrupt:
+        logging.info("Stopped watching")
@@ -0,0 +1,219 @@
+import json
+import logging
+import os
+import threading
+from collections import OrderedDict
+from functools import partial
+
+from Levenshtein import distance
+
+from file_state import file_sha256
+
+# Bump when the on-disk layout written by save_index changes
+CACHE_VERSION = 2
+
+
+# Edits covered by the deletion index. Words further than this from every
+# lexicon word are matched by one scan of the whole lexicon instead.
+index_distance = 2
+
+
+# Function to get every string made by deleting up to n characters of word,
+# word itself included
+def _deletes(word, n):
+    found = {word}
+    frontier = {word}
+    for _ in range(n):
+        frontier = {text[:i] + text[i + 1:] for text in frontier for i in range(len(text))}
+        found |= frontier
+    return found
+
+
+# SymSpell-style deletion index over the lexicon words. Each word is filed
+# under every string made by deleting up to max_edits of its characters; two
+# words within max_edits edits of each other share one of those strings, so a
+# lookup only measures the few words that share one with the query. Words
+# keep their lexicon position so ties resolve to the word that comes first in
+# the lexicon, the same choice the brute-force scan makes.
+class DeletionIndex:
+    def __init__(self, words=(), max_edits=index_distance):
+        self.words = list(dict.fromkeys(words))
+        self.max_edits = max_edits
+        self.entries = {}
+        for position, word in enumerate(self.words):
+            for key in _deletes(word, max_edits):
+                entry = self.entries.get(key)
+                # Most keys belong to a single word, stored as a bare position
+                if entry is None:
+                    self.entries[key] = position
+                elif type(entry) is int:
+                    self.entries[key] = [entry, position]
+                else:
+                    entry.append(position)
+
+    # Return (word, distance) of the closest word, or None when nothing lies
+    # within max_distance (None for no limit). Matches within max_edits come
+    # from the index; further ones from a single pass over the lexicon.
+    def nearest(self, word, max_distance=None):
+        if not self.words:
+            return None
+        radius = self.max_edits if max_distance is None else min(max_distance, self.max_edits)
+        match = self._search(word, radius)
+        if match is not None or (max_distance is not None and max_distance <= self.max_edits):
+            return match
+        # min() keeps the first of equally close words
+        best = min(self.words, key=partial(distance, word))
+        d = distance(word, best)
+        if max_distance is not None and d > max_distance:
+            return None
+        return best, d
+
+    # Closest word within radius (at most max_edits), ties going to the
+    # earliest word
+    def _search(self, word, radius):
+        candidates = set()
+        for key in _deletes(word, radius):
+            entry = self.entries.get(key)
+            if entry is None:
+                continue
+            if type(entry) is int:
+                candidates.add(entry)
+            else:
+                candidates.update(entry)
+        best = None
+        for position in sorted(candidates):
+            d = distance(word, self.words[position], score_cutoff=radius)
+            if d <= radius and (best is None or d < best[1]):
+                best = (position, d)
+        return (self.words[best[0]], best[1]) if best is not None else None
+
+
+# Spelling corrector for the lexicon, with an exact-match fast path and a
+# bounded least-recently-used memo of previous answers, so a long run over an
+# open vocabulary cannot grow it without limit. The deletion index is built
+# on the first lookup that needs it, or shared through deletions.
+# source_sha256 identifies the lexicon file the index was built from.
+class LexiconIndex:
+    def __init__(self, lexicon, max_distance=None, deletions=None, cache_size=100000, source_sha256=None):
+        self.lexicon = lexicon
+        self.source_sha256 = source_sha256
+        self.max_distance = max_distance
+        self._deletions = deletions
+        self._build_lock = threading.Lock()
+        self.cache = OrderedDict()
+        self.cache_size = cache_size
+        self.cache_lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    @property
+    def deletions(self):
+        if self._deletions is None:
+            with self._build_lock:
+                if self._deletions is None:
+                    self._deletions = DeletionIndex(self.lexicon)
+        return self._deletions
+
+    # Function to look a misspelled word up in the memo, counting the hit or
+    # miss. Returns None if it is not there.
+    def recall(self, word):
+        with self.cache_lock:
+            cached = self.cache.get(word)
+            if cached is not None:
+                self.cache.move_to_end(word)
+                self.hits += 1
+                return cached
+            self.misses += 1
+        return None
+
+    def correct(self, word):
+        if word in self.lexicon:
+            return word
+        cached = self.recall(word)
+        if cached is not None:
+            return cached
+        match = self.deletions.nearest(word, self.max_distance)
+        corrected = match[0] if match is not None else word
+        self.remember(word, corrected)
+        return corrected
+
+    # Function to store an answer in the memo, such as one computed in a
+    # worker process, evicting the least recently used entries when full
+    def remember(self, word, corrected):
+        with self.cache_lock:
+            self.cache[word] = corrected
+            self.cache.move_to_end(word)
+            while len(self.cache) > self.cache_size:
+                self.cache.popitem(last=False)
+
+
+# Reference implementation: scan the whole lexicon for every token
+def brute_force_correct(word, lexicon):
+    suggestions = [(w, distance(word, w)) for w in lexicon]
+    suggestions = sorted(suggestions, key=lambda x: x[1])
+    return suggestions[0][0] if suggestions else word
+
+
+# Function to write the parsed lexicon to cache_path, in lexicon order. The
+# file is written next to the target and renamed into place, so concurrent
+# workers never read a half-written cache.
+def save_index(index, cache_path, source_path):
+    stat = os.stat(source_path)
+    payload = {
+        "version": CACHE_VERSION,
+        "source": {
+            "path": os.path.abspath(source_path),
+            "size": stat.st_size,
+            "mtime_ns": stat.st_mtime_ns,
+            "sha256": index.source_sha256 or file_sha256(source_path),
+        },
+        "lexicon": list(index.lexicon.items()),
+    }
+    _write_json_atomic(cache_path, payload)
+
+def _write_json_atomic(path, payload):
+    tmp_path = f"{path}.{os.getpid()}.tmp"
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        json.dump(payload, f, ensure_ascii=False, separators=(',', ':'))
+    os.replace(tmp_path, path)
+
+def _read_cache(cache_path):
+    try:
+        with open(cache_path, 'r', encoding='utf-8') as f:
+            payload = json.load(f)
+    except (OSError, ValueError):
+        return None
+    if payload.get("version") != CACHE_VERSION:
+        return None
+    return payload
+
+# Check the cached fingerprint against the source file. A changed mtime with
+# the same size falls back to the content hash, so touching the file does not
+# force a rebuild.
+def _cache_is_fresh(payload, cache_path, source_path):
+    source = payload["source"]
+    stat = os.stat(source_path)
+    if source["size"] != stat.st_size:
+        return False
+    if source["mtime_ns"] == stat.st_mtime_ns:
+        return True
+    if file_sha256(source_path) != source["sha256"]:
+        return False
+    source["mtime_ns"] = stat.st_mtime_ns
+    _write_json_atomic(cache_path, payload)
+    return True
+
+# Function to load the compiled lexicon index from cache_path, rebuilding it
+# with parse(source_path) when the cache is missing or stale
+def load_or_build_index(source_path, cache_path, parse, max_distance=None):
+    payload = _read_cache(cache_path)
+    if payload is not None and _cache_is_fresh(payload, cache_path, source_path):
+        index = LexiconIndex(dict(payload["lexicon"]), max_distance, source_sha256=payload["source"]["sha256"])
+        logging.info(f"Loaded lexicon index ({len(index.lexicon)} words) from {cache_path}")
+        return index
+
+    logging.info(f"Building lexicon index from {source_path}")
+    index = LexiconIndex(parse(source_path), max_distance, source_sha256=file_sha256(source_path))
+    save_index(index, cache_path, source_path)
+    logging.info(f"Saved lexicon index ({len(index.lexicon)} words) to {cache_path}")
+    return index
@@ -0,0 +1,116 @@
+import argparse
+import logging
+import os
+import subprocess
+import sys
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+from moviepy.config import get_setting
+
+from file_state import FileStateIndex, report_plan
+from profiling import report, stage
+
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+
+# Folders the annotation app serves from (see app.py)
+video_folder = 'static/preprocessvideo'
+poster_folder = 'static/posters'
+preview_folder = 'static/previews'
+
+# Poster and preview settings
+thumbnail_width = 320
+preview_seconds = 3
+preview_crf = 30
+
+
+# Function to write a poster JPEG for a clip. ffmpeg's thumbnail filter picks
+# the most representative of the first frames, so very short clips work too.
+def make_poster(video_path, poster_path, width=thumbnail_width):
+    subprocess.run([get_setting("FFMPEG_BINARY"), '-y', '-v', 'error', '-i', video_path,
+                    '-vf', f'thumbnail=50,scale={width}:-2', '-frames:v', '1', '-q:v', '4', poster_path],
+                   check=True, capture_output=True)
+
+# Function to write a short, small, silent MP4 preview of a clip, with the
+# index at the front so browsers can start playing it straight away
+def make_preview(video_path, preview_path, width=thumbnail_width, seconds=preview_seconds, crf=preview_crf):
+    subprocess.run([get_setting("FFMPEG_BINARY"), '-y', '-v', 'error', '-i', video_path, '-t', str(seconds),
+                    '-vf', f'scale={width}:-2', '-an', '-c:v', 'libx264', '-preset', 'veryfast', '-crf', str(crf),
+                    '-pix_fmt', 'yuv420p', '-movflags', '+faststart', preview_path],
+                   check=True, capture_output=True)
+
+# Function to build the poster and preview for one clip; outputs are written
+# to temporary names first so the app never serves a half-written file
+def process_clip(video_path, poster_path, preview_path):
+    with stage('media_previews', items=1, video=video_path) as record:
+        try:
+            for make, path in ((make_poster, poster_path), (make_preview, preview_path)):
+                root, ext = os.path.splitext(path)
+                tmp_path = f"{root}.tmp{ext}"
+                make(video_path, tmp_path)
+                os.replace(tmp_path, path)
+            return None
+        except (OSError, subprocess.CalledProcessError) as e:
+            record.ok = False
+            return getattr(e, 'stderr', b'').decode(errors='replace').strip() or str(e)
+
+# Stage name recorded in the file-state index
+STAGE = 'media_previews'
+
+def stage_params():
+    return {"width": thumbnail_width, "preview_seconds": preview_seconds, "crf": preview_crf}
+
+# Build posters and previews for the clips in video_dir that are new or
+# changed since they were last processed. Returns the names of the clips that
+# failed. With dry_run, only report what would be processed.
+def run(video_dir=video_folder, poster_dir=poster_folder, preview_dir=preview_folder, workers=None, state=None,
+        dry_run=False):
+    os.makedirs(poster_dir, exist_ok=True)
+    os.makedirs(preview_dir, exist_ok=True)
+
+    state = state or FileStateIndex()
+    params = stage_params()
+    video_files = sorted(f for f in os.listdir(video_dir) if f.endswith('.mp4'))
+    pending = state.plan(STAGE, [(f, [os.path.join(video_dir, f)]) for f in video_files], params)
+    if dry_run:
+        report_plan(STAGE, pending, len(video_files))
+        return []
+
+    failed = []
+    # ffmpeg does the work, so threads are enough to keep several encodes busy
+    with ThreadPoolExecutor(max_workers=workers or os.cpu_count()) as pool:
+        futures = {}
+        for video_file, reason in pending:
+            name = os.path.splitext(video_file)[0]
+            paths = (os.path.join(video_dir, video_file), os.path.join(poster_dir, f"{name}.jpg"),
+                     os.path.join(preview_dir, f"{name}.mp4"))
+            futures[pool.submit(process_clip, *paths)] = (video_file, paths)
+        for future in as_completed(futures):
+            video_file, (video_path, poster_path, preview_path) = futures[future]
+            error = future.result()
+            if error is None:
+                logging.info(f"Saved poster and preview for {video_file}")
+                state.record(STAGE, video_file, [video_path], params, [poster_path, preview_path])
+            else:
+                logging.error(f"Error building previews for {video_file}: {error}")
+                failed.append(video_file)
+
+    state.save()
+    return failed
+
+def main():
+    parser = argparse.ArgumentParser(description="Pregenerate poster images and short previews for every clip")
+    parser.add_argument("--videos", default=video_folder, help="folder of clips served by the app")
+    parser.add_argument("--posters", default=poster_folder, help="folder for poster images")
+    parser.add_argument("--previews", default=preview_folder, help="folder for preview clips")
+    parser.add_argument("--workers", type=int, help="number of concurrent ffmpeg encodes")
+    parser.add_argument("--dry-run", action="store_true", help="only report which clips would be processed")
+    args = parser.parse_args()
+
+    failed = run(args.videos, args.posters, args.previews, args.workers, dry_run=args.dry_run)
+    if not args.dry_run:
+        report()
+    if failed:
+        sys.exit(1)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,259 @@
+import atexit
+import cProfile
+import glob
+import json
+import logging
+import os
+import resource
+import threading
+import time
+from contextlib import contextmanager
+
+# Directory for per-stage cProfile dumps (inspect with pstats or snakeviz);
+# profiling is off unless PROFILE_CPROFILE is set
+cprofile_dir = os.environ.get('PROFILE_CPROFILE')
+# Shared with worker processes through the environment, so the end-of-run
+# summary can include the stages they ran
+run_id = os.environ.setdefault('PROFILE_RUN_ID', f"{time.strftime('%Y%m%dT%H%M%S')}-{os.getpid()}")
+# Stage records are appended as JSON lines to one file per run in
+# metrics_dir, and only the newest metrics_keep_runs files are kept.
+# PROFILE_METRICS names a single file to use instead; set either variable to
+# an empty string to keep records in memory only.
+metrics_dir = os.environ.get('PROFILE_METRICS_DIR', os.path.join(os.path.expanduser('~'), '.cache', 'profile_metrics'))
+metrics_keep_runs = 50
+metrics_path = os.environ.get('PROFILE_METRICS', os.path.join(metrics_dir, f"{run_id}.jsonl") if metrics_dir else '')
+
+_records = []
+_tallies = {}
+_lock = threading.Lock()
+_local = threading.local()
+_profile_count = 0
+
+# Per-thread I/O counters where the kernel provides them, so concurrent
+# stages in other threads are not counted
+_io_path = '/proc/thread-self/io' if os.path.exists('/proc/thread-self/io') else '/proc/self/io'
+
+
+# Function to read (bytes read, bytes written) for this thread, including
+# page-cache hits; falls back to block counts where /proc is unavailable
+def _io_bytes():
+    try:
+        with open(_io_path, 'r') as f:
+            counters = dict(line.split(': ') for line in f.read().splitlines())
+        return int(counters['rchar']), int(counters['wchar'])
+    except OSError:
+        usage = resource.getrusage(resource.RUSAGE_SELF)
+        return usage.ru_inblock * 512, usage.ru_oublock * 512
+
+# Function to take a (wall time, bytes read, bytes written) snapshot covering
+# this process and its reaped children, for comparing tools that do their
+# reading in ffmpeg subprocesses. Block counts only include reads that missed
+# the page cache.
+def io_snapshot():
+    usage = resource.getrusage(resource.RUSAGE_CHILDREN)
+    own = resource.getrusage(resource.RUSAGE_SELF)
+    return (time.perf_counter(),
+            (usage.ru_inblock + own.ru_inblock) * 512,
+            (usage.ru_oublock + own.ru_oublock) * 512)
+
+def _snapshot(process_cpu=False):
+    children = resource.getrusage(resource.RUSAGE_CHILDREN)
+    read_bytes, write_bytes = _io_bytes()
+    return {
+        "wall": time.perf_counter(),
+        "cpu": time.process_time() if process_cpu else time.thread_time(),
+        "child_cpu": children.ru_utime + children.ru_stime,
+        "read": read_bytes,
+        "write": write_bytes,
+        "child_read": children.ru_inblock * 512,
+        "child_write": children.ru_oublock * 512,
+    }
+
+# Function to delete all but the newest metrics_keep_runs run files, called
+# by the first process of a run to write
+def _prune_metrics_dir():
+    runs = sorted(glob.glob(os.path.join(metrics_dir, '*.jsonl')), key=os.path.getmtime)
+    for path in runs[:max(len(runs) - metrics_keep_runs, 0)]:
+        try:
+            os.remove(path)
+        except OSError:
+            pass
+
+# Function to store one record in memory and append it to the metrics file
+def emit(record):
+    record = dict(record, run=run_id, pid=os.getpid(), ts=time.time())
+    with _lock:
+        _records.append(record)
+        if metrics_path:
+            new_run = not os.path.exists(metrics_path)
+            if new_run:
+                os.makedirs(os.path.dirname(metrics_path) or '.', exist_ok=True)
+            with open(metrics_path, 'a', encoding='utf-8') as f:
+                f.write(json.dumps(record, ensure_ascii=False, default=str) + '\n')
+            if new_run and metrics_dir and os.path.dirname(metrics_path) == metrics_dir:
+                _prune_metrics_dir()
+
+# Counters a stage body can update while it runs
+class StageRecord:
+    def __init__(self, name, labels):
+        self.name = name
+        self.labels = labels
+        self.items = 0
+        self.ok = True
+        # Filled with the emitted figures when the stage ends
+        self.metrics = None
+
+
+# Context manager that measures one stage: wall and CPU time of this thread,
+# CPU time of finished child processes (ffmpeg), bytes read and written,
+# items per second and the process's peak RSS. Set .items on the yielded
+# record to report throughput. Child process figures are process-wide, so
+# they can include children of stages running in other threads. With
+# process_cpu, CPU time covers every thread of the process, for stages that
+# do their work in helper threads.
+@contextmanager
+def stage(name, items=0, process_cpu=False, **labels):
+    global _profile_count
+    record = StageRecord(name, labels)
+    record.items = items
+    profiler = None
+    if cprofile_dir and not getattr(_local, 'profiling', False):
+        profiler = cProfile.Profile()
+        _local.profiling = True
+        profiler.enable()
+    start = _snapshot(process_cpu)
+    try:
+        yield record
+    except BaseException:
+        record.ok = False
+        raise
+    finally:
+        end = _snapshot(process_cpu)
+        if profiler is not None:
+            profiler.disable()
+            _local.profiling = False
+            os.makedirs(cprofile_dir, exist_ok=True)
+            with _lock:
+                _profile_count += 1
+                count = _profile_count
+            profiler.dump_stats(os.path.join(cprofile_dir, f"{name}.{os.getpid()}.{count}.prof"))
+        wall = end["wall"] - start["wall"]
+        record.metrics = dict(
+            labels,
+            stage=name,
+            ok=record.ok,
+            wall_s=wall,
+            cpu_s=end["cpu"] - start["cpu"],
+            child_cpu_s=end["child_cpu"] - start["child_cpu"],
+            read_bytes=end["read"] - start["read"],
+            write_bytes=end["write"] - start["write"],
+            child_read_bytes=end["child_read"] - start["child_read"],
+            child_write_bytes=end["child_write"] - start["child_write"],
+            items=record.items,
+            items_per_s=record.items / wall if wall > 0 else None,
+            peak_rss_bytes=resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024,
+        )
+        emit(record.metrics)
+
+# Context manager for stages that run once per small item, such as
+# correcting one transcript, where a full stage record per call would cost
+# more than the work. Only wall and thread CPU time are measured, and the
+# calls are summed into one record per stage (items and any numeric labels
+# too), emitted by flush_tallies() when the run is reported or the process
+# exits.
+@contextmanager
+def tally(name, items=0, **counts):
+    record = StageRecord(name, counts)
+    record.items = items
+    start_wall, start_cpu = time.perf_counter(), time.thread_time()
+    try:
+        yield record
+    except BaseException:
+        record.ok = False
+        raise
+    finally:
+        wall, cpu = time.perf_counter() - start_wall, time.thread_time() - start_cpu
+        with _lock:
+            total = _tallies.setdefault(name, {"stage": name, "calls": 0, "failed": 0, "wall_s": 0.0, "cpu_s": 0.0,
+                                               "items": 0})
+            total["calls"] += 1
+            total["failed"] += 0 if record.ok else 1
+            total["wall_s"] += wall
+            total["cpu_s"] += cpu
+            total["items"] += record.items
+            for key, value in counts.items():
+                total[key] = total.get(key, 0) + value
+
+# Function to emit the summed tally() records and start new totals
+def flush_tallies():
+    global _tallies
+    with _lock:
+        tallies, _tallies = _tallies, {}
+    for total in tallies.values():
+        emit(dict(total, ok=not total["failed"],
+                  items_per_s=total["items"] / total["wall_s"] if total["wall_s"] > 0 else None))
+
+atexit.register(flush_tallies)
+
+# Function to load this run's records: from the metrics file when there is
+# one, which includes worker processes, otherwise from memory
+def run_records():
+    if not metrics_path or not os.path.exists(metrics_path):
+        with _lock:
+            return list(_records)
+    records = []
+    with open(metrics_path, 'r', encoding='utf-8') as f:
+        for line in f:
+            try:
+                record = json.loads(line)
+            except ValueError:
+                continue
+            if record.get("run") == run_id:
+                records.append(record)
+    return records
+
+# Function to total this run's records per stage
+def summarize(records):
+    totals = {}
+    for record in records:
+        if "stage" not in record:
+            continue
+        total = totals.setdefault(record["stage"], {
+            "calls": 0, "failed": 0, "wall_s": 0.0, "cpu_s": 0.0, "child_cpu_s": 0.0, "items": 0,
+            "read_bytes": 0, "write_bytes": 0, "child_read_bytes": 0, "child_write_bytes": 0, "peak_rss_bytes": 0,
+            "measured": False})
+        # Records from tally() stand for several calls
+        total["calls"] += record.get("calls", 1)
+        # Records from stage() carry CPU, I/O and memory figures; ones passed
+        # straight to emit() may only have wall time and items
+        total["measured"] = total["measured"] or "read_bytes" in record
+        total["failed"] += record.get("failed", 0 if record.get("ok", True) else 1)
+        for field in ("wall_s", "cpu_s", "child_cpu_s", "items", "read_bytes", "write_bytes",
+                      "child_read_bytes", "child_write_bytes"):
+            total[field] += record.get(field) or 0
+        total["peak_rss_bytes"] = max(total["peak_rss_bytes"], record.get("peak_rss_bytes") or 0)
+    for total in totals.values():
+        total["items_per_s"] = total["items"] / total["wall_s"] if total["wall_s"] else None
+    return totals
+
+# Function to report per-stage totals for this run, slowest stage first,
+# through logging or another output function such as print
+def report(log=logging.info):
+    flush_tallies()
+    totals = summarize(run_records())
+    if not totals:
+        return totals
+    log(f"Stage summary for run {run_id}:")
+    for name, total in sorted(totals.items(), key=lambda item: -item[1]["wall_s"]):
+        rate = f", {total['items_per_s']:.1f} items/s" if total["items_per_s"] else ""
+        failed = f", {total['failed']} failed" if total["failed"] else ""
+        line = f"  {name}: {total['calls']} calls{failed}, {total['wall_s']:.2f}s wall"
+        if total["measured"]:
+            line += (f", {total['cpu_s']:.2f}s cpu (+{total['child_cpu_s']:.2f}s in subprocesses), "
+                     f"{(total['read_bytes'] + total['child_read_bytes']) / 1e6:.1f} MB read, "
+                     f"{(total['write_bytes'] + total['child_write_bytes']) / 1e6:.1f} MB written, "
+                     f"peak RSS {total['peak_rss_bytes'] / 1e6:.0f} MB")
+        elif total["cpu_s"]:
+            line += f", {total['cpu_s']:.2f}s cpu"
+        log(f"{line}, {total['items']} items{rate}")
+    return totals
@@ -0,0 +1,8 @@
+import os
+import sys
+
+# The scripts live at the repository root rather than in a package
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+# Keep stage records from test runs in memory
+os.environ.setdefault('PROFILE_METRICS', '')
@@ -0,0 +1,32 @@
+import wave
+
+import numpy as np
+import pandas as pd
+
+import adotxtpre
+from file_state import FileStateIndex
+from lexicon_index import LexiconIndex
+
+
+def test_failed_audio_is_retried_and_kept_out_of_the_dataset(tmp_path, monkeypatch):
+    monkeypatch.setattr(adotxtpre, 'lexicon_index', LexiconIndex({'வணக்கம்': 'hello'}))
+    audio, text = tmp_path / 'audio', tmp_path / 'text'
+    audio.mkdir()
+    text.mkdir()
+    with wave.open(str(audio / 'good.wav'), 'wb') as w:
+        w.setnchannels(1)
+        w.setsampwidth(2)
+        w.setframerate(16000)
+        w.writeframes((np.random.default_rng(0).normal(0, 3000, 16000)).astype('<i2').tobytes())
+    (audio / 'bad.wav').write_bytes(b'RIFF not really a wave file')
+    for name in ('good', 'bad'):
+        (text / f"{name}.txt").write_text('வணக்கம்', encoding='utf-8')
+
+    csv_path = str(tmp_path / 'dataset.csv')
+    state = FileStateIndex(str(tmp_path / 'state.json'))
+    args = (str(audio), str(text), str(tmp_path / 'p_audio'), str(tmp_path / 'p_text'), csv_path, state)
+    adotxtpre.process_files(*args)
+
+    assert pd.read_csv(csv_path)['clip_id'].tolist() == ['good']
+    items = [(name, [str(audio / f"{name}.wav"), str(text / f"{name}.txt")]) for name in ('bad', 'good')]
+    assert [key for key, _ in state.plan(adotxtpre.STAGE, items, adotxtpre.stage_params())] == ['bad']
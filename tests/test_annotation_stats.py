@@ -0,0 +1,58 @@
+import random
+
+import numpy as np
+import pytest
+
+from annotation_stats import EMOTIONS, AgreementStats, fleiss_kappa, krippendorff_alpha_nominal
+
+
+def random_votes(rng, count, clips, categories):
+    votes = []
+    for _ in range(count):
+        rating = rng.choice([None, '', 'n/a', '0', str(rng.randint(1, 5))])
+        votes.append((f"clip{rng.randrange(clips)}", rng.choice(categories), rating))
+    return votes
+
+
+@pytest.mark.parametrize('seed', range(20))
+def test_running_totals_match_count_matrix(seed):
+    rng = random.Random(seed)
+    # Some votes use an emotion outside EMOTIONS, which adds a column
+    categories = EMOTIONS + ['Neutral'] if seed % 2 else EMOTIONS
+    stats = AgreementStats(capacity=4)
+    votes = random_votes(rng, rng.randint(1, 400), rng.randint(1, 60), categories)
+    # Mix single votes and batches, as the app and a reload do
+    position = 0
+    while position < len(votes):
+        size = rng.choice([1, 1, 5, 50])
+        if size == 1:
+            stats.add(*votes[position])
+        else:
+            stats.add_many(votes[position:position + size])
+        position += size
+
+    counts = np.zeros((len(stats.clips), len(stats.categories)), dtype=np.int64)
+    for media_name, emotion, _ in votes:
+        counts[stats.clips.index(media_name), stats.categories.index(emotion)] += 1
+    assert (stats.counts[:len(stats.clips)] == counts).all()
+
+    agreement = stats.agreement()
+    assert agreement["votes"] == len(votes)
+    for key, expected in (("fleiss_kappa", fleiss_kappa(counts)),
+                          ("krippendorff_alpha", krippendorff_alpha_nominal(counts))):
+        if expected is None:
+            assert agreement[key] is None
+        else:
+            assert agreement[key] == pytest.approx(expected, abs=1e-9)
+
+def test_mean_rating_ignores_votes_without_rating():
+    stats = AgreementStats()
+    stats.add_many([('clip1', 'Anger', '4'), ('clip1', 'Anger', None), ('clip1', 'Anger', '2'),
+                    ('clip1', 'Fear', 'n/a'), ('clip1', 'Fear', '')])
+    clip = stats.clip('clip1')
+    assert clip["mean_rating"]["Anger"] == 3.0
+    assert clip["mean_rating"]["Fear"] is None
+    assert clip["mean_rating"]["Sadness"] is None
+    # Unrated votes still count with weight 1 towards the consensus
+    assert clip["consensus"] == 'Anger'
+    assert clip["consensus_share"] == pytest.approx(7 / 9)
@@ -0,0 +1,21 @@
+import clip_pipeline
+from transcribe import RetryQueue
+
+
+def test_run_continues_after_a_clip_raises(tmp_path, monkeypatch):
+    videos = tmp_path / 'videos'
+    videos.mkdir()
+    for name in ('bad', 'good'):
+        (videos / f"{name}.mp4").write_bytes(b'')
+
+    def process_clip(video_path, *args):
+        if 'bad' in video_path:
+            raise ValueError("corrupt stream")
+        return {"clip_id": "good", "video_path": video_path, "extracted_text": "சரி"}
+
+    monkeypatch.setattr(clip_pipeline, 'process_clip', process_clip)
+    queue = RetryQueue(str(tmp_path / 'queue.jsonl'))
+    folders = [str(tmp_path / name) for name in ('audio', 'text', 'paudio', 'ptext')]
+    processed = clip_pipeline.run(str(videos), *folders, str(tmp_path / 'dataset.csv'), workers=2, retry_queue=queue)
+    assert processed == 1
+    assert [entry['audio_path'] for entry in queue.entries()] == [str(videos / 'bad.mp4')]
@@ -0,0 +1,38 @@
+import os
+
+import pandas as pd
+
+from dataset_manifest import DatasetManifest, read_dataset
+
+
+def test_rows_without_clip_id_are_updated_not_duplicated(tmp_path):
+    path = str(tmp_path / 'dataset.csv')
+    pd.DataFrame([
+        {"video_path": "videos/video1.mp4", "audio_path": "audio/video1.wav", "extracted_text": "old"},
+        {"audio_path": "preprocessaudi/p_video2.wav", "preprocessed_text": "old"},
+        {"extracted_text": "no paths"},
+    ]).to_csv(path, index=False)
+
+    manifest = DatasetManifest(path)
+    manifest.add({"clip_id": "video1", "video_path": "videos/video1.mp4", "extracted_text": "new"})
+    manifest.add({"clip_id": "video2", "audio_path": "preprocessaudi/p_video2.wav", "preprocessed_text": "new"})
+    manifest.flush()
+    pending = read_dataset(path, columns=["clip_id", "extracted_text"])
+    manifest.close()
+
+    df = read_dataset(path)
+    assert len(df) == 3
+    assert df.set_index('clip_id').loc['video1', 'extracted_text'] == 'new'
+    assert df.set_index('clip_id').loc['video2', 'preprocessed_text'] == 'new'
+    assert pending.fillna('').values.tolist() == df[["clip_id", "extracted_text"]].values.tolist()
+
+def test_close_without_records_leaves_snapshot_alone(tmp_path):
+    path = str(tmp_path / 'dataset.csv')
+    manifest = DatasetManifest(path)
+    manifest.add({"clip_id": "video1", "extracted_text": "சரி"})
+    manifest.close()
+    mtime = os.stat(path).st_mtime_ns
+    open(f"{path}.wal.jsonl", 'w').close()
+    manifest.close()
+    DatasetManifest(path).close()
+    assert os.stat(path).st_mtime_ns == mtime
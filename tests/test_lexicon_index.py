@@ -0,0 +1,53 @@
+import random
+
+import pytest
+from Levenshtein import distance
+
+from lexicon_index import LexiconIndex, brute_force_correct
+
+# A small alphabet with Tamil letters and signs, so random words are often
+# equally close to several lexicon words
+ALPHABET = ['க', 'ம', 'ா', 'ி', 'ட', 'ு']
+
+
+def random_word(rng, low, high):
+    return ''.join(rng.choice(ALPHABET) for _ in range(rng.randint(low, high)))
+
+
+@pytest.mark.parametrize('seed', range(5))
+def test_correct_matches_brute_force(seed):
+    rng = random.Random(seed)
+    lexicon = {random_word(rng, 2, 6): 'meaning' for _ in range(400)}
+    index = LexiconIndex(lexicon)
+    words = list(lexicon)
+    tokens = [random_word(rng, 1, 7) for _ in range(300)]
+    # Far from every lexicon word, beyond what the deletion index covers
+    tokens += [random_word(rng, 10, 14) for _ in range(50)]
+    # Lexicon words with one or two characters changed
+    for word in rng.sample(words, 100):
+        chars = list(word)
+        for _ in range(rng.randint(1, 2)):
+            chars[rng.randrange(len(chars))] = rng.choice(ALPHABET)
+        tokens.append(''.join(chars))
+    for token in tokens:
+        assert index.correct(token) == brute_force_correct(token, lexicon), token
+
+def test_ties_go_to_the_earliest_word():
+    lexicon = {'கமா': '', 'கமி': '', 'டமா': ''}
+    assert LexiconIndex(lexicon).correct('கமு') == 'கமா'
+    lexicon = {'கமி': '', 'கமா': '', 'டமா': ''}
+    assert LexiconIndex(lexicon).correct('கமு') == 'கமி'
+    # The same holds past the indexed distance
+    lexicon = {'டடடட': '', 'மமமம': ''}
+    assert LexiconIndex(lexicon).correct('கககக') == 'டடடட'
+
+@pytest.mark.parametrize('max_distance', [0, 1, 2, 3])
+def test_max_distance_is_respected(max_distance):
+    rng = random.Random(max_distance)
+    lexicon = {random_word(rng, 2, 6): 'meaning' for _ in range(300)}
+    index = LexiconIndex(lexicon, max_distance)
+    for _ in range(300):
+        token = random_word(rng, 1, 9)
+        nearest = brute_force_correct(token, lexicon)
+        expected = nearest if distance(token, nearest) <= max_distance else token
+        assert index.correct(token) == expected, token
@@ -0,0 +1,118 @@
+import threading
+import time
+import wave
+
+import numpy as np
+import pytest
+import speech_recognition as sr
+
+from transcribe import (FakeRecognizerServer, GoogleRecognizerBackend, RecognitionExecutor, RetryQueue,
+                        RetryingBackend, StubRecognizerBackend, iter_sample_chunks, iter_wav_chunks,
+                        samples_audio_data, transcribe_chunked, transcribe_samples, transcribe_whole)
+
+RATE = 16000
+
+
+# Function to write int16 samples of shape (frames, channels) as a WAV file
+def write_wav(path, samples, rate=RATE):
+    with wave.open(str(path), 'wb') as w:
+        w.setnchannels(samples.shape[1])
+        w.setsampwidth(2)
+        w.setframerate(rate)
+        w.writeframes(samples.tobytes())
+    return str(path)
+
+# Function to make loud stereo noise with a fifth of a second of near silence
+# at each of the quiet times (in seconds)
+def speech_like(seconds, quiet=(), rate=RATE, seed=0):
+    rng = np.random.default_rng(seed)
+    samples = rng.integers(-20000, 20000, size=(int(seconds * rate), 2)).astype(np.int16)
+    for at in quiet:
+        samples[at * rate:at * rate + rate // 5] //= 200
+    return samples
+
+
+def test_mono_mix_matches_audio_file(tmp_path):
+    samples = speech_like(2)
+    samples[:10] = 32767  # the mix must clip, not wrap
+    path = write_wav(tmp_path / 'clip.wav', samples)
+    with sr.AudioFile(path) as source:
+        expected = sr.Recognizer().record(source).get_raw_data()
+    assert samples_audio_data(samples, RATE).get_raw_data() == expected
+    (_, _, audio_data), = iter_wav_chunks(path)
+    assert audio_data.get_raw_data() == expected
+
+def test_sample_chunks_cut_like_wav_chunks(tmp_path):
+    samples = speech_like(75, quiet=(27, 56))
+    path = write_wav(tmp_path / 'long.wav', samples)
+    from_file = [(start, end) for start, end, _ in iter_wav_chunks(path, silence_rms=500)]
+    from_samples = [(start, end) for start, end, _ in iter_sample_chunks(samples, RATE, silence_rms=500)]
+    assert from_file == from_samples
+    # Both cuts moved into the quiet stretches
+    cuts = [end for _, end in from_file[:-1]]
+    assert len(cuts) == 2 and 27 < cuts[0] < 27.2 and 56 < cuts[1] < 56.2
+
+
+def test_stub_backend_whole_and_chunked(tmp_path):
+    backend = StubRecognizerBackend(respond=lambda audio: f"{len(audio.get_raw_data()) // 2 // RATE} நொடி")
+    short = write_wav(tmp_path / 'short.wav', speech_like(5))
+    assert transcribe_whole(short, backend)['alternative'][0]['transcript'] == '5 நொடி'
+
+    long = write_wav(tmp_path / 'long.wav', speech_like(75))
+    segments = transcribe_chunked(long, backend, max_workers=2)
+    assert [segment['start'] for segment in segments] == [0.0, 29.0, 58.0]
+    assert [segment['text'] for segment in segments] == ['30 நொடி', '30 நொடி', '17 நொடி']
+
+def test_stub_backend_empty_text(tmp_path):
+    segments = transcribe_samples(speech_like(65), RATE, 'silent', StubRecognizerBackend())
+    assert segments and all(segment['text'] == '' for segment in segments)
+
+
+def test_fake_server(tmp_path):
+    path = write_wav(tmp_path / 'clip.wav', speech_like(3))
+    with FakeRecognizerServer(text='வணக்கம்') as server:
+        backend = GoogleRecognizerBackend(endpoint=server.endpoint)
+        assert transcribe_whole(path, backend)['alternative'][0]['transcript'] == 'வணக்கம்'
+        segments = transcribe_samples(speech_like(70), RATE, 'long', backend)
+        assert [segment['text'] for segment in segments] == ['வணக்கம்'] * len(segments)
+        assert server.requests == 1 + len(segments)
+
+def test_fake_server_failures_are_retried(tmp_path):
+    path = write_wav(tmp_path / 'clip.wav', speech_like(3))
+    with FakeRecognizerServer(failure_rate=1.0) as server:
+        backend = RetryingBackend(GoogleRecognizerBackend(endpoint=server.endpoint), retries=2, backoff=0.01)
+        with pytest.raises(sr.RequestError):
+            transcribe_whole(path, backend)
+        assert server.requests == 3
+        assert backend.metrics()['retries'] == 2 and backend.metrics()['failures'] == 1
+
+def test_retry_limits_are_shared(tmp_path):
+    slots = threading.BoundedSemaphore(2)
+    running, peak, lock = [0], [0], threading.Lock()
+
+    def respond(audio):
+        with lock:
+            running[0] += 1
+            peak[0] = max(peak[0], running[0])
+        time.sleep(0.01)
+        with lock:
+            running[0] -= 1
+        return 'சரி'
+
+    backends = [RetryingBackend(StubRecognizerBackend(respond=respond), limits=(slots, None)) for _ in range(3)]
+    with RecognitionExecutor(6) as pool:
+        futures = [pool.submit(transcribe_samples, speech_like(65), RATE, f"clip{i}", backends[i % 3], max_workers=4)
+                   for i in range(6)]
+        assert all(segment['text'] == 'சரி' for future in futures for segment in future.result())
+    assert peak[0] == 2
+
+def test_retry_queue_keeps_one_entry_per_clip(tmp_path):
+    queue = RetryQueue(str(tmp_path / 'queue.jsonl'))
+    queue.add('a.wav', 'timeout')
+    queue.add('b.wav', 'timeout')
+    queue.add('a.wav', 'server error')
+    assert [(e['audio_path'], e['error'], e['attempts']) for e in queue.entries()] == [
+        ('a.wav', 'server error', 2), ('b.wav', 'timeout', 1)]
+    queue.discard('a.wav')
+    queue.discard('missing.wav')
+    assert [e['audio_path'] for e in queue.entries()] == ['b.wav']
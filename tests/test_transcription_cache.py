@@ -0,0 +1,31 @@
+import os
+
+from transcription_cache import TranscriptionCache
+
+
+def disk_bytes(cache):
+    return sum(entry.stat().st_size for entry in cache._entries())
+
+
+def test_overwrite_counts_size_once(tmp_path):
+    cache = TranscriptionCache(str(tmp_path), max_bytes=10 ** 6)
+    for _ in range(5):
+        cache.put('ab' * 32, {"result": {"alternative": [{"transcript": "வணக்கம்"}]}})
+    assert cache.size == disk_bytes(cache)
+    assert cache.stats()["evictions"] == 0
+
+def test_eviction_frees_down_to_low_water(tmp_path, monkeypatch):
+    cache = TranscriptionCache(str(tmp_path), max_bytes=10000, low_water=0.5)
+    scans = []
+    evict = cache.evict
+    monkeypatch.setattr(cache, 'evict', lambda: scans.append(1) or evict())
+    entry = {"result": "x" * 90}
+    keys = [f"{i:064x}" for i in range(300)]
+    for i, key in enumerate(keys):
+        cache.put(key, entry)
+        os.utime(cache._entry_path(key), (i, i))
+    assert cache.size == disk_bytes(cache) <= cache.max_bytes
+    # Each eviction makes room for many puts instead of one
+    assert 0 < len(scans) < 10
+    # The oldest entries went first
+    assert cache.get(keys[0]) is None and cache.get(keys[-1]) == entry
@@ -0,0 +1,25 @@
+import cv2
+import numpy as np
+
+import vdopre
+
+
+class FixedFaces:
+    def detectMultiScale(self, gray_frame, **kwargs):
+        return np.array([[10, 10, 30, 30]])
+
+
+def test_keyframes_are_stored_without_face_boxes(tmp_path, monkeypatch):
+    monkeypatch.setattr(vdopre, 'face_cascade', FixedFaces())
+    writer = cv2.VideoWriter(str(tmp_path / 'in.mp4'), cv2.VideoWriter_fourcc(*'mp4v'), 10, (96, 64))
+    for i in range(30):
+        writer.write(np.full((64, 96, 3), 100 + i, np.uint8))
+    writer.release()
+
+    vdopre.preprocess_video(str(tmp_path / 'in.mp4'), str(tmp_path / 'out.mp4'),
+                            keyframe_folder=str(tmp_path / 'keyframes'))
+
+    frames, index = vdopre.load_keyframes(str(tmp_path / 'keyframes'), 'out')
+    assert len(frames) == 3
+    assert index['boxes'].tolist() == [[10, 10, 30, 30]] * 3
+    assert not (frames == np.array([255, 0, 0], np.uint8)).all(axis=-1).any()
@@ -0,0 +1,509 @@
+import fcntl
+import json
+import logging
+import os
+import random
+import threading
+import time
+import wave
+from concurrent.futures import ThreadPoolExecutor
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import numpy as np
+import speech_recognition as sr
+
+from transcription_cache import CachedRecognizerBackend
+
+# Recordings longer than this are split into chunks; Google's free endpoint
+# rejects or times out on much longer single requests
+max_single_request_seconds = 60
+
+# Limits for recognition requests made by this process, shared by every
+# executor and backend in it: requests running at once, requests started per
+# second (None for no limit), and retries of a failed request with
+# exponential backoff starting at retry_backoff seconds
+max_in_flight = 4
+requests_per_second = 5.0
+max_retries = 3
+retry_backoff = 1.0
+
+# Clips whose recognition failed after all retries are listed here
+retry_queue_path = 'recognition_retry_queue.jsonl'
+
+
+# Backend that sends audio to Google speech recognition. endpoint points it
+# at another server speaking the same protocol, such as FakeRecognizerServer.
+class GoogleRecognizerBackend:
+    def __init__(self, language='ta-IN', endpoint=None):
+        self.language = language
+        self.endpoint = endpoint
+
+    # Everything besides the audio that changes the result, for cache keys
+    def settings(self):
+        return {"backend": "google", "language": self.language, "show_all": True}
+
+    def recognize(self, audio_data):
+        options = {"endpoint": self.endpoint} if self.endpoint else {}
+        return sr.Recognizer().recognize_google(audio_data, language=self.language, show_all=True, **options)
+
+
+# Token bucket: allows rate acquisitions per second on average, with bursts
+# of up to capacity
+class TokenBucket:
+    def __init__(self, rate, capacity=1):
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = capacity
+        self.updated = time.monotonic()
+        self.lock = threading.Lock()
+
+    def acquire(self):
+        while True:
+            with self.lock:
+                now = time.monotonic()
+                self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+                self.updated = now
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+                wait = (1 - self.tokens) / self.rate
+            time.sleep(wait)
+
+
+_request_slots = None
+_request_bucket = None
+_limits_lock = threading.Lock()
+
+# Function to get the (semaphore, token bucket) pair that every recognition
+# request in this process goes through, created from max_in_flight and
+# requests_per_second on first use. The bucket is None without a rate limit.
+def request_limits():
+    global _request_slots, _request_bucket
+    with _limits_lock:
+        if _request_slots is None:
+            _request_slots = threading.BoundedSemaphore(max_in_flight)
+            _request_bucket = TokenBucket(requests_per_second) if requests_per_second else None
+        return _request_slots, _request_bucket
+
+
+# Backend wrapper that limits concurrent requests and the request rate,
+# retries request errors with exponential backoff and jitter, and records
+# per-request latency. Unintelligible audio is not retried. limits is a
+# (semaphore, token bucket or None) pair and defaults to the process-wide one,
+# so nested executors cannot multiply the number of requests in flight.
+class RetryingBackend:
+    def __init__(self, backend, retries=3, backoff=1.0, max_backoff=30.0, limits=None):
+        self.backend = backend
+        self.slots, self.bucket = limits or request_limits()
+        self.retries = retries
+        self.backoff = backoff
+        self.max_backoff = max_backoff
+        self.latencies = []
+        self.retried = 0
+        self.failed = 0
+        self.lock = threading.Lock()
+
+    def settings(self):
+        return self.backend.settings()
+
+    def recognize(self, audio_data):
+        attempt = 0
+        while True:
+            try:
+                with self.slots:
+                    if self.bucket is not None:
+                        self.bucket.acquire()
+                    start = time.perf_counter()
+                    result = self.backend.recognize(audio_data)
+            except sr.RequestError as e:
+                self._record(time.perf_counter() - start)
+                if attempt >= self.retries:
+                    with self.lock:
+                        self.failed += 1
+                    raise
+                delay = min(self.backoff * 2 ** attempt, self.max_backoff) * random.uniform(0.5, 1.0)
+                logging.warning(f"Recognition request failed ({e}); retrying in {delay:.1f}s")
+                with self.lock:
+                    self.retried += 1
+                time.sleep(delay)
+                attempt += 1
+                continue
+            except sr.UnknownValueError:
+                self._record(time.perf_counter() - start)
+                raise
+            self._record(time.perf_counter() - start)
+            return result
+
+    def _record(self, latency):
+        with self.lock:
+            self.latencies.append(latency)
+
+    def metrics(self):
+        with self.lock:
+            latencies = sorted(self.latencies)
+            retried, failed = self.retried, self.failed
+        def percentile(p):
+            return latencies[min(int(p * len(latencies)), len(latencies) - 1)] if latencies else 0.0
+        return {
+            "requests": len(latencies),
+            "retries": retried,
+            "failures": failed,
+            "mean_s": sum(latencies) / len(latencies) if latencies else 0.0,
+            "p50_s": percentile(0.5),
+            "p95_s": percentile(0.95),
+            "max_s": latencies[-1] if latencies else 0.0,
+        }
+
+
+# Thread pool for recognition calls that never holds more than max_in_flight
+# submitted calls: submit() blocks until a slot frees up, which keeps pending
+# audio out of memory. The requests themselves are limited process-wide by
+# RetryingBackend.
+class RecognitionExecutor(ThreadPoolExecutor):
+    def __init__(self, max_in_flight=max_in_flight):
+        super().__init__(max_workers=max_in_flight)
+        self._slots = threading.BoundedSemaphore(max_in_flight)
+
+    def submit(self, fn, *args, **kwargs):
+        self._slots.acquire()
+        try:
+            future = super().submit(fn, *args, **kwargs)
+        except Exception:
+            self._slots.release()
+            raise
+        future.add_done_callback(lambda _: self._slots.release())
+        return future
+
+
+# Local HTTP server speaking the Google speech API v2 protocol, for testing
+# and benchmarking against a real network round trip without using quota.
+# Every request answers with text after latency seconds; a failure_rate
+# share of requests gets a 503 instead.
+class FakeRecognizerServer:
+    def __init__(self, text='வணக்கம்', latency=0.0, failure_rate=0.0, port=0):
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_POST(self):
+                self.rfile.read(int(self.headers.get('Content-Length', 0)))
+                with server.lock:
+                    server.requests += 1
+                time.sleep(server.latency)
+                if random.random() < server.failure_rate:
+                    self.send_response(503)
+                    self.end_headers()
+                    return
+                body = '{"result":[]}\n' + json.dumps({
+                    "result": [{"alternative": [{"transcript": server.text}], "final": True}],
+                    "result_index": 0}, ensure_ascii=False) + '\n'
+                self.send_response(200)
+                self.send_header('Content-Type', 'application/json; charset=utf-8')
+                self.end_headers()
+                self.wfile.write(body.encode('utf-8'))
+
+            def log_message(self, format, *args):
+                pass
+
+        self.text = text
+        self.latency = latency
+        self.failure_rate = failure_rate
+        self.requests = 0
+        self.lock = threading.Lock()
+        self.httpd = ThreadingHTTPServer(('127.0.0.1', port), Handler)
+        self.endpoint = f"http://127.0.0.1:{self.httpd.server_address[1]}/speech-api/v2/recognize"
+        self.thread = threading.Thread(target=self.httpd.serve_forever, daemon=True)
+
+    def __enter__(self):
+        self.thread.start()
+        return self
+
+    def __exit__(self, *exc):
+        self.httpd.shutdown()
+        self.httpd.server_close()
+
+
+# List of clips whose recognition failed, one entry per clip, so they can be
+# retried instead of ending up as empty transcripts. The scripts that add to
+# it do not record failed clips as done, so their next run retries them and
+# discards the entries that succeed. Processes share the file under a lock.
+class RetryQueue:
+    def __init__(self, path=retry_queue_path):
+        self.path = path
+        self.lock = threading.Lock()
+
+    # Function to apply change(entries_by_path) to the stored entries and
+    # write them back, holding the file lock in between
+    def _update(self, change):
+        with self.lock, open(f"{self.path}.lock", 'a') as lock_file:
+            fcntl.flock(lock_file, fcntl.LOCK_EX)
+            entries = {entry["audio_path"]: entry for entry in self.entries()}
+            if not change(entries):
+                return
+            tmp_path = f"{self.path}.{os.getpid()}.tmp"
+            with open(tmp_path, 'w', encoding='utf-8') as f:
+                for entry in entries.values():
+                    f.write(json.dumps(entry, ensure_ascii=False) + '\n')
+            os.replace(tmp_path, self.path)
+
+    # Function to queue a clip, or count another failed attempt if it is
+    # already queued
+    def add(self, audio_path, error):
+        def change(entries):
+            attempts = entries.get(audio_path, {}).get("attempts", 0) + 1
+            entries[audio_path] = {"audio_path": audio_path, "error": str(error), "time": time.time(),
+                                   "attempts": attempts}
+            return True
+        self._update(change)
+        logging.warning(f"Queued {audio_path} for another recognition attempt: {error}")
+
+    # Function to drop a clip from the queue once it was processed
+    def discard(self, audio_path):
+        self._update(lambda entries: entries.pop(audio_path, None) is not None)
+
+    def entries(self):
+        try:
+            with open(self.path, 'r', encoding='utf-8') as f:
+                return [json.loads(line) for line in f if line.strip()]
+        except FileNotFoundError:
+            return []
+
+
+# Offline backend for tests and benchmarks. Answers every request with the
+# text returned by respond(audio_data), or with a fixed text.
+class StubRecognizerBackend:
+    def __init__(self, text='', respond=None):
+        self.text = text
+        self.respond = respond
+
+    def settings(self):
+        return {"backend": "stub", "text": self.text}
+
+    def recognize(self, audio_data):
+        text = self.respond(audio_data) if self.respond is not None else self.text
+        if not text:
+            return []
+        return {'alternative': [{'transcript': text}], 'final': True}
+
+
+_default_backend = None
+
+# Function to get this process's default backend: Google recognition with
+# rate limiting and retries, behind the on-disk transcription cache so cache
+# hits use no request quota
+def default_backend():
+    global _default_backend
+    if _default_backend is None:
+        retrying = RetryingBackend(GoogleRecognizerBackend(), max_retries, retry_backoff)
+        _default_backend = CachedRecognizerBackend(retrying)
+    return _default_backend
+
+# Function to log the latency metrics of the default backend's requests
+def log_recognizer_metrics():
+    metrics = default_backend().backend.metrics()
+    logging.info(f"Recognition requests: {metrics['requests']} sent, {metrics['retries']} retried, "
+                 f"{metrics['failures']} failed; latency mean {metrics['mean_s']:.2f}s, "
+                 f"p50 {metrics['p50_s']:.2f}s, p95 {metrics['p95_s']:.2f}s, max {metrics['max_s']:.2f}s")
+
+
+# Function to get the first alternative's transcript from a show_all result
+def first_alternative(result):
+    if 'alternative' in result and len(result['alternative']) > 0:
+        return result['alternative'][0].get('transcript', '').strip()
+    return ""
+
+# Function to get every alternative's transcript from a show_all result
+def all_alternatives(result):
+    if 'alternative' not in result:
+        return []
+    return [segment['transcript'] for segment in result['alternative'] if 'transcript' in segment]
+
+def wav_duration(audio_path):
+    with wave.open(audio_path, 'rb') as w:
+        return w.getnframes() / w.getframerate()
+
+# Function to decode little-endian signed PCM bytes of the given sample width
+# into an int64 array
+def _pcm_to_array(data, width):
+    if width == 3:
+        raw = np.frombuffer(data, dtype=np.uint8)[:len(data) // 3 * 3].reshape(-1, 3).astype(np.int64)
+        values = raw[:, 0] | (raw[:, 1] << 8) | (raw[:, 2] << 16)
+        return np.where(values >= 1 << 23, values - (1 << 24), values)
+    return np.frombuffer(data, dtype=f'<i{width}')[:len(data) // width].astype(np.int64)
+
+def _array_to_pcm(values, width):
+    if width == 3:
+        return values.astype('<i4').view(np.uint8).reshape(-1, 4)[:, :3].tobytes()
+    return values.astype(f'<i{width}').tobytes()
+
+# Function to mix interleaved stereo PCM to mono by summing each pair of
+# samples and clipping, as audioop.tomono(data, width, 1, 1) did
+def _to_mono(data, width):
+    values = _pcm_to_array(data, width)
+    values = values[:len(values) // 2 * 2]
+    limit = 1 << (8 * width - 1)
+    return _array_to_pcm(np.clip(values[0::2] + values[1::2], -limit, limit - 1), width)
+
+# Function to get the root mean square of integer samples, truncated to an
+# integer as audioop.rms did
+def _rms(values):
+    if not len(values):
+        return 0
+    return int(np.sqrt(np.mean(np.square(values, dtype=np.float64))))
+
+# Function to read frames [start, end) of an open WAV as mono AudioData,
+# converted the same way sr.AudioFile does
+def _read_audio_data(w, start, end):
+    w.setpos(start)
+    data = w.readframes(end - start)
+    width = w.getsampwidth()
+    if width == 1:
+        # 8-bit WAV is unsigned; flipping the top bit makes it signed
+        data = (np.frombuffer(data, dtype=np.uint8) ^ 0x80).tobytes()
+    if w.getnchannels() != 1:
+        data = _to_mono(data, width)
+    return sr.AudioData(data, w.getframerate(), width)
+
+# Function to find the quietest point in frames [start, end), scanning 50 ms
+# blocks in order; read(block_start, block) returns a block's samples.
+# Returns the frame to cut at, or None if no block is quieter than silence_rms.
+def _quietest_frame(read, rate, start, end, silence_rms):
+    block = max(rate // 20, 1)
+    best_frame, best_rms = None, None
+    for block_start in range(start, end - block + 1, block):
+        rms = _rms(read(block_start, block))
+        if rms <= silence_rms and (best_rms is None or rms < best_rms):
+            best_frame, best_rms = block_start + block // 2, rms
+    return best_frame
+
+# Function to yield (start_seconds, end_seconds, AudioData) chunks of a WAV
+# file, reading one chunk at a time. Chunks are window seconds long and
+# overlap by overlap seconds. With silence_rms set, each cut moves to the
+# quietest point in the last quarter of the window, if one is quiet enough,
+# so words are less likely to be split.
+def iter_wav_chunks(audio_path, window=30.0, overlap=1.0, silence_rms=None):
+    with wave.open(audio_path, 'rb') as w:
+        rate = w.getframerate()
+        width = w.getsampwidth()
+        total = w.getnframes()
+        window_frames = int(window * rate)
+        overlap_frames = int(overlap * rate)
+        start = 0
+        while start < total:
+            end = min(start + window_frames, total)
+            if silence_rms is not None and end < total:
+                search = end - window_frames // 4
+                w.setpos(search)
+                cut = _quietest_frame(lambda _, block: _pcm_to_array(w.readframes(block), width),
+                                      rate, search, end, silence_rms)
+                if cut is not None:
+                    end = cut
+            yield start / rate, end / rate, _read_audio_data(w, start, end)
+            if end >= total:
+                break
+            start = max(end - overlap_frames, start + 1)
+
+# Function to convert int16 samples of shape (frames, channels) to mono
+# AudioData, the same bytes sr.AudioFile gives for the WAV of those samples
+def samples_audio_data(samples, rate):
+    data = samples.tobytes()
+    if samples.shape[1] != 1:
+        data = _to_mono(data, 2)
+    return sr.AudioData(data, rate, 2)
+
+# Function to yield (start_seconds, end_seconds, AudioData) chunks of an
+# in-memory int16 sample array, cut exactly as iter_wav_chunks cuts the WAV
+# file of the same samples
+def iter_sample_chunks(samples, rate, window=30.0, overlap=1.0, silence_rms=None):
+    total = len(samples)
+    window_frames = int(window * rate)
+    overlap_frames = int(overlap * rate)
+    start = 0
+    while start < total:
+        end = min(start + window_frames, total)
+        if silence_rms is not None and end < total:
+            cut = _quietest_frame(lambda block_start, block: samples[block_start:block_start + block].ravel(),
+                                  rate, end - window_frames // 4, end, silence_rms)
+            if cut is not None:
+                end = cut
+        yield start / rate, end / rate, samples_audio_data(samples[start:end], rate)
+        if end >= total:
+            break
+        start = max(end - overlap_frames, start + 1)
+
+# Function to transcribe an in-memory int16 sample array. Short audio is sent
+# in one request like transcribe_whole and returns a single segment; longer
+# audio is chunked like transcribe_chunked.
+def transcribe_samples(samples, rate, name, backend=None, window=30.0, overlap=1.0, silence_rms=None,
+                       max_workers=max_in_flight):
+    backend = backend or default_backend()
+    duration = len(samples) / rate
+    if duration > max_single_request_seconds:
+        return _transcribe_chunks(iter_sample_chunks(samples, rate, window, overlap, silence_rms), name,
+                                  backend, max_workers)
+    try:
+        result = backend.recognize(samples_audio_data(samples, rate))
+    except sr.UnknownValueError:
+        logging.warning(f"Could not understand audio in {name}")
+        result = []
+    return [{'start': 0.0, 'end': duration, 'result': result, 'text': first_alternative(result)}]
+
+# Function to recognize one chunk, treating unintelligible audio as silence.
+# Request errors propagate, failing the whole file.
+def _recognize_chunk(backend, audio_data, audio_path, start):
+    try:
+        return backend.recognize(audio_data)
+    except sr.UnknownValueError:
+        logging.warning(f"Could not understand audio in {audio_path} at {start:.1f}s")
+    return []
+
+# Function to drop the words at the start of text that repeat the end of the
+# previous chunk's text, which the overlap between chunks recognizes twice.
+# At most max_words are dropped and a chunk is never emptied entirely.
+def _drop_repeated_words(previous, text, max_words=4):
+    prev_words = previous.split()
+    words = text.split()
+    for n in range(min(max_words, len(prev_words), len(words) - 1), 0, -1):
+        if prev_words[-n:] == words[:n]:
+            return ' '.join(words[n:])
+    return text
+
+# Function to recognize (start, end, AudioData) chunks, up to max_workers
+# concurrently. Only max_workers chunks are held in memory at once. A chunk
+# that still fails after the backend's retries raises sr.RequestError for the
+# whole file. Returns a list of segments ({'start', 'end', 'text', 'result'})
+# in time order, with text repeated across the overlap removed.
+def _transcribe_chunks(chunks, name, backend=None, max_workers=max_in_flight):
+    backend = backend or default_backend()
+    segments = []
+    pending = []
+    with RecognitionExecutor(max_workers) as pool:
+        for start, end, audio_data in chunks:
+            pending.append((start, end, pool.submit(_recognize_chunk, backend, audio_data, name, start)))
+            if len(pending) >= max_workers:
+                start, end, future = pending.pop(0)
+                segments.append({'start': start, 'end': end, 'result': future.result()})
+        for start, end, future in pending:
+            segments.append({'start': start, 'end': end, 'result': future.result()})
+
+    previous = ''
+    for segment in segments:
+        text = _drop_repeated_words(previous, first_alternative(segment['result']))
+        segment['text'] = text
+        if text:
+            previous = text
+    logging.info(f"Transcribed {name} in {len(segments)} chunks")
+    return segments
+
+# Function to transcribe a WAV file in bounded chunks read one at a time
+def transcribe_chunked(audio_path, backend=None, window=30.0, overlap=1.0, silence_rms=None, max_workers=max_in_flight):
+    return _transcribe_chunks(iter_wav_chunks(audio_path, window, overlap, silence_rms), audio_path,
+                              backend, max_workers)
+
+# Function to transcribe a WAV file in one request. Returns the raw show_all
+# result, or [] when nothing was recognized.
+def transcribe_whole(audio_path, backend=None):
+    backend = backend or default_backend()
+    recognizer = sr.Recognizer()
+    with sr.AudioFile(audio_path) as source:
+        audio_data = recognizer.record(source)
+    return backend.recognize(audio_data)
@@ -0,0 +1,149 @@
+import hashlib
+import json
+import logging
+import os
+import threading
+
+import speech_recognition as sr
+
+# Default location and size limit of the on-disk cache
+cache_dir = os.environ.get('TRANSCRIPTION_CACHE_DIR', 'transcription_cache')
+max_cache_bytes = 256 * 1024 * 1024
+
+# Eviction frees space down to this share of max_bytes, so the puts after it
+# do not each trigger another scan of the cache directory
+cache_low_water = 0.9
+
+
+# Persistent cache of recognizer results, one JSON file per entry, keyed by
+# the hash of the audio sent plus the recognizer settings. Entries store the
+# full show_all result. Reads refresh an entry's mtime, and once the cache
+# grows past max_bytes the least recently used entries are evicted until it
+# is under low_water * max_bytes.
+class TranscriptionCache:
+    def __init__(self, path=cache_dir, max_bytes=max_cache_bytes, low_water=cache_low_water):
+        self.path = path
+        self.max_bytes = max_bytes
+        self.low_water = low_water
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.lock = threading.Lock()
+        os.makedirs(path, exist_ok=True)
+        self.size = sum(entry.stat().st_size for entry in self._entries())
+
+    def _entries(self):
+        for shard in os.scandir(self.path):
+            if shard.is_dir():
+                for entry in os.scandir(shard.path):
+                    if entry.name.endswith('.json'):
+                        yield entry
+
+    # Function to build the cache key for a piece of audio and the settings
+    # that affect its transcript (backend, language, options)
+    def key(self, audio_data, settings):
+        digest = hashlib.sha256()
+        digest.update(json.dumps(settings, sort_keys=True).encode('utf-8'))
+        digest.update(f"{audio_data.sample_rate}:{audio_data.sample_width}:".encode('ascii'))
+        digest.update(audio_data.get_raw_data())
+        return digest.hexdigest()
+
+    def _entry_path(self, key):
+        return os.path.join(self.path, key[:2], f"{key}.json")
+
+    def get(self, key):
+        path = self._entry_path(key)
+        try:
+            with open(path, 'r', encoding='utf-8') as f:
+                entry = json.load(f)
+            os.utime(path)
+        except (OSError, ValueError):
+            with self.lock:
+                self.misses += 1
+            return None
+        with self.lock:
+            self.hits += 1
+        return entry
+
+    def put(self, key, entry):
+        path = self._entry_path(key)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump(entry, f, ensure_ascii=False)
+        size = os.path.getsize(tmp_path)
+        with self.lock:
+            # Replacing an existing entry only adds the difference in size
+            try:
+                size -= os.path.getsize(path)
+            except FileNotFoundError:
+                pass
+            os.replace(tmp_path, path)
+            self.size += size
+            over = self.size > self.max_bytes
+        if over:
+            self.evict()
+
+    # Function to delete least recently used entries until the cache is back
+    # under the low-water mark
+    def evict(self):
+        with self.lock:
+            entries = []
+            for entry in self._entries():
+                try:
+                    stat = entry.stat()
+                except FileNotFoundError:
+                    continue
+                entries.append((stat.st_mtime, stat.st_size, entry.path))
+            entries.sort()
+            self.size = sum(size for _, size, _ in entries)
+            target = self.max_bytes * self.low_water
+            for _, size, path in entries:
+                if self.size <= target:
+                    break
+                try:
+                    os.remove(path)
+                except FileNotFoundError:
+                    pass
+                self.size -= size
+                self.evictions += 1
+
+    def stats(self):
+        with self.lock:
+            return {"hits": self.hits, "misses": self.misses, "evictions": self.evictions, "bytes": self.size}
+
+
+# Recognizer backend wrapper that answers from the cache when the same audio
+# was recognized before with the same settings. Unintelligible audio is
+# cached too; request errors are not.
+class CachedRecognizerBackend:
+    def __init__(self, backend, cache=None):
+        self.backend = backend
+        self.cache = cache if cache is not None else TranscriptionCache()
+
+    def settings(self):
+        return self.backend.settings()
+
+    def recognize(self, audio_data):
+        key = self.cache.key(audio_data, self.backend.settings())
+        entry = self.cache.get(key)
+        if entry is not None:
+            if entry.get("unknown"):
+                raise sr.UnknownValueError()
+            return entry["result"]
+        try:
+            result = self.backend.recognize(audio_data)
+        except sr.UnknownValueError:
+            self.cache.put(key, {"unknown": True})
+            raise
+        self.cache.put(key, {"result": result})
+        return result
+
+
+# Function to log the hit/miss counters of a cache
+def log_cache_stats(cache):
+    stats = cache.stats()
+    total = stats["hits"] + stats["misses"]
+    rate = stats["hits"] / total if total else 0.0
+    logging.info(f"Transcription cache: {stats['hits']} hits, {stats['misses']} misses ({rate:.0%} hit rate), "
+                 f"{stats['evictions']} evictions, {stats['bytes']} bytes on disk")
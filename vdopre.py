@@ -1,24 +1,186 @@
 import cv2
+import numpy as np
 import os
+import sys
+import time
+import argparse
+import queue
+import threading
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+from file_state import FileStateIndex, report_plan, watch
+from profiling import emit, report, stage
 
 # Path to input and output folders
 input_folder = '/media/dhivyadharshini/DATA/project/output_videos'
 output_folder = '/media/dhivyadharshini/DATA/project/preprocessvideo'
 
-# Create output folder if it doesn't exist
-os.makedirs(output_folder, exist_ok=True)
+# Run face detection on every Nth frame only; 1 detects on every frame
+face_detect_stride = 1
+# Skip face detection when fewer than this fraction of pixels changed since
+# the previous frame; None disables the motion gate
+motion_threshold = None
+
+# Pre-trained face detection model, loaded once per process by get_face_cascade()
+face_cascade = None
+
+def get_face_cascade():
+    global face_cascade
+    if face_cascade is None:
+        face_cascade = cv2.CascadeClassifier(cv2.data.haarcascades + 'haarcascade_frontalface_default.xml')
+    return face_cascade
+
+# Pool initializer: load the cascade once per worker and keep OpenCV to one
+# internal thread, since the pool already runs one clip per core
+def init_worker():
+    cv2.setNumThreads(1)
+    get_face_cascade()
+
+# Keyframes of one clip, packed into two files in keyframe_folder:
+#   <clip>.keyframes.npy  uint8 array (N, H, W, 3), readable with mmap
+#   <clip>.index.npz      frame_numbers, timestamps, box_offsets and boxes;
+#                         the face boxes of keyframe i are
+#                         boxes[box_offsets[i]:box_offsets[i + 1]]
+class KeyframeWriter:
+    def __init__(self, keyframe_folder, clip_name, fps):
+        self.keyframe_folder = keyframe_folder
+        self.clip_name = clip_name
+        self.fps = fps
+        self.frames = []
+        self.frame_numbers = []
+        self.boxes = []
+
+    def add(self, frame_number, frame, faces):
+        self.frames.append(frame)
+        self.frame_numbers.append(frame_number)
+        self.boxes.append(np.asarray(faces, dtype=np.int32).reshape(-1, 4))
+
+    # Write both files next to their final names and rename them into place,
+    # so readers never open a partial container
+    def close(self):
+        if not self.frames:
+            return
+        os.makedirs(self.keyframe_folder, exist_ok=True)
+        frames_path, index_path = keyframe_paths(self.keyframe_folder, self.clip_name)
+        offsets = np.zeros(len(self.boxes) + 1, dtype=np.int64)
+        offsets[1:] = np.cumsum([len(b) for b in self.boxes])
+        frame_numbers = np.asarray(self.frame_numbers, dtype=np.int64)
+        with open(frames_path + '.tmp', 'wb') as f:
+            np.save(f, np.stack(self.frames))
+        with open(index_path + '.tmp', 'wb') as f:
+            np.savez(f, frame_numbers=frame_numbers, timestamps=frame_numbers / self.fps,
+                     box_offsets=offsets, boxes=np.concatenate(self.boxes))
+        os.replace(frames_path + '.tmp', frames_path)
+        os.replace(index_path + '.tmp', index_path)
+
+def keyframe_paths(keyframe_folder, clip_name):
+    return (os.path.join(keyframe_folder, f"{clip_name}.keyframes.npy"),
+            os.path.join(keyframe_folder, f"{clip_name}.index.npz"))
+
+# Function to open a clip's keyframes without decoding video: returns the
+# memory-mapped frame array and the index arrays
+def load_keyframes(keyframe_folder, clip_name):
+    frames_path, index_path = keyframe_paths(keyframe_folder, clip_name)
+    with np.load(index_path) as index:
+        return np.load(frames_path, mmap_mode='r'), {name: index[name] for name in index.files}
+
+# Function to get the keyframe nearest to a timestamp (seconds) and its face boxes
+def keyframe_at(frames, index, timestamp):
+    timestamps = index["timestamps"]
+    i = int(np.searchsorted(timestamps, timestamp))
+    if i == len(timestamps) or (i > 0 and timestamp - timestamps[i - 1] <= timestamps[i] - timestamp):
+        i -= 1
+    offsets = index["box_offsets"]
+    return frames[i], index["boxes"][offsets[i]:offsets[i + 1]]
+
+# Marks the end of the frame stream between pipeline stages
+_END = object()
+
+# Per-stage frame counter and busy time, used to report frames per second
+class StageStats:
+    def __init__(self, name):
+        self.name = name
+        self.frames = 0
+        self.busy = 0.0
+
+    def fps(self):
+        return self.frames / self.busy if self.busy else 0.0
+
+# Function to run a stage loop in a thread, passing any error to the caller
+def _start_stage(target, errors, *args):
+    def run():
+        try:
+            target(*args)
+        except Exception as e:
+            errors.append(e)
+    thread = threading.Thread(target=run, daemon=True)
+    thread.start()
+    return thread
+
+# Put an item on a bounded queue without blocking forever once another stage
+# has failed and stopped consuming
+def _put(q, item, errors):
+    while True:
+        try:
+            q.put(item, timeout=0.1)
+            return True
+        except queue.Full:
+            if errors:
+                return False
+
+def _decode_frames(cap, frames, stats, errors):
+    try:
+        while cap.isOpened() and not errors:
+            start = time.perf_counter()
+            ret, frame = cap.read()
+            if not ret:
+                break
+            stats.busy += time.perf_counter() - start
+            stats.frames += 1
+            if not _put(frames, frame, errors):
+                break
+    finally:
+        _put(frames, _END, errors)
+
+def _encode_frames(out, processed, stats, frame_interval, keyframes, errors):
+    frame_count = 0
+    while True:
+        item = processed.get()
+        if item is _END:
+            break
+        frame, clean_frame, faces = item
+        start = time.perf_counter()
+        # Write the processed frame to the output video
+        out.write(frame)
+
+        frame_count += 1
+        if frame_count % frame_interval == 0:
+            # Keep a frame every second (or as specified by frame_interval),
+            # without the face boxes drawn on it; they are stored separately
+            keyframes.add(frame_count - 1, clean_frame, faces)
+        stats.busy += time.perf_counter() - start
+        stats.frames += 1
 
-# Load a pre-trained model (e.g., for face detection)
-face_cascade = cv2.CascadeClassifier(cv2.data.haarcascades + 'haarcascade_frontalface_default.xml')
+# Preprocess one video as three threads connected by bounded queues: decode,
+# process (resize, denoise, motion, face detection) and encode. Face detection
+# runs on every detect_stride-th frame, and is also skipped when the fraction
+# of pixels that changed since the previous frame is below motion_threshold.
+# Skipped frames reuse the last detected face boxes. One keyframe per second
+# is stored with its face boxes in the clip's container in keyframe_folder
+# (default: a keyframes folder next to the output video). Returns the number
+# of frames written, or None if the video could not be processed.
+def preprocess_video(input_video_path, output_video_path, detect_stride=1, motion_threshold=None, queue_size=32,
+                     keyframe_folder=None):
+    if detect_stride < 1:
+        raise ValueError(f"detect_stride must be at least 1, got {detect_stride}")
 
-def preprocess_video(input_video_path, output_video_path):
     # Create a VideoCapture object
     cap = cv2.VideoCapture(input_video_path)
 
     # Check if the video was opened successfully
     if not cap.isOpened():
         print(f"Error opening video file: {input_video_path}")
-        return
+        return None
 
     # Get original video properties
     original_width = int(cap.get(cv2.CAP_PROP_FRAME_WIDTH))
@@ -29,62 +191,204 @@ def preprocess_video(input_video_path, output_video_path):
     new_width = 640
     new_height = int((new_width / original_width) * original_height)
 
-    # Initialize VideoWriter to save the processed video
     # Initialize VideoWriter to save the processed video
     fourcc = cv2.VideoWriter_fourcc(*'mp4v')  # Use 'mp4v' codec for MP4 format
     out = cv2.VideoWriter(output_video_path, fourcc, fps, (new_width, new_height))
 
-    #fourcc = cv2.VideoWriter_fourcc(*'XVID')
-    #out = cv2.VideoWriter(output_video_path, fourcc, fps, (new_width, new_height))
+    frame_interval = max(fps, 1)  # Extract one frame per second
+    if keyframe_folder is None:
+        keyframe_folder = os.path.join(os.path.dirname(output_video_path), 'keyframes')
+    clip_name = os.path.splitext(os.path.basename(output_video_path))[0]
+    keyframes = KeyframeWriter(keyframe_folder, clip_name, cap.get(cv2.CAP_PROP_FPS) or frame_interval)
+    cascade = get_face_cascade()
+
+    decode_stats = StageStats('decode')
+    process_stats = StageStats('process')
+    detect_stats = StageStats('detect')
+    encode_stats = StageStats('encode')
+    frames = queue.Queue(maxsize=queue_size)
+    processed = queue.Queue(maxsize=queue_size)
+    errors = []
+    started = time.perf_counter()
+    decoder = _start_stage(_decode_frames, errors, cap, frames, decode_stats, errors)
+    encoder = _start_stage(_encode_frames, errors, out, processed, encode_stats, frame_interval,
+                           keyframes, errors)
 
     prev_frame = None
-    frame_count = 0
-    frame_interval = fps  # Extract one frame per second
+    faces = ()
+    frame_index = 0
+    try:
+        while True:
+            frame = frames.get()
+            if frame is _END:
+                break
+            start = time.perf_counter()
 
-    while cap.isOpened():
-        ret, frame = cap.read()
-        if not ret:
-            break
+            # Resize frame
+            frame_resized = cv2.resize(frame, (new_width, new_height))
 
-        # Resize frame
-        frame_resized = cv2.resize(frame, (new_width, new_height))
+            # Apply Gaussian Blur for denoising
+            frame_denoised = cv2.GaussianBlur(frame_resized, (5, 5), 0)
 
-        # Apply Gaussian Blur for denoising
-        frame_denoised = cv2.GaussianBlur(frame_resized, (5, 5), 0)
+            # Motion detection: fraction of pixels that changed noticeably
+            motion = 1.0
+            if prev_frame is not None:
+                diff = cv2.absdiff(prev_frame, frame_denoised)
+                gray_diff = cv2.cvtColor(diff, cv2.COLOR_BGR2GRAY)
+                _, thresh = cv2.threshold(gray_diff, 30, 255, cv2.THRESH_BINARY)
+                motion = cv2.countNonZero(thresh) / thresh.size
 
-        # Motion detection
-        if prev_frame is not None:
-            diff = cv2.absdiff(prev_frame, frame_denoised)
-            gray_diff = cv2.cvtColor(diff, cv2.COLOR_BGR2GRAY)
-            _, thresh = cv2.threshold(gray_diff, 30, 255, cv2.THRESH_BINARY)
-            # Optionally, further processing for motion detection
+            # Face detection, or reuse of the last boxes on skipped frames
+            detect = frame_index % detect_stride == 0
+            if detect and motion_threshold is not None and frame_index > 0 and motion < motion_threshold:
+                detect = False
+            if detect:
+                detect_start = time.perf_counter()
+                gray_frame = cv2.cvtColor(frame_denoised, cv2.COLOR_BGR2GRAY)
+                faces = cascade.detectMultiScale(gray_frame, scaleFactor=1.1, minNeighbors=5)
+                detect_stats.busy += time.perf_counter() - detect_start
+                detect_stats.frames += 1
 
-        prev_frame = frame_denoised
+            # The boxes are drawn on a copy, so the next frame's motion check
+            # and the keyframe container get the frame without them
+            prev_frame = frame_denoised
+            frame_annotated = frame_denoised.copy() if len(faces) else frame_denoised
+            for (x, y, w, h) in faces:
+                cv2.rectangle(frame_annotated, (x, y), (x + w, y + h), (255, 0, 0), 2)
 
-        # Face detection
-        gray_frame = cv2.cvtColor(frame_denoised, cv2.COLOR_BGR2GRAY)
-        faces = face_cascade.detectMultiScale(gray_frame, scaleFactor=1.1, minNeighbors=5)
+            process_stats.busy += time.perf_counter() - start
+            process_stats.frames += 1
+            frame_index += 1
+            if not _put(processed, (frame_annotated, frame_denoised, faces), errors):
+                break
+    except Exception as e:
+        errors.append(e)
+    finally:
+        _put(processed, _END, errors)
+        decoder.join()
+        encoder.join()
+        # Release video objects
+        cap.release()
+        out.release()
 
-        for (x, y, w, h) in faces:
-            cv2.rectangle(frame_denoised, (x, y), (x + w, y + h), (255, 0, 0), 2)
+    if errors:
+        print(f"Error processing video {input_video_path}: {errors[0]}")
+        return None
+    keyframes.close()
 
-        # Write the processed frame to the output video
-        out.write(frame_denoised)
+    elapsed = time.perf_counter() - started
+    stage_report = ', '.join(f"{s.name} {s.frames} frames @ {s.fps():.1f} fps"
+                             for s in (decode_stats, process_stats, detect_stats, encode_stats))
+    print(f"Processed {input_video_path}: {frame_index / elapsed if elapsed else 0.0:.1f} fps overall; {stage_report}")
+    # Busy time of each pipeline thread, so the run summary shows whether
+    # decoding, Haar detection or encoding dominates
+    for s in (decode_stats, process_stats, detect_stats, encode_stats):
+        emit({"stage": f"preprocess_video.{s.name}", "video": input_video_path, "wall_s": s.busy,
+              "items": s.frames, "items_per_s": s.fps()})
+    return frame_index
 
-        frame_count += 1
-        if frame_count % frame_interval == 0:
-            # Save a frame every second (or as specified by frame_interval)
-            cv2.imwrite(f"{output_folder}/frame_{frame_count}.jpg", frame_denoised)
+# Worker: preprocess one clip and report (frames, seconds, error)
+def process_clip(input_video_path, output_video_path, detect_stride, motion_threshold, keyframe_folder):
+    start = time.perf_counter()
+    # Decoding, detection and encoding run in helper threads, so count the
+    # CPU time of the whole worker process
+    with stage('preprocess_video', process_cpu=True, video=input_video_path) as record:
+        try:
+            frames = preprocess_video(input_video_path, output_video_path, detect_stride, motion_threshold,
+                                      keyframe_folder=keyframe_folder)
+        except Exception as e:
+            record.ok = False
+            return None, time.perf_counter() - start, str(e)
+        record.items = frames or 0
+        record.ok = frames is not None
+    error = None if frames is not None else "could not process video"
+    return frames, time.perf_counter() - start, error
+
+# Stage name recorded in the file-state index
+STAGE = 'vdopre'
 
-    # Release video objects and close windows
-    cap.release()
-    out.release()
+# Preprocess the clips in input_dir that are new or changed since they were
+# last processed, over a process pool. Returns the names of the clips that
+# failed. With dry_run, only report what would be processed.
+def run(input_dir, output_dir, workers=None, detect_stride=1, motion_threshold=None, keyframe_dir=None,
+        state=None, dry_run=False, settle_seconds=None):
+    # Create output folder if it doesn't exist
+    os.makedirs(output_dir, exist_ok=True)
 
-# Iterate over all video files in the input folder
-for video_file in os.listdir(input_folder):
-    if video_file.endswith('.mp4'):  # Check if the file is a video
-        input_video_path = os.path.join(input_folder, video_file)
-        output_video_path = os.path.join(output_folder, video_file)  # Save with the same name in the output folder
-        preprocess_video(input_video_path, output_video_path)
+    state = state or FileStateIndex()
+    keyframe_folder = keyframe_dir or os.path.join(output_dir, 'keyframes')
+    params = {"detect_stride": detect_stride, "motion_threshold": motion_threshold,
+              "keyframe_dir": keyframe_folder}
+    all_files = sorted(f for f in os.listdir(input_dir) if f.endswith('.mp4'))
+    pending = state.plan(STAGE, [(f, [os.path.join(input_dir, f)]) for f in all_files], params, settle_seconds)
+    if dry_run:
+        report_plan(STAGE, pending, len(all_files), log=print)
+        return []
+    video_files = [f for f, _ in pending]
+    if not video_files:
+        return []
+    failed = []
+    total_frames = 0
+    start = time.perf_counter()
+    with ProcessPoolExecutor(max_workers=workers, initializer=init_worker) as pool:
+        futures = {
+            # Save with the same name in the output folder
+            pool.submit(process_clip, os.path.join(input_dir, f), os.path.join(output_dir, f),
+                        detect_stride, motion_threshold, keyframe_folder): f
+            for f in video_files
+        }
+        for done, future in enumerate(as_completed(futures), 1):
+            video_file = futures[future]
+            try:
+                frames, seconds, error = future.result()
+            except Exception as e:
+                frames, seconds, error = None, 0.0, str(e)
+            if error is None:
+                total_frames += frames
+                print(f"[{done}/{len(video_files)}] {video_file}: {frames} frames in {seconds:.1f}s")
+                clip_name = os.path.splitext(video_file)[0]
+                state.record(STAGE, video_file, [os.path.join(input_dir, video_file)], params,
+                             [os.path.join(output_dir, video_file), *keyframe_paths(keyframe_folder, clip_name)])
+            else:
+                failed.append(video_file)
+                print(f"[{done}/{len(video_files)}] {video_file}: FAILED ({error})")
+
+    elapsed = time.perf_counter() - start
+    print(f"Processing complete: {len(video_files) - len(failed)} of {len(video_files)} clips, "
+          f"{total_frames / elapsed if elapsed else 0.0:.1f} frames/s across all workers")
+    for video_file in failed:
+        print(f"Failed: {video_file}")
+    state.save()
+    return failed
+
+def main():
+    parser = argparse.ArgumentParser(description="Resize, denoise and annotate faces in every clip")
+    parser.add_argument("--input", default=input_folder, help="folder of clips to preprocess")
+    parser.add_argument("--output", default=output_folder, help="folder for the preprocessed clips")
+    parser.add_argument("--keyframes", help="folder for per-clip keyframe containers (default: OUTPUT/keyframes)")
+    parser.add_argument("--workers", type=int, default=os.cpu_count(), help="number of worker processes")
+    parser.add_argument("--detect-stride", type=int, default=face_detect_stride,
+                        help="run face detection on every Nth frame")
+    parser.add_argument("--motion-threshold", type=float, default=motion_threshold,
+                        help="skip face detection below this fraction of changed pixels")
+    parser.add_argument("--dry-run", action="store_true", help="only report which clips would be processed")
+    parser.add_argument("--watch", action="store_true", help="keep running and pick up newly added clips")
+    parser.add_argument("--interval", type=float, default=10.0, help="seconds between scans in --watch mode")
+    args = parser.parse_args()
+    if args.detect_stride < 1:
+        parser.error("--detect-stride must be at least 1")
+
+    state = FileStateIndex()
+    if args.watch:
+        watch(lambda: run(args.input, args.output, args.workers, args.detect_stride, args.motion_threshold,
+                          args.keyframes, state, args.dry_run, settle_seconds=args.interval), args.interval)
+        report(log=print)
+        return
+    failed = run(args.input, args.output, args.workers, args.detect_stride, args.motion_threshold, args.keyframes,
+                 state, args.dry_run)
+    report(log=print)
+    if failed:
+        sys.exit(1)
 
-print("Processing complete.")
\ No newline at end of file
+if __name__ == "__main__":
+    main()
@@ -1,9 +1,21 @@
 import os
+import sys
+import json
+import math
 import logging
+import argparse
+import subprocess
+from concurrent.futures import ProcessPoolExecutor, as_completed
 import cv2
 import speech_recognition as sr
-import pandas as pd
 from moviepy.editor import VideoFileClip
+from moviepy.config import get_setting
+
+from transcribe import (RetryQueue, all_alternatives, default_backend, log_recognizer_metrics,
+                        max_single_request_seconds, transcribe_chunked, transcribe_whole, wav_duration)
+from transcription_cache import log_cache_stats
+from dataset_manifest import get_manifest
+from profiling import report, stage
 
 # Set up logging
 logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
@@ -19,68 +31,123 @@ def get_highest_clip_number(output_folder, base_name):
 
 # Function to extract audio from video and get video duration
 def extract_audio_from_video(video_path, audio_path):
-    try:
-        video = VideoFileClip(video_path)
-        video_duration = video.duration  # Get video duration
-        audio = video.audio
-        audio.write_audiofile(audio_path)
-        audio_duration = audio.duration  # Get audio duration
-        video.close()
-        logging.info(f"Extracted audio from {video_path} to {audio_path}")
-        return video_duration, audio_duration
-    except Exception as e:
-        logging.error(f"Error extracting audio from {video_path}: {e}")
-        return None, None
+    with stage('extract_audio', items=1, video=video_path) as record:
+        try:
+            video = VideoFileClip(video_path)
+            video_duration = video.duration  # Get video duration
+            audio = video.audio
+            audio.write_audiofile(audio_path)
+            audio_duration = audio.duration  # Get audio duration
+            video.close()
+            logging.info(f"Extracted audio from {video_path} to {audio_path}")
+            return video_duration, audio_duration
+        except Exception as e:
+            logging.error(f"Error extracting audio from {video_path}: {e}")
+            record.ok = False
+            return None, None
 
-# Function to extract text and timestamps from audio
-def extract_utterances_from_audio(audio_path):
-    recognizer = sr.Recognizer()
+# Function to extract text and timestamps from audio. Short recordings go out
+# in one request and return every recognized alternative; long recordings are
+# recognized in overlapping chunks and return one utterance per chunk.
+# Returns None when recognition still failed after retries.
+def extract_utterances_from_audio(audio_path, backend=None):
     utterances = []
-    try:
-        with sr.AudioFile(audio_path) as source:
-            audio_data = recognizer.record(source)
-        # Extracting text
-        transcript = recognizer.recognize_google(audio_data, language='ta-IN', show_all=True)
-        
-        if 'alternative' in transcript:
-            for segment in transcript['alternative']:
-                if 'transcript' in segment:
-                    utterances.append(segment['transcript'])
-        
-        logging.info(f"Extracted utterances from {audio_path}")
-    except sr.UnknownValueError:
-        logging.warning(f"Could not understand audio in {audio_path}")
-    except sr.RequestError as e:
-        logging.error(f"Error with the speech recognition request for {audio_path}: {e}")
-    
+    with stage('recognize', items=1, audio=audio_path) as record:
+        try:
+            if wav_duration(audio_path) > max_single_request_seconds:
+                segments = transcribe_chunked(audio_path, backend)
+                utterances = [segment['text'] for segment in segments if segment['text']]
+                record.items = len(segments)
+            else:
+                # Extracting text
+                transcript = transcribe_whole(audio_path, backend)
+                utterances = all_alternatives(transcript)
+
+            logging.info(f"Extracted utterances from {audio_path}")
+        except sr.UnknownValueError:
+            logging.warning(f"Could not understand audio in {audio_path}")
+        except sr.RequestError as e:
+            logging.error(f"Error with the speech recognition request for {audio_path}: {e}")
+            record.ok = False
+            return None
+
     return utterances
 
 # Function to split the video into fixed-duration segments and name them continuously
 def split_video_fixed_duration(video_path, duration, output_folder, base_name, start_clip_number):
-    try:
-        video = VideoFileClip(video_path)
-        video_duration = video.duration
-        current_time = 0
-        clip_number = start_clip_number
-
-        while current_time < video_duration:
-            end_time = min(current_time + duration, video_duration)
-            output_path = os.path.join(output_folder, f"{base_name}{clip_number}.mp4")
-            video.subclip(current_time, end_time).write_videofile(output_path)
-            logging.info(f"Saved split video to {output_path}")
-            current_time += duration
-            clip_number += 1
+    with stage('split', video=video_path) as record:
+        try:
+            video = VideoFileClip(video_path)
+            video_duration = video.duration
+            current_time = 0
+            clip_number = start_clip_number
 
-        video.close()
-        return clip_number  # Return the last clip number used
-    except Exception as e:
-        logging.error(f"Error splitting video {video_path}: {e}")
-        return start_clip_number
+            while current_time < video_duration:
+                end_time = min(current_time + duration, video_duration)
+                output_path = os.path.join(output_folder, f"{base_name}{clip_number}.mp4")
+                video.subclip(current_time, end_time).write_videofile(output_path)
+                logging.info(f"Saved split video to {output_path}")
+                current_time += duration
+                clip_number += 1
+                record.items += 1
+
+            video.close()
+            return clip_number  # Return the last clip number used
+        except Exception as e:
+            logging.error(f"Error splitting video {video_path}: {e}")
+            record.ok = False
+            return start_clip_number
+
+# Function to check whether a video has an audio stream, from the stream
+# list ffmpeg prints for an input
+def has_audio_stream(video_path):
+    result = subprocess.run([get_setting("FFMPEG_BINARY"), '-hide_banner', '-i', video_path],
+                            capture_output=True, text=True, errors='replace')
+    return any('Stream #' in line and 'Audio:' in line for line in result.stderr.splitlines())
+
+# Function to split a video into fixed-duration clips with a single ffmpeg
+# pass, optionally writing its audio track as WAV from the same demux. With
+# stream_copy the packets are copied and cuts land on the first keyframe at
+# or after each boundary; otherwise keyframes are forced at every boundary
+# and the clips are re-encoded. No WAV is written for a video without an
+# audio track. Returns the next unused clip number.
+def segment_video_single_pass(video_path, duration, output_folder, base_name, start_clip_number,
+                              audio_path=None, stream_copy=True):
+    list_path = os.path.join(output_folder, f".{base_name}{start_clip_number}.segments")
+    cmd = [get_setting("FFMPEG_BINARY"), '-y', '-v', 'error', '-i', video_path,
+           '-map', '0:v:0', '-map', '0:a:0?']
+    if stream_copy:
+        cmd += ['-c', 'copy']
+    else:
+        cmd += ['-c:v', 'libx264', '-c:a', 'aac', '-force_key_frames', f'expr:gte(t,n_forced*{duration})']
+    cmd += ['-f', 'segment', '-segment_time', str(duration), '-reset_timestamps', '1',
+            '-segment_start_number', str(start_clip_number), '-segment_list', list_path,
+            '-segment_list_type', 'flat', os.path.join(output_folder, f"{base_name}%d.mp4")]
+    if audio_path and has_audio_stream(video_path):
+        cmd += ['-map', '0:a:0', '-vn', '-acodec', 'pcm_s16le', '-ar', '44100', audio_path]
+    with stage('split_single_pass', video=video_path) as record:
+        try:
+            subprocess.run(cmd, check=True, capture_output=True)
+            with open(list_path, 'r', encoding='utf-8') as f:
+                clip_count = sum(1 for line in f if line.strip())
+            os.remove(list_path)
+        except (OSError, subprocess.CalledProcessError) as e:
+            stderr = getattr(e, 'stderr', b'') or b''
+            logging.error(f"Error segmenting video {video_path}: {e} {stderr.decode(errors='replace').strip()}")
+            record.ok = False
+            return start_clip_number
+        record.items = clip_count
+    logging.info(f"Saved {clip_count} clips from {video_path} starting at {base_name}{start_clip_number}.mp4")
+    return start_clip_number + clip_count
 
 # Process video and split into fixed-duration clips
 def process_video(video_path, audio_path, text_folder, output_folder, csv_path, base_name, start_clip_number):
     video_duration, audio_duration = extract_audio_from_video(video_path, audio_path)
     utterances = extract_utterances_from_audio(audio_path)
+    if utterances is None:
+        # Leave the transcript to a later run instead of saving it empty
+        RetryQueue().add(audio_path, "recognition request failed")
+        return split_video_fixed_duration(video_path, 30, output_folder, base_name, start_clip_number)
     
     # Save extracted text in a file inside text_extracted folder
     text_file = os.path.join(text_folder, f"{os.path.splitext(os.path.basename(video_path))[0]}.txt")
@@ -88,28 +155,221 @@ def process_video(video_path, audio_path, text_folder, output_folder, csv_path,
         for utt in utterances:
             f.write(utt + '\n')
     logging.info(f"Text saved to {text_file}")
+    RetryQueue().discard(audio_path)
     
     # Split the video into 30-second clips
     last_clip_number = split_video_fixed_duration(video_path, 30, output_folder, base_name, start_clip_number)
     
-    # Store data in a CSV file, including the extracted text, video, and audio durations
-    data = {
-        "video_path": [video_path],
-        "audio_path": [audio_path],
-        "text_path": [text_file],
-        "extracted_text": [" ".join(utterances)],
-        "video_duration": [video_duration],
-        "audio_duration": [audio_duration]
-    }
-    
-    df = pd.DataFrame(data)
-    if os.path.exists(csv_path):
-        df.to_csv(csv_path, mode='a', header=False, index=False)
-    else:
-        df.to_csv(csv_path, index=False)
+    # Store data in the dataset, including the extracted text, video, and audio durations
+    get_manifest(csv_path).add({
+        "clip_id": os.path.splitext(os.path.basename(video_path))[0],
+        "video_path": video_path,
+        "audio_path": audio_path,
+        "text_path": text_file,
+        "extracted_text": " ".join(utterances),
+        "video_duration": video_duration,
+        "audio_duration": audio_duration
+    })
     
     return last_clip_number
 
+# Stages run for every source video, in order
+STAGES = ['audio', 'transcript', 'clips', 'csv']
+
+# Function to load the batch manifest recording finished stages per input
+def load_manifest(manifest_path):
+    if os.path.exists(manifest_path):
+        with open(manifest_path, 'r', encoding='utf-8') as f:
+            return json.load(f)
+    return {"next_clip_number": None, "inputs": {}}
+
+# Function to save the manifest atomically so a crash never leaves it torn
+def save_manifest(manifest, manifest_path):
+    tmp_path = f"{manifest_path}.tmp"
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        json.dump(manifest, f, indent=2, ensure_ascii=False)
+    os.replace(tmp_path, manifest_path)
+
+# Function to get a video's duration without decoding it
+def probe_duration(video_path):
+    video = VideoFileClip(video_path)
+    try:
+        return video.duration
+    finally:
+        video.close()
+
+# Worker: probe one video, returning (duration, error) so an unreadable file
+# does not abort the whole batch
+def try_probe_duration(video_path):
+    try:
+        video_duration = probe_duration(video_path)
+        if not video_duration:
+            return None, "could not read the video duration"
+        return video_duration, None
+    except Exception as e:
+        # moviepy appends ffmpeg's full banner; the first line says what failed
+        return None, (str(e).splitlines() or [repr(e)])[0]
+
+# Function to reserve clip numbers for inputs not yet in the manifest. Inputs
+# are numbered in sorted file order, each taking one number per clip, so the
+# numbering no longer depends on which worker finishes first. Inputs that
+# cannot be probed are marked failed, get no clip numbers and are probed
+# again on the next run.
+def assign_clip_numbers(manifest, video_folder, video_files, output_folder, base_name, duration, workers):
+    if manifest["next_clip_number"] is None:
+        manifest["next_clip_number"] = get_highest_clip_number(output_folder, base_name) + 1
+    new_files = [f for f in video_files
+                 if f not in manifest["inputs"] or "probe_error" in manifest["inputs"][f]]
+    if not new_files:
+        return
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        probes = list(pool.map(try_probe_duration, [os.path.join(video_folder, f) for f in new_files]))
+    for video_file, (video_duration, error) in zip(new_files, probes):
+        if error is not None:
+            logging.error(f"Could not probe {video_file}: {error}")
+            manifest["inputs"][video_file] = {"probe_error": error, "stages": {}}
+            continue
+        clip_count = math.ceil(video_duration / duration)
+        manifest["inputs"][video_file] = {
+            "start_clip_number": manifest["next_clip_number"],
+            "clip_count": clip_count,
+            "duration": video_duration,
+            "stages": {},
+        }
+        manifest["next_clip_number"] += clip_count
+
+# Worker: run the stages of one input that are not done yet. Returns the
+# results of the stages that finished, plus the error that stopped it, if any.
+# In single-pass mode the audio and clips stages share one ffmpeg run.
+def run_video_stages(video_path, audio_path, text_folder, output_folder, base_name, duration, entry,
+                     single_pass=False, stream_copy=True):
+    done = dict(entry["stages"])
+    start_clip_number = entry["start_clip_number"]
+    error = None
+    try:
+        if single_pass and ("audio" not in done or "clips" not in done):
+            last_clip_number = segment_video_single_pass(video_path, duration, output_folder, base_name,
+                                                         start_clip_number, audio_path, stream_copy)
+            if stream_copy and last_clip_number != start_clip_number + entry["clip_count"]:
+                # Copied cuts wait for the next keyframe, so sparse keyframes
+                # can give fewer clips than were reserved; re-encoding cuts
+                # exactly on the boundaries
+                logging.warning(f"Stream copy gave {last_clip_number - start_clip_number} clips for {video_path}, "
+                                f"expected {entry['clip_count']}; re-encoding")
+                last_clip_number = segment_video_single_pass(video_path, duration, output_folder, base_name,
+                                                             start_clip_number, audio_path, stream_copy=False)
+            if last_clip_number != start_clip_number + entry["clip_count"]:
+                raise RuntimeError(f"single-pass segmenting wrote {last_clip_number - start_clip_number} clips, "
+                                   f"expected {entry['clip_count']}")
+            video_duration = entry.get("duration") or probe_duration(video_path)
+            # A source without an audio track gets no WAV and an empty transcript
+            audio_duration = wav_duration(audio_path) if os.path.exists(audio_path) else None
+            done["audio"] = {"video_duration": video_duration, "audio_duration": audio_duration}
+            done["clips"] = {"last_clip_number": last_clip_number}
+            if audio_duration is None and "transcript" not in done:
+                text_file = os.path.join(text_folder, f"{os.path.splitext(os.path.basename(video_path))[0]}.txt")
+                open(text_file, "w", encoding="utf-8").close()
+                done["transcript"] = {"text_path": text_file, "extracted_text": ""}
+
+        if "audio" not in done:
+            video_duration, audio_duration = extract_audio_from_video(video_path, audio_path)
+            if video_duration is None:
+                raise RuntimeError("audio extraction failed")
+            done["audio"] = {"video_duration": video_duration, "audio_duration": audio_duration}
+
+        if "transcript" not in done:
+            utterances = extract_utterances_from_audio(audio_path)
+            if utterances is None:
+                # Left for the next run; the clips stage can still go ahead
+                RetryQueue().add(audio_path, "recognition request failed")
+                error = "recognition request failed"
+            else:
+                text_file = os.path.join(text_folder, f"{os.path.splitext(os.path.basename(video_path))[0]}.txt")
+                with open(text_file, "w", encoding="utf-8") as f:
+                    for utt in utterances:
+                        f.write(utt + '\n')
+                logging.info(f"Text saved to {text_file}")
+                RetryQueue().discard(audio_path)
+                log_cache_stats(default_backend().cache)
+                log_recognizer_metrics()
+                done["transcript"] = {"text_path": text_file, "extracted_text": " ".join(utterances)}
+
+        if "clips" not in done:
+            last_clip_number = split_video_fixed_duration(video_path, duration, output_folder, base_name, start_clip_number)
+            if last_clip_number != start_clip_number + entry["clip_count"]:
+                raise RuntimeError("splitting into clips failed")
+            done["clips"] = {"last_clip_number": last_clip_number}
+    except Exception as e:
+        return done, str(e)
+    return done, error
+
+# Function to append the dataset row for one fully processed input
+def append_dataset_row(csv_path, video_path, audio_path, stages):
+    dataset = get_manifest(csv_path)
+    dataset.add({
+        "clip_id": os.path.splitext(os.path.basename(video_path))[0],
+        "video_path": video_path,
+        "audio_path": audio_path,
+        "text_path": stages["transcript"]["text_path"],
+        "extracted_text": stages["transcript"]["extracted_text"],
+        "video_duration": stages["audio"]["video_duration"],
+        "audio_duration": stages["audio"]["audio_duration"]
+    })
+    # The manifest marks the row as written next, so it must be on disk first
+    dataset.flush()
+
+# Process every video in a process pool, skipping stages the manifest records
+# as finished. Only this process writes the manifest and the dataset.
+def run_batch(video_folder, audio_folder, text_folder, output_folder, csv_path, base_name,
+              manifest_path, workers=None, duration=30, single_pass=False, stream_copy=True):
+    os.makedirs(audio_folder, exist_ok=True)
+    os.makedirs(text_folder, exist_ok=True)
+    os.makedirs(output_folder, exist_ok=True)
+
+    video_files = sorted(f for f in os.listdir(video_folder) if f.endswith('.mp4'))
+    manifest = load_manifest(manifest_path)
+    assign_clip_numbers(manifest, video_folder, video_files, output_folder, base_name, duration, workers)
+    save_manifest(manifest, manifest_path)
+
+    failed = []
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        futures = {}
+        for video_file in video_files:
+            entry = manifest["inputs"][video_file]
+            if "probe_error" in entry:
+                failed.append(video_file)
+                continue
+            if all(stage in entry["stages"] for stage in STAGES):
+                logging.info(f"Skipping {video_file}: already processed")
+                continue
+            video_path = os.path.join(video_folder, video_file)
+            audio_path = os.path.join(audio_folder, f"{os.path.splitext(video_file)[0]}.wav")
+            future = pool.submit(run_video_stages, video_path, audio_path, text_folder, output_folder,
+                                 base_name, duration, entry, single_pass, stream_copy)
+            futures[future] = (video_file, video_path, audio_path)
+
+        for future in as_completed(futures):
+            video_file, video_path, audio_path = futures[future]
+            entry = manifest["inputs"][video_file]
+            try:
+                stages, error = future.result()
+            except Exception as e:
+                stages, error = entry["stages"], str(e)
+            entry["stages"] = stages
+            if error is None and "csv" not in stages:
+                append_dataset_row(csv_path, video_path, audio_path, stages)
+                stages["csv"] = {}
+            save_manifest(manifest, manifest_path)
+            if error is None:
+                logging.info(f"Finished {video_file}")
+            else:
+                failed.append(video_file)
+                logging.error(f"Failed {video_file} (done: {', '.join(stages) or 'nothing'}): {error}")
+
+    get_manifest(csv_path).close()
+    logging.info(f"Batch finished: {len(video_files) - len(failed)} of {len(video_files)} videos done")
+    return failed
+
 # Main function to process all videos in the folder
 def main():
     video_folder = '/home/dhivyadharshini/Downloads/nn'
@@ -117,27 +377,29 @@ def main():
     text_folder = 'text_extracted'
     output_folder = '/media/dhivyadharshini/DATA/project/output_videos'
     csv_path = 'dataset.csv'
+    manifest_path = 'videoclip_manifest.json'
     base_name = "video"
 
-    # Ensure the output folders exist
-    os.makedirs(audio_folder, exist_ok=True)
-    os.makedirs(text_folder, exist_ok=True)
-    os.makedirs(output_folder, exist_ok=True)
-
-    # Get the highest existing clip number in the output folder
-    start_clip_number = get_highest_clip_number(output_folder, base_name) + 1
+    parser = argparse.ArgumentParser(description="Split source videos into clips and transcribe them")
+    parser.add_argument("--workers", type=int, default=os.cpu_count(), help="number of worker processes")
+    parser.add_argument("--single-pass", action="store_true",
+                        help="split clips and extract audio in one ffmpeg pass")
+    parser.add_argument("--reencode", action="store_true",
+                        help="with --single-pass, re-encode so cuts land exactly on clip boundaries")
+    args = parser.parse_args()
 
     try:
-        for video_file in os.listdir(video_folder):
-            if video_file.endswith('.mp4'):
-                video_path = os.path.join(video_folder, video_file)
-                audio_path = os.path.join(audio_folder, f"{os.path.splitext(video_file)[0]}.wav")
-                start_clip_number = process_video(video_path, audio_path, text_folder, output_folder, csv_path, base_name, start_clip_number)
-
+        failed = run_batch(video_folder, audio_folder, text_folder, output_folder, csv_path, base_name,
+                           manifest_path, workers=args.workers, single_pass=args.single_pass,
+                           stream_copy=not args.reencode)
+        if failed:
+            logging.error(f"{len(failed)} videos failed; run again to retry them")
+            sys.exit(1)
         logging.info(f"Data successfully processed and saved to {csv_path}")
-        
     except Exception as e:
         logging.error(f"An error occurred: {e}")
+    finally:
+        report()
 
 # Run the main function
 if __name__ == "__main__":